@@ -1,16 +1,44 @@
-import json
-from matplotlib import colors
+import html
+import io
 import numpy as np
+import transcript_store
+
+# Segments formatted per write; the report is streamed to the file instead of built up as one string
+CHUNK_SEGMENTS = 2000
+LUT_SIZE = 256
+
+# The named colours the matplotlib colormaps used ("red", "orange", "yellow", "green")
+_RED, _ORANGE, _YELLOW, _GREEN = (1.0, 0.0, 0.0), (1.0, 165 / 255, 0.0), (1.0, 1.0, 0.0), (0.0, 128 / 255, 0.0)
+
+def build_color_lut(stops, size=LUT_SIZE):
+    """Hex colors for `size` evenly spaced points along a linear ramp through the RGB `stops`."""
+    stops = np.asarray(stops, dtype=np.float64)
+    x = np.linspace(0.0, 1.0, size)
+    positions = np.linspace(0.0, 1.0, len(stops))
+    rgb = np.round(np.stack([np.interp(x, positions, stops[:, c]) for c in range(3)], axis=1) * 255).astype(int)
+    return np.array([f"#{r:02x}{g:02x}{b:02x}" for r, g, b in rgb])
+
+PROB_COLOR_LUT = build_color_lut([_RED, _ORANGE, _YELLOW, _GREEN])
+CONF_COLOR_LUT = build_color_lut([_RED, _GREEN])
+
+def quantize(values, size=LUT_SIZE):
+    """LUT indices for values in [0, 1]; out-of-range values are clipped, like a matplotlib colormap does."""
+    return np.clip((np.asarray(values, dtype=np.float64) * size).astype(np.int64), 0, size - 1)
+
+def normalize(values, low, high):
+    """(values - low) / (high - low) element-wise, 0 where the range is empty."""
+    span = np.asarray(high - low, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scaled = (values - low) / span
+    return np.where(span > 0, scaled, 0.0)
 
 def load_json_data(filepath):
-    """Load JSON data from a file."""
-    with open(filepath, 'r') as file:
-        data = json.load(file)
-    return data
+    """Load a transcript from a JSON file, or from its columnar .npz copy (transcript_store.py) when there is one."""
+    return transcript_store.load_result(filepath)
 
-def map_probability_to_color(probability, color_map):
-    """Map a probability to a color using a colormap."""
-    return colors.rgb2hex(color_map(probability))
+def map_probability_to_color(probability, color_lut=PROB_COLOR_LUT):
+    """Map a probability (or an array of them) to hex colors through a precomputed LUT."""
+    return color_lut[quantize(probability)]
 
 def calculate_word_level_confidence(segment):
     """Calculate the word-level confidence (average probability) for a segment."""
@@ -18,64 +46,94 @@ def calculate_word_level_confidence(segment):
         return 0
     return np.mean([word["probability"] for word in segment["words"]])
 
-def generate_html_content(data, normalization_mode='global'):
-    """Generate HTML content with styled words and segments, including word-level confidence scores."""
-    # Setup for visualization styles
-    prob_color_map = colors.LinearSegmentedColormap.from_list("prob_colormap", ["red", "orange", "yellow", "green"])
-    conf_color_map = colors.LinearSegmentedColormap.from_list("conf_colormap", ["red", "green"])
+def calculate_confidences(segments, normalization_mode='global'):
+    """
+    Confidences and LUT indices for every (non-empty) segment and word, computed in one vectorized pass.
+
+    Segment confidence (exp(avg_logprob)) and word-level confidence (mean word probability) are always
+    normalized over the whole transcript. Word probabilities are normalized over the whole transcript
+    in 'global' mode, or within their own segment in 'local' mode.
+    """
+    if normalization_mode not in ('global', 'local'):
+        raise ValueError(f"normalization_mode must be 'global' or 'local', got {normalization_mode!r}")
+    counts = np.array([len(segment.get("words") or []) for segment in segments], dtype=np.int64)
+    probabilities = np.fromiter((word["probability"] for segment in segments for word in segment.get("words") or []),
+                                dtype=np.float64, count=int(counts.sum()))
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    owner = np.repeat(np.arange(len(segments)), counts)  # segment index of each word
+
+    seg_conf = np.exp(np.array([segment["avg_logprob"] for segment in segments], dtype=np.float64))
+    word_conf = np.divide(np.bincount(owner, weights=probabilities, minlength=len(segments)), counts,
+                          out=np.zeros(len(segments)), where=counts > 0)
+
+    seg_norm = normalize(seg_conf, seg_conf.min(), seg_conf.max()) if len(segments) else seg_conf
+    word_conf_norm = normalize(word_conf, word_conf.min(), word_conf.max()) if len(segments) else word_conf
+    if not len(probabilities):
+        prob_norm = probabilities
+    elif normalization_mode == 'global':
+        prob_norm = normalize(probabilities, probabilities.min(), probabilities.max())
+    else:
+        has_words = counts > 0
+        low, high = np.zeros(len(segments)), np.zeros(len(segments))
+        low[has_words] = np.minimum.reduceat(probabilities, offsets[:-1][has_words])
+        high[has_words] = np.maximum.reduceat(probabilities, offsets[:-1][has_words])
+        prob_norm = normalize(probabilities, low[owner], high[owner])
+
+    return {
+        "seg_conf": seg_conf, "word_conf": word_conf, "offsets": offsets,
+        "seg_color": quantize(seg_norm), "word_conf_color": quantize(word_conf_norm), "prob_color": quantize(prob_norm),
+    }
+
+def write_html_content(data, file, normalization_mode='global'):
+    """Stream the HTML report for `data` to an open text file, CHUNK_SEGMENTS segments per write."""
     background_color = "#333333"
     text_color = "#FFFFFF"
     font_family = "Arial, sans-serif"
-    
-    # Calculate and normalize segment-level and word-level confidence scores
-    segment_confidences = [np.exp(segment["avg_logprob"]) for segment in data["segments"] if segment["text"]]
-    word_confidences = [calculate_word_level_confidence(segment) for segment in data["segments"] if segment["text"]]
-    
-    min_seg_conf, max_seg_conf = min(segment_confidences), max(segment_confidences)
-    min_word_conf, max_word_conf = min(word_confidences), max(word_confidences)
-    
-    normalize = lambda x, min_x, max_x: (x - min_x) / (max_x - min_x) if max_x > min_x else 0
-    
-    html_content = f'<html><body style="background-color: {background_color}; color: {text_color}; font-family: {font_family};">'
-    for segment, seg_conf, word_conf in zip(data["segments"], segment_confidences, word_confidences):
-        if not segment["text"]:  # Skip empty segments
-            continue
-        
-        normalized_seg_conf = normalize(seg_conf, min_seg_conf, max_seg_conf)
-        normalized_word_conf = normalize(word_conf, min_word_conf, max_word_conf)
-        
-        seg_conf_color = map_probability_to_color(normalized_seg_conf, conf_color_map)
-        word_conf_color = map_probability_to_color(normalized_word_conf, conf_color_map)
-        
-        # Display both segment-level and word-level confidence scores
-        html_content += f'<p>[{segment["start"]:.2f}] <span style="background-color:{seg_conf_color};">SegConf: [{seg_conf:.2f}]</span> '
-        html_content += f'<span style="background-color:{word_conf_color};">WordConf: [{word_conf:.2f}]</span> '
-        
-        for word in segment["words"]:
-            prob = normalize(word["probability"], min_word_conf, max_word_conf)
-            color = map_probability_to_color(prob, prob_color_map)
-            html_content += f'<span style="border-bottom: 3px solid {color};">{word["word"]}</span> '
-        html_content += '</p>'
-    html_content += '</body></html>'
-    
-    return html_content
+
+    segments = [segment for segment in data["segments"] if segment["text"]]  # Skip empty segments
+    scores = calculate_confidences(segments, normalization_mode)
+    seg_colors = CONF_COLOR_LUT[scores["seg_color"]].tolist()
+    word_conf_colors = CONF_COLOR_LUT[scores["word_conf_color"]].tolist()
+    prob_colors = PROB_COLOR_LUT[scores["prob_color"]].tolist()
+    seg_confs, word_confs = scores["seg_conf"].tolist(), scores["word_conf"].tolist()
+
+    file.write(f'<html><body style="background-color: {background_color}; color: {text_color}; font-family: {font_family};">')
+    word_index = 0
+    for chunk_start in range(0, len(segments), CHUNK_SEGMENTS):
+        parts = []
+        for i in range(chunk_start, min(chunk_start + CHUNK_SEGMENTS, len(segments))):
+            segment = segments[i]
+            # Display both segment-level and word-level confidence scores
+            parts.append(f'<p>[{segment["start"]:.2f}] <span style="background-color:{seg_colors[i]};">SegConf: [{seg_confs[i]:.2f}]</span> '
+                         f'<span style="background-color:{word_conf_colors[i]};">WordConf: [{word_confs[i]:.2f}]</span> ')
+            for word in segment.get("words") or []:
+                parts.append(f'<span style="border-bottom: 3px solid {prob_colors[word_index]};">{html.escape(word["word"], quote=False)}</span> ')
+                word_index += 1
+            parts.append('</p>')
+        file.write("".join(parts))
+    file.write('</body></html>')
+
+def generate_html_content(data, normalization_mode='global'):
+    """Generate HTML content with styled words and segments, including word-level confidence scores."""
+    buffer = io.StringIO()
+    write_html_content(data, buffer, normalization_mode)
+    return buffer.getvalue()
 
 def save_html_content(html_content, output_filepath):
     """Save the generated HTML content to a file."""
     with open(output_filepath, 'w') as file:
         file.write(html_content)
 
+def save_html_report(data, output_filepath, normalization_mode='global'):
+    """Write the report straight to `output_filepath` without holding the whole page in memory."""
+    with open(output_filepath, 'w', buffering=1 << 20) as file:
+        write_html_content(data, file, normalization_mode)
+
 # Example usage
 if __name__ == "__main__":
     filepath = 'Results/results-wlarge-v3-beamtempstep2-translate/Kerstin, Lisbeth, Margareta - Björke Socken/Kerstin, Lisbeth, Margareta - Björke Socken_transcription_raw.json'
     output_filepath = filepath.replace('.json', '.html')
     normalization_mode = 'global'  # Choose 'global' or 'local' for probability normalization
     data = load_json_data(filepath)
-    html_content = generate_html_content(data, normalization_mode)
-    save_html_content(html_content, output_filepath)
+    save_html_report(data, output_filepath, normalization_mode)
     print("HTML content with confidence variation generated and saved.")
-    
-
-
-
-
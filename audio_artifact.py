@@ -0,0 +1,88 @@
+"""
+A decoded audio file shared by every stage of the pipeline.
+
+Each input is decoded once (by ffmpeg, already downmixed to mono and resampled to 16 kHz, the rate
+Whisper, pyannote and wav2vec2 all expect) into a contiguous float32 NumPy array. Transcription
+backends and the diarizer take the AudioArtifact directly; as_tensor() is a zero-copy torch view
+of the same buffer, so no temporary WAV is written and nothing is decoded twice.
+"""
+import warnings
+
+import numpy as np
+
+import audio_stream
+
+SAMPLE_RATE = audio_stream.SAMPLE_RATE
+
+
+class AudioArtifact:
+    def __init__(self, samples, sample_rate=SAMPLE_RATE, source=None, start_sec=0.0):
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self.sample_rate = sample_rate
+        self.source = source
+        # Offset of samples[0] in the source file, in seconds
+        self.start_sec = start_sec
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def as_tensor(self):
+        """Zero-copy 1-D torch.float32 view of the samples."""
+        import torch
+        with warnings.catch_warnings():
+            # Read-only buffers (ffmpeg output, memory maps) are fine: the models never write to their input
+            warnings.simplefilter("ignore", UserWarning)
+            return torch.from_numpy(self.samples)
+
+    def as_pyannote(self):
+        """In-memory input for a pyannote pipeline: a (channel, time) waveform and its sample rate."""
+        return {"waveform": self.as_tensor().unsqueeze(0), "sample_rate": self.sample_rate}
+
+    def as_hf_input(self):
+        """Input for a transformers automatic-speech-recognition pipeline."""
+        return {"raw": self.samples, "sampling_rate": self.sample_rate}
+
+    def __repr__(self):
+        return f"AudioArtifact(source={self.source!r}, duration={self.duration:.1f}s, sample_rate={self.sample_rate})"
+
+
+def decode_audio(input_file, sample_rate=SAMPLE_RATE, start_sec=None, end_sec=None):
+    """
+    Decode any audio/video file ffmpeg understands to a mono float32 array.
+
+    Blocks from the ffmpeg pipe are copied into one preallocated buffer sized from the trim window
+    and/or the probed duration, so the only full-length allocation is the result itself.
+    """
+    expected = end_sec - (start_sec or 0) if end_sec is not None else None
+    probed = audio_stream.probe_duration(input_file)
+    if probed is not None:
+        remaining = max(0.0, probed - (start_sec or 0))
+        expected = remaining if expected is None else min(expected, remaining)
+    # One second of slack for container durations that are slightly off; grow if we still run out
+    capacity = int((expected if expected is not None else 600) * sample_rate) + sample_rate
+    samples = np.empty(capacity, dtype=np.float32)
+    filled = 0
+    for block in audio_stream.iter_pcm_blocks(input_file, sample_rate, start_sec, end_sec):
+        if filled + len(block) > len(samples):
+            grown = np.empty(max(len(samples) * 3 // 2, filled + len(block)), dtype=np.float32)
+            grown[:filled] = samples[:filled]
+            samples = grown
+        samples[filled:filled + len(block)] = block
+        filled += len(block)
+    if filled < len(samples) * 0.9:
+        # Don't keep a mostly empty buffer alive behind a small view
+        return samples[:filled].copy()
+    return samples[:filled]
+
+
+def load_audio_artifact(input_file, sample_rate=SAMPLE_RATE, start_sec=None, end_sec=None):
+    samples = decode_audio(input_file, sample_rate, start_sec, end_sec)
+    return AudioArtifact(samples, sample_rate, source=input_file, start_sec=start_sec or 0.0)
+
+
+def as_model_input(audio):
+    """Whisper/stable-ts input: the zero-copy tensor for an AudioArtifact, anything else unchanged."""
+    if isinstance(audio, AudioArtifact):
+        return audio.as_tensor()
+    return audio
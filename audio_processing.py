@@ -1,11 +1,11 @@
-from pydub import AudioSegment
-from pydub.effects import normalize
-import yt_dlp
 import logging
 import configparser
-import numpy as np
-import noisereduce as nr
 import subprocess
+import numpy as np
+import audio_artifact
+import audio_stream
+import audio_store
+import noise_reduction
 
 # Load configurations
 config = configparser.ConfigParser()
@@ -13,6 +13,7 @@ config.read('config.ini')
 
 def extract_audio_from_video(input_video_file, output_audio_file):
     try:
+        import yt_dlp
         ydl_opts = {
             'format': 'bestaudio/best',
             'postprocessors': [{
@@ -31,55 +32,86 @@ def extract_audio_from_video(input_video_file, output_audio_file):
         return False
 
 def trim_audio(input_audio_file, output_audio_file, duration_minutes):
+    """
+    Write the first `duration_minutes` of the input as a 16-bit mono WAV without loading the whole file:
+    ffmpeg decodes, downmixes and resamples ([Audio] SamplingRate, default 16 kHz) into fixed-size blocks
+    that are written as they arrive. Volume normalization is a second block-wise pass over the WAV.
+    Noise reduction needs the noise profile of the whole trimmed input first, so it decodes twice.
+    """
     try:
-        # Load audio
-        audio = AudioSegment.from_file(input_audio_file)
-        trimmed_audio = audio[:duration_minutes * 60 * 1000]
+        sampling_rate = config.getint('Audio', 'SamplingRate', fallback=audio_artifact.SAMPLE_RATE)
+        end_sec = duration_minutes * 60
+        blocks = audio_stream.iter_pcm_blocks(input_audio_file, sampling_rate, end_sec=end_sec)
 
-        # Noise reduction
+        # Noise reduction: profile from the quietest frames, then chunks in parallel (see noise_reduction.py)
         if config.getboolean('Audio', 'EnableNoiseReduction'):
-            # Convert AudioSegment to numpy array
-            samples = np.array(trimmed_audio.get_array_of_samples())
-            
-            # Reduce noise
-            reduced_noise = nr.reduce_noise(samples, sr=trimmed_audio.frame_rate, prop_decrease=0.3, n_std_thresh_stationary=2.25, n_fft=512, win_length=512)
-
-            # Convert back to AudioSegment
-            reduced_noise_audio = AudioSegment(
-                data=reduced_noise.tobytes(),
-                sample_width=trimmed_audio.sample_width,
-                frame_rate=trimmed_audio.frame_rate,
-                channels=trimmed_audio.channels
-            )
-            trimmed_audio = reduced_noise_audio
+            noise = noise_reduction.noise_clip(blocks, sampling_rate)
+            blocks = noise_reduction.reduce_noise_stream(
+                audio_stream.iter_pcm_blocks(input_audio_file, sampling_rate, end_sec=end_sec), sampling_rate, noise)
 
-        # Volume normalization
-        if config.getboolean('Audio', 'EnableVolumeNormalization'):
-            trimmed_audio = normalize(trimmed_audio)
+        _, peak = audio_stream.write_wav(blocks, output_audio_file, sampling_rate)
 
-        # Convert the audio to the specified sampling rate
-        if config.has_option('Audio', 'SamplingRate'):
-            sampling_rate = config.getint('Audio', 'SamplingRate')
-            trimmed_audio = trimmed_audio.set_frame_rate(sampling_rate)
+        # Volume normalization: peak normalize with 0.1 dB headroom, as pydub.effects.normalize does
+        if config.getboolean('Audio', 'EnableVolumeNormalization') and peak > 0:
+            audio_stream.scale_wav_in_place(output_audio_file, 10 ** (-0.1 / 20) / peak)
 
-        # Convert the audio file to mono
-        if trimmed_audio.channels > 1:
-            trimmed_audio = trimmed_audio.set_channels(1)
-
-        # Export the processed audio
-        trimmed_audio.export(output_audio_file, format="wav")
-       
         return True
     except Exception as e:
         logging.error(f"Error in processing audio: {e}")
         return False
 
-def combine_audio_subtitles(audio_file, srt_file, output_file):
+def enhance_in_place(samples, sample_rate):
+    """Apply the [Audio] noise reduction and volume normalization to a writable float32 buffer."""
+    # Noise reduction
+    if config.getboolean('Audio', 'EnableNoiseReduction', fallback=False):
+        noise_reduction.reduce_noise(samples, sample_rate, out=samples)
+
+    # Volume normalization: peak normalize with 0.1 dB headroom, as pydub.effects.normalize does
+    if config.getboolean('Audio', 'EnableVolumeNormalization', fallback=True):
+        peak = float(np.max(np.abs(samples))) if len(samples) else 0.0
+        if peak > 0:
+            samples *= np.float32(10 ** (-0.1 / 20) / peak)
+
+def enhancement_settings():
+    """Settings that change the preprocessed audio (part of audio store and result cache keys)."""
+    return {
+        # Stationary gating against a whole-file noise profile; older entries used per-block non-stationary NR
+        "noise_reduction": "stationary" if config.getboolean('Audio', 'EnableNoiseReduction', fallback=False) else False,
+        "volume_normalization": config.getboolean('Audio', 'EnableVolumeNormalization', fallback=True),
+    }
+
+def preprocess_audio(input_audio_file, duration_minutes=None, start_sec=None, end_sec=None):
+    """
+    Decode the input once into a 16 kHz mono float32 AudioArtifact, trimmed to `duration_minutes`
+    (or [start_sec, end_sec)), with the [Audio] noise reduction / volume normalization applied.
+    Works on audio and video containers alike, so no separate extraction step is needed.
+    With the audio store enabled the result is a memory map of a stored .npy, and re-runs skip decoding.
+    """
+    try:
+        if duration_minutes is not None:
+            end_sec = (start_sec or 0) + duration_minutes * 60
+        if audio_store.enabled():
+            return audio_store.load_or_create(input_audio_file, enhancement_settings(), start_sec, end_sec, process=enhance_in_place)
+
+        # Streamed from ffmpeg in blocks, already trimmed, mono and 16 kHz (see audio_stream.py)
+        artifact = audio_artifact.load_audio_artifact(input_audio_file, start_sec=start_sec, end_sec=end_sec)
+        if not artifact.samples.flags.writeable:
+            artifact.samples = artifact.samples.copy()
+        enhance_in_place(artifact.samples, artifact.sample_rate)
+        return artifact
+    except Exception as e:
+        logging.error(f"Error in processing audio: {e}")
+        return None
+
+def combine_audio_subtitles(audio_file, srt_file, output_file, duration_seconds=None):
     try:
+        # Optionally cut the audio to the transcribed duration (when muxing from the original input)
+        trim = ['-t', str(duration_seconds)] if duration_seconds is not None else []
         subprocess.call([
             'ffmpeg', 
             '-i', audio_file, 
             '-i', srt_file, 
+            *trim,
             '-c:a', 'aac', 
             '-b:a', '96k', 
             '-vn', 
@@ -1,60 +1,42 @@
-import soundfile as sf
-import torchaudio
-import numpy as np
 import configparser
 import logging
 
-from pydub import AudioSegment
-import io
+import audio_artifact
+import audio_store
 
 def load_resample_trim_audio(input_audio_file):
     # load the config
     logging.info(f"Audio-Pre-Process: Loading config")
     config = configparser.ConfigParser()
     config.read('config.ini')
-    audio_preprocess = config['Audio_Preprocess']
-    start_sec = float(audio_preprocess.get('start_sec', None))
-    end_sec = float(audio_preprocess.get('end_sec', None))
-    sample_rate = int(audio_preprocess.get('SampleRate', 16000))
-    
-    
-    # Load the audio file
+    audio_preprocess = config['Audio_Preprocess'] if config.has_section('Audio_Preprocess') else {}
+    start_sec = audio_preprocess.get('start_sec', None)
+    end_sec = audio_preprocess.get('end_sec', None)
+    start_sec = float(start_sec) if start_sec else None
+    end_sec = float(end_sec) if end_sec else None
+    sample_rate = int(audio_preprocess.get('SampleRate', audio_artifact.SAMPLE_RATE))
+    if sample_rate != audio_artifact.SAMPLE_RATE:
+        # Whisper and pyannote both expect 16 kHz input
+        logging.warning(f"Audio-Pre-Process: SampleRate {sample_rate} ignored, models need {audio_artifact.SAMPLE_RATE} Hz")
+        sample_rate = audio_artifact.SAMPLE_RATE
+
+    # Decode, downmix, resample and trim in one ffmpeg pass; the result is shared by transcription and diarization
     logging.info(f"Audio-Pre-Process: Loading audio file {input_audio_file}")
     try:
-        loaded_audio = AudioSegment.from_file(input_audio_file)
-        loaded_audio_trimmed = loaded_audio[start_sec * 1000 :  end_sec * 1000]
-        loaded_audio_converted = loaded_audio_trimmed.set_frame_rate(sample_rate)
-        # Create an in-memory buffer
-        buffer = io.BytesIO()
-        # Export the audio as wav to the buffer
-        loaded_audio_converted.export(buffer, format="wav")
-        # Get the buffer content as bytes
-        wav_bytes = buffer.getvalue()
-
+        if audio_store.enabled():
+            # Memory-mapped from the preprocessed-audio store; decoded only the first time
+            loaded_audio = audio_store.load_or_create(input_audio_file, {}, start_sec, end_sec)
+        else:
+            loaded_audio = audio_artifact.load_audio_artifact(input_audio_file, sample_rate, start_sec, end_sec)
     except Exception as e:
         print(f"PreProcess Error in loading audio file: {e}")
         return None
-    
-    return wav_bytes
-
-    
-    # Convert start and end times from seconds to samples
-    #if start_sec is not None and end_sec is not None:
-    #    try:
-    #        print(f"Audio-Pre-Process: Trimming audio to {start_sec} - {end_sec} seconds")
-    #        start_sample = int(start_sec * sample_rate)
-    #        end_sample = min(int(end_sec * sample_rate), len(audio))  # Ensure end_sample does not exceed audio length
-    #    except Exception as e:
-    #        print(f"Error in converting start and end times from seconds to samples: {e}")
-    #        return None
-    
 
-    
+    return loaded_audio
 
 
 # Example usage
 #input_audio_file = 'path/to/your/audio.ogg'
-#start_sec, end_sec, sample_rate = load_audio_config()
-#audio_for_stable_ts = load_resample_trim_audio(input_audio_file, start_sec, end_sec, sample_rate)
+#audio_for_stable_ts = load_resample_trim_audio(input_audio_file)
 
-# Now, audio_for_stable_ts is ready to be used with stable-ts and contains only the desired segment
+# Now, audio_for_stable_ts is an AudioArtifact holding only the desired segment, ready for stable-ts and pyannote
@@ -0,0 +1,125 @@
+"""
+On-disk store of preprocessed audio as raw float32 .npy files.
+
+Files are keyed by the source fingerprint (utilities.file_fingerprint) and the preprocessing
+settings, so re-running diarization or transcription with different model options reuses the
+decoded, trimmed and enhanced audio instead of decoding the source again. Stages open entries with
+np.load(mmap_mode='r'): several worker processes reading the same recording share one copy through
+the page cache, and nothing is loaded until it is touched.
+
+Entries are written block by block straight from the ffmpeg pipe (see audio_stream.py), bounded by
+[AudioStore] MaxSizeMB with least-recently-used eviction.
+"""
+import configparser
+import hashlib
+import io
+import json
+import logging
+import os
+
+import numpy as np
+
+import audio_artifact
+import audio_stream
+import utilities
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Space reserved for the .npy header; np.lib.format pads a 1-D float32 header to this size
+_HEADER_BYTES = 128
+
+
+def enabled():
+    return config.getboolean('AudioStore', 'Enabled', fallback=True)
+
+
+def store_dir():
+    results_dir = config.get('Results', 'ResultsDir', fallback='Results')
+    return config.get('AudioStore', 'StoreDir', fallback=os.path.join(results_dir, '.audio_store'))
+
+
+def max_size_bytes():
+    return int(config.getfloat('AudioStore', 'MaxSizeMB', fallback=20480) * 1024 * 1024)
+
+
+def make_key(input_file, settings):
+    payload = json.dumps({"audio": utilities.file_fingerprint(input_file), "settings": settings}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+
+def entry_path(key):
+    return os.path.join(store_dir(), key[:2], f"{key}.npy")
+
+
+def open_entry(path, mode='r'):
+    """Memory-map a stored entry; refreshes its position in the LRU order."""
+    samples = np.load(path, mmap_mode=mode)
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return samples
+
+
+def write_blocks(blocks, path):
+    """
+    Write float32 blocks to a .npy file as they arrive. The header is written last, once the length
+    is known, into space reserved up front, so the data never has to be held in memory or copied.
+    Returns the number of samples written.
+    """
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(b'\0' * _HEADER_BYTES)
+        for block in blocks:
+            f.write(np.ascontiguousarray(block, dtype='<f4').tobytes())
+            count += len(block)
+        header = _npy_header(count)
+        if len(header) != _HEADER_BYTES:
+            raise ValueError(f"unexpected .npy header size {len(header)}")
+        f.seek(0)
+        f.write(header)
+    return count
+
+
+def _npy_header(count):
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, {'descr': '<f4', 'fortran_order': False, 'shape': (count,)})
+    return buffer.getvalue()
+
+
+def load_or_create(input_file, settings, start_sec=None, end_sec=None, process=None):
+    """
+    Return a memory-mapped AudioArtifact for `input_file` preprocessed with `settings`.
+
+    On a miss the source is streamed from ffmpeg into a new entry and `process(samples, sample_rate)`
+    (if given) runs once on a writable map of it to apply enhancement in place before it is stored.
+    """
+    sample_rate = audio_artifact.SAMPLE_RATE
+    key = make_key(input_file, dict(settings, start_sec=start_sec, end_sec=end_sec, sample_rate=sample_rate))
+    path = entry_path(key)
+
+    if os.path.exists(path):
+        logging.info(f"Audio store: hit for {input_file} ({path})")
+    else:
+        logging.info(f"Audio store: decoding {input_file} into {path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        build_path = f"{path}.{os.getpid()}.build"
+        try:
+            # Written to a private file first and renamed into place, so concurrent workers never see a partial entry
+            count = write_blocks(audio_stream.iter_pcm_blocks(input_file, sample_rate, start_sec, end_sec), build_path)
+            if count == 0:
+                raise ValueError(f"no audio decoded from {input_file}")
+            if process is not None:
+                samples = open_entry(build_path, mode='r+')
+                process(samples, sample_rate)
+                samples.flush()
+                del samples
+            os.replace(build_path, path)
+        finally:
+            if os.path.exists(build_path):
+                os.remove(build_path)
+        utilities.evict_least_recently_used(store_dir(), max_size_bytes(), '.npy', keep=path)
+
+    return audio_artifact.AudioArtifact(open_entry(path), sample_rate, source=input_file, start_sec=start_sec or 0.0)
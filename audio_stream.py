@@ -0,0 +1,155 @@
+"""
+Streaming ingest: decoded PCM read block by block from an ffmpeg pipe.
+
+ffmpeg does the decoding, downmixing to mono, resampling and trimming (-ss/-t), so Python only ever
+holds one block of float32 samples at a time. Consumers either fill a preallocated array
+(audio_artifact.decode_audio) or write the blocks straight to disk (write_wav), keeping peak memory
+proportional to the block size instead of to the length of the source file.
+"""
+import configparser
+import subprocess
+import wave
+
+import numpy as np
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+SAMPLE_RATE = 16000
+
+
+def block_seconds():
+    return config.getfloat('Audio', 'BlockSeconds', fallback=30.0)
+
+
+def ffmpeg_decode_command(input_file, sample_rate=SAMPLE_RATE, start_sec=None, end_sec=None, input_args=None):
+    """
+    ffmpeg command writing mono float32 PCM at `sample_rate` to stdout, trimmed to [start_sec, end_sec).
+    `input_args` are extra ffmpeg options for the input (e.g. a raw format, or -follow for a growing file).
+    """
+    # "-" reads the input from our stdin, so -nostdin only applies to files
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-threads", "0"]
+    if input_file != "-":
+        cmd.insert(1, "-nostdin")
+    if start_sec:
+        cmd += ["-ss", str(start_sec)]
+    cmd += list(input_args or []) + ["-i", input_file]
+    if end_sec is not None:
+        cmd += ["-t", str(end_sec - (start_sec or 0))]
+    cmd += ["-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "-acodec", "pcm_f32le", "-"]
+    return cmd
+
+
+def probe_duration(input_file):
+    """Container duration in seconds from ffprobe, or None if it is unknown or ffprobe is missing."""
+    try:
+        completed = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", input_file],
+            capture_output=True, text=True, check=True
+        )
+        return float(completed.stdout.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+def _read_full(stream, buffer):
+    """readinto() until `buffer` is full or the stream ends; returns the number of bytes read."""
+    view = memoryview(buffer)
+    filled = 0
+    while filled < len(buffer):
+        n = stream.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def iter_pcm_blocks(input_file, sample_rate=SAMPLE_RATE, start_sec=None, end_sec=None, seconds=None,
+                    input_args=None, stdin=None):
+    """
+    Yield mono float32 blocks of `seconds` (default [Audio] BlockSeconds) of audio; the last one may be shorter.
+
+    Each block is a fresh array, so consumers may keep or modify it. With input_file "-" ffmpeg reads
+    from `stdin` (e.g. sys.stdin.buffer).
+    """
+    block_bytes = int((seconds or block_seconds()) * sample_rate) * 4
+    process = subprocess.Popen(
+        ffmpeg_decode_command(input_file, sample_rate, start_sec, end_sec, input_args),
+        stdin=stdin if input_file == "-" else subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    finished = False
+    try:
+        while True:
+            buffer = bytearray(block_bytes)
+            n = _read_full(process.stdout, buffer)
+            n -= n % 4
+            if n:
+                yield np.frombuffer(buffer, dtype=np.float32, count=n // 4)
+            if n < block_bytes:
+                break
+        finished = True
+    finally:
+        if not finished and process.poll() is None:
+            # Consumer stopped early
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        returncode = process.wait()
+        if finished and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, "ffmpeg", stderr=stderr)
+
+
+def write_wav(blocks, output_file, sample_rate=SAMPLE_RATE):
+    """Write float32 blocks to a 16-bit mono WAV as they arrive; returns (samples written, peak |amplitude|)."""
+    total = 0
+    peak = 0.0
+    with wave.open(output_file, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        for block in blocks:
+            if len(block):
+                peak = max(peak, float(np.max(np.abs(block))))
+            wav.writeframes(float_to_int16(block).tobytes())
+            total += len(block)
+    return total, peak
+
+
+def scale_wav_in_place(wav_file, gain, block_frames=None):
+    """Multiply every sample of a 16-bit mono WAV (as written by write_wav) by `gain`, one block at a time."""
+    if gain == 1.0:
+        return
+    with wave.open(wav_file, 'rb') as wav:
+        n_frames = wav.getnframes()
+        block_frames = block_frames or int(block_seconds() * wav.getframerate())
+    with open(wav_file, 'r+b') as f:
+        offset = _data_offset(f)
+        remaining = n_frames
+        while remaining > 0:
+            count = min(block_frames, remaining)
+            f.seek(offset)
+            block = np.frombuffer(f.read(count * 2), dtype='<i2').astype(np.float32) / 32768.0
+            f.seek(offset)
+            f.write(float_to_int16(block * np.float32(gain)).tobytes())
+            offset += count * 2
+            remaining -= count
+
+
+def _data_offset(f):
+    """Byte offset of the 'data' chunk payload in a RIFF/WAVE file."""
+    f.seek(12)
+    while True:
+        chunk_id = f.read(4)
+        size = int.from_bytes(f.read(4), 'little')
+        if chunk_id == b'data':
+            return f.tell()
+        if len(chunk_id) < 4:
+            raise ValueError("no data chunk in WAV file")
+        f.seek(size + (size & 1), 1)
+
+
+def float_to_int16(samples):
+    return (np.clip(samples, -1.0, 32767 / 32768) * 32768).astype('<i2')
+
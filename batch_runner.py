@@ -0,0 +1,174 @@
+"""
+Multi-process batch mode: one file per worker process, the CPU cores split between the workers.
+
+    python main.py --workers 8
+
+With the default torch threading, every process would start one thread per core, so N workers on a
+64-core box oversubscribe the CPU N times over and small models scale badly. Each worker here gets
+cores // workers threads: the OMP/MKL/OpenBLAS environment variables are set in the parent while
+the pool starts its (spawned) workers, so they are in place before a worker imports numpy or torch,
+and torch.set_num_threads() is applied on top in the worker initializer.
+
+Files are scheduled longest first so one long recording doesn't start last and hold up the batch.
+Every file runs through exactly the same preprocess -> process -> write functions as the sequential
+pipeline; an exception only fails that file, and if a worker process dies outright the files it
+took down with it are retried once in a fresh pool.
+"""
+import configparser
+import contextlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import audio_stream
+import model_registry
+import result_cache
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def default_workers():
+    return config.getint('Pipeline', 'Workers', fallback=1)
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def thread_budget(workers, cores=None):
+    """Threads per worker so that `workers` processes together use `cores` cores."""
+    return max(1, (cores or available_cores()) // max(1, workers))
+
+
+@contextlib.contextmanager
+def worker_thread_env(threads):
+    """
+    Set the BLAS/OpenMP thread variables for worker processes started inside the block, then restore them.
+    They have to be in the environment when a spawned worker starts: it re-imports the main module
+    (and with it numpy) before the pool initializer runs, and numpy sizes its thread pool on import.
+    """
+    saved = {name: os.environ.get(name) for name in _THREAD_ENV_VARS}
+    os.environ.update({name: str(threads) for name in _THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def init_worker(threads):
+    # torch is imported lazily, so its intra-op pool can still be sized here (the BLAS variables are
+    # already set by worker_thread_env when the process starts)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _process_file(preprocess, process, write, item):
+    prepared = preprocess(item)
+    if prepared is None:
+        return False
+    result = process(item, prepared)
+    del prepared
+    if result is None:
+        return False
+    write(item, result)
+    return True
+
+
+def _run_file(preprocess, process, write, item):
+    """
+    Sequential preprocess -> process -> write of one file, in a worker process. Returns (ok, counters):
+    counters are this worker's cumulative result cache and model registry stats, merged by run_batch.
+    """
+    try:
+        ok = _process_file(preprocess, process, write, item)
+    except Exception as e:
+        logging.error(f"Batch: error processing {item}: {e}")
+        ok = False
+    counters = {"pid": os.getpid(), "cache": result_cache.stats(), "models": model_registry.registry.metrics()}
+    return ok, counters
+
+
+def longest_first(items):
+    """Order files by decreasing duration (file size when ffprobe can't tell) to avoid stragglers."""
+    def size(item):
+        duration = audio_stream.probe_duration(item)
+        if duration is not None:
+            return duration
+        try:
+            # Roughly 1 MB/min for compressed audio; only used to rank files without a known duration
+            return os.path.getsize(item) / (1024 * 1024) * 60
+        except OSError:
+            return 0.0
+    return sorted(items, key=size, reverse=True)
+
+
+def run_batch(items, preprocess, process, write, workers=None, cores=None):
+    """
+    Run preprocess(item) -> process(item, prepared) -> write(item, result) for every item across a pool
+    of `workers` processes. The functions must be picklable (module-level functions or partials of them).
+    Returns a dict mapping each item to True (written) or False (failed or dropped).
+    """
+    workers = max(1, workers or default_workers())
+    threads = thread_budget(workers, cores)
+    pending = longest_first(list(items))
+    outcome = {}
+    retried = set()
+    worker_counters = {}  # pid -> latest cumulative counters of that worker
+    wall_start = time.perf_counter()
+    logging.info(f"Batch: {len(pending)} files across {workers} worker processes, {threads} threads each")
+
+    # spawn, not fork: forking a process that may already hold torch/OpenMP thread pools is unsafe
+    context = multiprocessing.get_context("spawn")
+    while pending:
+        crashed = []
+        with worker_thread_env(threads), \
+                ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker, initargs=(threads,)) as pool:
+            futures = {pool.submit(_run_file, preprocess, process, write, item): item for item in pending}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    ok, counters = future.result()
+                    worker_counters[counters["pid"]] = counters
+                    outcome[item] = bool(ok)
+                    if not outcome[item]:
+                        logging.error(f"Batch: no results for {item}")
+                except BrokenProcessPool:
+                    crashed.append(item)
+                except Exception as e:
+                    logging.error(f"Batch: error processing {item}: {e}")
+                    outcome[item] = False
+
+        pending = []
+        for item in crashed:
+            if item in retried:
+                logging.error(f"Batch: worker process died twice while processing {item}, giving up on it")
+                outcome[item] = False
+            else:
+                retried.add(item)
+                pending.append(item)
+        if pending:
+            logging.warning(f"Batch: a worker process died, retrying {len(pending)} file(s) in a fresh pool")
+
+    failed = sum(1 for ok in outcome.values() if not ok)
+    logging.info(f"Batch: {len(outcome)} files ({failed} failed) in {time.perf_counter() - wall_start:.1f}s")
+    # Model loads and cache hits/misses happened in the workers; report them summed over all workers
+    model_registry.log_metrics(model_registry.merge_metrics(c["models"] for c in worker_counters.values()))
+    result_cache.log_report(result_cache.merge_stats(c["cache"] for c in worker_counters.values()))
+    return outcome
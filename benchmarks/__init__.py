@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for the transcription pipeline. Run from the repository root, e.g.
+
+    python -m benchmarks.bench_speaker_mapping
+"""
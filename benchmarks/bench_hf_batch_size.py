@@ -0,0 +1,64 @@
+"""
+Benchmark: CPU throughput of the Hugging Face Whisper backend across batch sizes.
+
+    python -m benchmarks.bench_hf_batch_size --audio interview.mp3 --minutes 10 --batch-sizes 1,2,4,8,16
+
+The pipeline is built once through transcription_whisper_sv.get_pipeline (as in production) and
+warmed up, then the same audio is transcribed with each batch size. Reports wall time, real-time
+factor (wall / audio seconds, lower is better) and whether the text matches the batch_size=1 run.
+Without --audio a synthetic signal is used, which is fine for timing but not for comparing text.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import audio_artifact
+import transcription_whisper_sv
+
+
+def synthetic_audio(minutes, sample_rate=audio_artifact.SAMPLE_RATE, seed=0):
+    """Amplitude-modulated harmonics plus noise, with pauses, so every window has something to decode."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(minutes * 60 * sample_rate)) / sample_rate
+    voiced = sum(np.sin(2 * np.pi * f * t) / k for k, f in enumerate((140, 280, 420, 700), start=1))
+    envelope = np.clip(np.sin(2 * np.pi * 0.25 * t), 0, None) * (1 + np.sin(2 * np.pi * 4 * t)) / 2
+    samples = 0.2 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    return audio_artifact.AudioArtifact(samples.astype(np.float32), sample_rate, source="synthetic")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="openai/whisper-tiny")
+    parser.add_argument("--audio", help="audio/video file to transcribe (default: synthetic audio)")
+    parser.add_argument("--minutes", type=float, default=5.0)
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16")
+    parser.add_argument("--chunk-length", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.audio:
+        audio = audio_artifact.load_audio_artifact(args.audio, end_sec=args.minutes * 60)
+    else:
+        audio = synthetic_audio(args.minutes)
+    print(f"{audio}, model {args.model} on CPU")
+
+    pipe = transcription_whisper_sv.get_pipeline(args.model, "cpu")
+    # Warm-up: first-call allocations and lazy initialisation are not part of the measurement
+    pipe(dict(audio_artifact.AudioArtifact(audio.samples[:audio.sample_rate * 5]).as_hf_input()), return_timestamps=True)
+
+    reference = None
+    print(f"{'batch':>5}  {'wall s':>8}  {'RTF':>6}  {'x realtime':>10}  {'segments':>8}  same text")
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        start = time.perf_counter()
+        result = pipe(dict(audio.as_hf_input()), return_timestamps=True,
+                      chunk_length_s=args.chunk_length, batch_size=batch_size)
+        wall = time.perf_counter() - start
+        segments = transcription_whisper_sv.chunks_to_segments(result.get("chunks", []), audio.duration)
+        if reference is None:
+            reference = result["text"]
+        print(f"{batch_size:>5}  {wall:>8.2f}  {wall / audio.duration:>6.3f}  {audio.duration / wall:>10.1f}  "
+              f"{len(segments):>8}  {result['text'] == reference}")
+
+
+if __name__ == "__main__":
+    main()
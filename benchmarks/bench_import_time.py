@@ -0,0 +1,66 @@
+"""
+Import-time guard for mapping/render-only runs.
+
+    python -m benchmarks.bench_import_time [--budget-ms 300] [--module main_test]
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter, reports the slowest
+imports and fails (exit code 1) if any heavy dependency is imported eagerly or the total
+import time exceeds the budget. Models and ML libraries must only load once the stage that
+needs them runs.
+"""
+import argparse
+import subprocess
+import sys
+
+# Modules that must never be imported just by importing the pipeline entry points
+HEAVY_MODULES = (
+    "torch", "torchaudio", "whisper", "stable_whisper", "pyannote", "transformers",
+    "yt_dlp", "noisereduce", "pydub", "soundfile", "matplotlib", "datasets",
+)
+
+
+def measure_imports(module):
+    """Return [(cumulative_us, self_us, name)] for every module imported by `import module`."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    imports = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative_us), int(self_us), name.strip()))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="Module to import (default: main and main_test)")
+    parser.add_argument("--budget-ms", type=float, default=300.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module or ["main", "main_test"]:
+        imports = measure_imports(module)
+        top_level = [entry for entry in imports if entry[2] == module]
+        total_ms = (top_level[-1][0] if top_level else sum(entry[1] for entry in imports)) / 1000
+        print(f"import {module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+        for cumulative_us, _, name in sorted(imports, reverse=True)[:args.top]:
+            print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+        heavy = sorted({name for _, _, name in imports if name.split(".")[0] in HEAVY_MODULES})
+        if heavy:
+            print(f"  FAIL: heavy modules imported eagerly: {', '.join(heavy)}")
+            failed = True
+        if total_ms > args.budget_ms:
+            print("  FAIL: import time over budget")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
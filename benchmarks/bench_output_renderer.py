@@ -0,0 +1,90 @@
+"""
+Benchmark: single-pass output_renderer vs. the original three separate JSON/SRT/TXT passes.
+
+    python -m benchmarks.bench_output_renderer --segments 100000
+
+Checks that json/srt/txt come out byte-identical to the original writers, then times both for
+those three formats, and the renderer for all five (json, srt, txt, vtt, html).
+"""
+import argparse
+import filecmp
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import output_renderer
+
+
+def format_time(seconds):
+    millisec = int((seconds - int(seconds)) * 1000)
+    return f"{int(seconds // 3600):02}:{int(seconds % 3600 // 60):02}:{int(seconds % 60):02},{millisec:03}"
+
+
+def format_time_simple(seconds):
+    return f"{int(seconds // 3600):02}:{int(seconds % 3600 // 60):02}:{int(seconds % 60):02}"
+
+
+def legacy_write_all(results, paths):
+    """The original main.save_results_to_file / save_results_to_srt / save_results_to_text passes."""
+    with open(paths["json"], 'w') as f:
+        json.dump(results, f, indent=4)
+    with open(paths["srt"], 'w') as f:
+        for i, result in enumerate(results, start=1):
+            start = format_time(result['start'])
+            end = format_time(result['end'])
+            speaker_number = result['speaker'].replace('SPEAKER_', '')
+            text = f"({speaker_number}) {result['text']}"
+            f.write(f"{i}\n{start} --> {end}\n{text}\n\n")
+    with open(paths["txt"], 'w') as f:
+        for result in results:
+            start_time = format_time_simple(result['start'])
+            f.write(f"[{start_time}] {result['speaker']}: {result['text']}\n")
+
+
+def make_synthetic(n_segments, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = np.cumsum(rng.uniform(0.5, 6.0, n_segments))
+    words = ["och", "det", "är", "jag", "så", "hon", "inte", "mycket", "Fårösund", "\"citat\""]
+    return [{"start": float(start), "end": float(start + rng.uniform(0.3, 5.0)),
+             "speaker": f"SPEAKER_{int(rng.integers(4)):02}",
+             "text": " " + " ".join(rng.choice(words, int(rng.integers(3, 15))))}
+            for start in starts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=100_000)
+    args = parser.parse_args()
+
+    results = make_synthetic(args.segments)
+    print(f"{len(results)} segments")
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = {name: os.path.join(tmp, f"legacy.{name}") for name in ("json", "srt", "txt")}
+        rendered = {name: os.path.join(tmp, f"rendered.{name}") for name in ("json", "srt", "txt")}
+        every = {name: os.path.join(tmp, f"all.{name}") for name in output_renderer.WRITERS}
+
+        start = time.perf_counter()
+        legacy_write_all(results, legacy)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        output_renderer.render(results, rendered)
+        rendered_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        output_renderer.render(results, every)
+        every_time = time.perf_counter() - start
+
+        for name in legacy:
+            same = filecmp.cmp(legacy[name], rendered[name], shallow=False)
+            print(f"{name}: identical to the original writer: {same}")
+        print(f"original json+srt+txt:  {legacy_time:.3f}s")
+        print(f"renderer json+srt+txt:  {rendered_time:.3f}s ({rendered_time / legacy_time:.0%} of the original)")
+        print(f"renderer all {len(every)} formats: {every_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
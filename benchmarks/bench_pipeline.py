@@ -0,0 +1,306 @@
+"""
+Benchmark: the whole pipeline, stage by stage, on deterministic synthetic recordings. CPU only, offline.
+
+    python -m benchmarks.bench_pipeline --durations 60,600,1800 --output bench.json
+    python -m benchmarks.bench_pipeline --durations 600 --compare bench.json
+
+Each recording is a WAV of several synthetic "speakers" taking turns (harmonic tones at distinct
+pitches with a syllable-rate envelope), separated by silences of varying length over a low noise
+floor. The stages are timed as the pipeline runs them:
+
+    ingest      decode the WAV into an AudioArtifact (ffmpeg when available, else the wave module)
+    preprocess  audio_processing.enhance_in_place with the current [Audio] settings
+    vad         vad.speech_intervals
+    asr         stub recognizer emitting a word-timestamped Whisper-style result over the speech
+                regions (--asr whisper-tiny uses openai-whisper "tiny" if it is installed and cached)
+    diarize     stub diarizer: dominant pitch per 100 ms frame, clustered into speakers
+    map         speaker_mapping.map_speakers_to_words
+    render      output_renderer (every format), the HTML confidence report and the .npz store
+
+For every stage: wall and CPU seconds (including child processes), real-time factor (wall / audio
+seconds, lower is better), throughput (audio seconds per wall second) and the process peak RSS so
+far. Each recording runs in a fresh process so peak RSS is per recording. Results are written as
+JSON; --compare prints the wall-time ratio against an earlier results file.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+STAGES = ["ingest", "preprocess", "vad", "asr", "diarize", "map", "render"]
+_SPEAKER_PITCHES = [110.0, 165.0, 220.0, 290.0, 370.0]
+_WORDS = [" och", " det", " är", " jag", " så", " hon", " inte", " mycket", " var", " på", " gården"]
+
+
+def synthesize(seconds, n_speakers=3, sample_rate=SAMPLE_RATE, seed=0):
+    """
+    Samples and ground-truth turns of a deterministic multi-speaker recording. Turns of 1-8 s,
+    pauses of 0.2-2 s with an occasional long silence, noise floor around -50 dBFS.
+    """
+    rng = np.random.default_rng(seed)
+    samples = (0.003 * rng.standard_normal(int(seconds * sample_rate))).astype(np.float32)
+    turns = []
+    t = 0.5
+    while t < seconds - 1:
+        duration = min(float(rng.uniform(1.0, 8.0)), seconds - t)
+        speaker = int(rng.integers(n_speakers))
+        a, b = int(t * sample_rate), int((t + duration) * sample_rate)
+        time_axis = np.arange(b - a) / sample_rate
+        f0 = _SPEAKER_PITCHES[speaker % len(_SPEAKER_PITCHES)]
+        voiced = sum(np.sin(2 * np.pi * f0 * k * time_axis) / k for k in range(1, 5))
+        # Syllable-rate envelope with a speaker-specific rate
+        envelope = 0.55 + 0.45 * np.sin(2 * np.pi * (3.5 + 0.4 * speaker) * time_axis)
+        samples[a:b] += (0.15 * voiced * envelope).astype(np.float32)
+        turns.append({"start": round(t, 3), "end": round(t + duration, 3), "speaker": f"SPEAKER_{speaker:02}"})
+        t += duration + (float(rng.uniform(5.0, 15.0)) if rng.random() < 0.05 else float(rng.uniform(0.2, 2.0)))
+    return samples, turns
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+
+
+def ingest(path):
+    """AudioArtifact of the WAV; through ffmpeg like the pipeline when it is installed."""
+    import audio_artifact
+    if shutil.which("ffmpeg"):
+        return audio_artifact.load_audio_artifact(path), "ffmpeg"
+    with wave.open(path, 'rb') as f:
+        pcm = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2')
+    return audio_artifact.AudioArtifact(pcm.astype(np.float32) / 32768, SAMPLE_RATE, source=path), "wave"
+
+
+def stub_transcribe(intervals, seed=0):
+    """Whisper-shaped result: segments of at most 8 s over the speech regions, a word every ~0.35 s."""
+    rng = np.random.default_rng(seed)
+    segments = []
+    for start, end in intervals:
+        for seg_start in np.arange(start, end, 8.0):
+            seg_end = min(seg_start + 8.0, end)
+            edges = np.linspace(seg_start, seg_end, max(1, int((seg_end - seg_start) / 0.35)) + 1)
+            words = [{"word": str(rng.choice(_WORDS)), "start": round(float(a), 2), "end": round(float(b), 2),
+                      "probability": float(np.float32(rng.uniform(0.3, 1.0)))} for a, b in zip(edges[:-1], edges[1:])]
+            segments.append({
+                "id": len(segments), "seek": int(seg_start * 100), "start": words[0]["start"], "end": words[-1]["end"],
+                "text": "".join(word["word"] for word in words), "tokens": rng.integers(50365, 51865, len(words)).tolist(),
+                "temperature": 0.0, "avg_logprob": float(-rng.uniform(0.05, 1.0)),
+                "compression_ratio": 1.4, "no_speech_prob": float(rng.uniform(0, 0.2)), "words": words,
+            })
+    return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": "sv"}
+
+
+def whisper_tiny_transcribe(audio, intervals):
+    """openai-whisper "tiny" on CPU, only if the checkpoint is already cached (no downloads)."""
+    import whisper
+    checkpoint = os.path.join(os.path.expanduser("~"), ".cache", "whisper", "tiny.pt")
+    if not os.path.exists(checkpoint):
+        raise RuntimeError(f"{checkpoint} not found; --asr whisper-tiny never downloads, use the stub")
+    model = whisper.load_model(checkpoint, device="cpu")
+    clips = [t for interval in intervals for t in interval]
+    return model.transcribe(audio.as_tensor(), word_timestamps=True, fp16=False, clip_timestamps=clips or "0")
+
+
+def stub_diarize(samples, intervals, sample_rate=SAMPLE_RATE, frame_seconds=0.1):
+    """Turns from the dominant pitch of each 100 ms frame inside the speech regions, clustered by log pitch."""
+    frame_len = int(frame_seconds * sample_rate)
+    window = np.hanning(frame_len).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_len, 1 / sample_rate)
+    band = (freqs >= 60) & (freqs <= 500)
+    times, pitches = [], []
+    for start, end in intervals:
+        a, b = int(start * sample_rate), int(end * sample_rate)
+        n_frames = (b - a) // frame_len
+        if n_frames == 0:
+            continue
+        frames = np.asarray(samples[a:a + n_frames * frame_len]).reshape(n_frames, frame_len) * window
+        spectrum = np.abs(np.fft.rfft(frames, axis=1))[:, band]
+        pitches.append(freqs[band][spectrum.argmax(axis=1)])
+        times.append(start + np.arange(n_frames) * frame_seconds)
+    if not times:
+        return []
+    times, pitches = np.concatenate(times), np.log(np.concatenate(pitches))
+
+    # 1-D clustering: split the sorted log pitches wherever they jump by more than ~2 semitones
+    order = np.argsort(pitches)
+    cluster_of_sorted = np.cumsum(np.r_[0, np.diff(pitches[order]) > 0.12])
+    clusters = np.empty(len(pitches), dtype=np.intp)
+    clusters[order] = cluster_of_sorted
+
+    # Consecutive frames of one cluster (without a time gap) make a turn
+    new_turn = np.r_[True, (clusters[1:] != clusters[:-1]) | (np.diff(times) > frame_seconds * 1.5)]
+    starts = np.flatnonzero(new_turn)
+    ends = np.r_[starts[1:], len(times)] - 1
+    return [{"start": round(float(times[a]), 3), "end": round(float(times[b] + frame_seconds), 3),
+             "speaker": f"SPEAKER_{int(clusters[a]):02}"} for a, b in zip(starts, ends)]
+
+
+def _cpu_seconds():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if platform.system() == "Darwin" else peak / 1024
+
+
+def run_recording(seconds, n_speakers, asr, seed=0):
+    """Generate one recording and time every stage on it; returns a JSON-ready dict."""
+    import audio_processing
+    import HTML_colorization
+    import output_renderer
+    import speaker_mapping
+    import transcript_store
+    import vad
+
+    stages = {}
+
+    def timed(name, func, *args, **kwargs):
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        result = func(*args, **kwargs)
+        wall, cpu = time.perf_counter() - wall, _cpu_seconds() - cpu
+        stages[name] = {"wall_seconds": round(wall, 4), "cpu_seconds": round(cpu, 4),
+                        "rtf": round(wall / seconds, 6), "x_realtime": round(seconds / wall, 1) if wall > 0 else None,
+                        "peak_rss_mb": round(_peak_rss_mb(), 1)}
+        return result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        samples, truth = synthesize(seconds, n_speakers, seed=seed)
+        wav_path = os.path.join(tmp, "synthetic.wav")
+        write_wav(wav_path, samples)
+        del samples
+
+        audio, decoder = timed("ingest", ingest, wav_path)
+        if not audio.samples.flags.writeable:
+            audio.samples = audio.samples.copy()
+        timed("preprocess", audio_processing.enhance_in_place, audio.samples, audio.sample_rate)
+        intervals = timed("vad", vad.speech_intervals, audio.samples, audio.sample_rate, **(vad.settings() or {}))
+        if asr == "whisper-tiny":
+            result = timed("asr", whisper_tiny_transcribe, audio, intervals)
+        else:
+            result = timed("asr", stub_transcribe, intervals, seed)
+        turns = timed("diarize", stub_diarize, audio.samples, intervals)
+        overlap_threshold = 0.5
+        final = timed("map", speaker_mapping.map_speakers_to_words, result["segments"], turns, overlap_threshold)
+
+        def render():
+            outputs = {name: os.path.join(tmp, f"final.{name}") for name in output_renderer.WRITERS}
+            output_renderer.render(final, outputs)
+            HTML_colorization.save_html_report(result, os.path.join(tmp, "confidence.html"))
+            transcript_store.save(result, os.path.join(tmp, "raw.npz"))
+        timed("render", render)
+
+    total_wall = sum(stage["wall_seconds"] for stage in stages.values())
+    return {
+        "audio_seconds": seconds,
+        "speakers": n_speakers,
+        "decoder": decoder,
+        "asr": asr,
+        "speech_seconds": round(sum(end - start for start, end in intervals), 2),
+        "segments": len(result["segments"]),
+        "words": sum(len(segment.get("words") or []) for segment in result["segments"]),
+        "turns": {"truth": len(truth), "diarized": len(turns)},
+        "final_segments": len(final),
+        "enhancement": audio_processing.enhancement_settings(),
+        "stages": stages,
+        "total": {"wall_seconds": round(total_wall, 4),
+                  "cpu_seconds": round(sum(stage["cpu_seconds"] for stage in stages.values()), 4), "rtf": round(total_wall / seconds, 6),
+                  "x_realtime": round(seconds / total_wall, 1) if total_wall > 0 else None,
+                  "peak_rss_mb": round(_peak_rss_mb(), 1)},
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_run(run):
+    print(f"\n{run['audio_seconds']:.0f}s audio, {run['speakers']} speakers, {run['words']} words, "
+          f"decoder={run['decoder']}, asr={run['asr']}")
+    print(f"{'stage':12}{'wall s':>10}{'cpu s':>10}{'RTF':>11}{'x realtime':>12}{'peak RSS MB':>13}")
+    for name, stage in list(run["stages"].items()) + [("total", run["total"])]:
+        print(f"{name:12}{stage['wall_seconds']:>10.3f}{stage['cpu_seconds']:>10.3f}"
+              f"{stage['rtf']:>11.5f}{stage['x_realtime'] or float('inf'):>12.1f}{stage['peak_rss_mb']:>13.1f}")
+
+
+def compare(runs, baseline_path):
+    """Print wall-time ratios (new / baseline) per stage for durations present in both files."""
+    with open(baseline_path) as f:
+        baseline = {run["audio_seconds"]: run for run in json.load(f)["runs"]}
+    for run in runs:
+        old = baseline.get(run["audio_seconds"])
+        if old is None:
+            continue
+        print(f"\nvs. {baseline_path}, {run['audio_seconds']:.0f}s audio (new / old wall time):")
+        for name in STAGES + ["total"]:
+            new_stage = run["total"] if name == "total" else run["stages"].get(name)
+            old_stage = old["total"] if name == "total" else old["stages"].get(name)
+            if new_stage and old_stage and old_stage["wall_seconds"] > 0:
+                print(f"  {name:12}{new_stage['wall_seconds'] / old_stage['wall_seconds']:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", default="60,600", help="comma-separated recording lengths in seconds")
+    parser.add_argument("--speakers", type=int, default=3)
+    parser.add_argument("--asr", choices=["stub", "whisper-tiny"], default="stub")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON results file (default: bench_pipeline_<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare wall times against")
+    parser.add_argument("--in-process", action="store_true", help="don't use a fresh process per recording")
+    args = parser.parse_args()
+
+    durations = [float(d) for d in args.durations.split(",") if d.strip()]
+    runs = []
+    for seconds in durations:
+        if args.in_process:
+            run = run_recording(seconds, args.speakers, args.asr, args.seed)
+        else:
+            # Fresh process per recording: peak RSS is that recording's, and nothing is warm from the last one
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                run = pool.submit(run_recording, seconds, args.speakers, args.asr, args.seed).result()
+        print_run(run)
+        runs.append(run)
+
+    now = datetime.datetime.now()
+    report = {
+        "benchmark": "pipeline",
+        "created": now.isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "runs": runs,
+    }
+    output = args.output or f"bench_pipeline_{now:%Y%m%d_%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {output}")
+    if args.compare:
+        compare(runs, args.compare)
+
+
+if __name__ == "__main__":
+    main()
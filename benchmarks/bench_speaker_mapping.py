@@ -0,0 +1,125 @@
+"""
+Benchmark: sorted-interval speaker mapping vs. the original O(segments x turns) loop.
+
+    python -m benchmarks.bench_speaker_mapping --segments 100000 --loop-segments 200
+
+The loop is quadratic, so by default it only runs on the first `--loop-segments` segments and
+its time is extrapolated linearly to the full corpus (it is linear in N for a fixed set of turns).
+Pass --loop-segments 0 to run the loop on everything.
+
+With --words-per-segment N the segments also get N word timestamps each and the word-level
+engine (speaker_mapping.map_speakers_to_words) is timed as well.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import speaker_mapping
+
+
+def make_synthetic(n_segments, n_speakers=4, seed=0):
+    """Transcript segments and diarization turns over the same timeline, in the speaker_diarization.py schema."""
+    rng = np.random.default_rng(seed)
+
+    seg_durations = rng.uniform(0.5, 8.0, n_segments)
+    seg_gaps = rng.uniform(0.0, 0.6, n_segments)
+    seg_starts = np.cumsum(seg_gaps + np.concatenate(([0.0], seg_durations[:-1])))
+    segments = [{"start": float(s), "end": float(s + d), "text": " ..."} for s, d in zip(seg_starts, seg_durations)]
+
+    total = float(seg_starts[-1] + seg_durations[-1])
+    turns = []
+    t = 0.0
+    while t < total:
+        duration = float(rng.uniform(0.3, 12.0))
+        speaker = int(rng.integers(n_speakers))
+        turns.append({"speaker_start": t, "speaker_end": t + duration, "speaker": f"SPEAKER_{speaker:02}"})
+        # Occasional cross-talk: the next turn starts before this one ends
+        t += duration - (float(rng.uniform(0.0, 0.8)) if rng.random() < 0.2 else 0.0)
+    return segments, turns
+
+
+def add_words(segments, words_per_segment):
+    """Evenly spaced word timestamps inside every segment."""
+    for segment in segments:
+        edges = np.linspace(segment["start"], segment["end"], words_per_segment + 1)
+        segment["words"] = [{"start": float(a), "end": float(b), "word": " ..."} for a, b in zip(edges[:-1], edges[1:])]
+
+
+def legacy_map_speakers(transcription_results, diarization_results, overlap_threshold):
+    """The original main.map_speakers_to_transcription loop, adapted to the speaker_start/speaker_end schema."""
+    mapped_results = []
+    for transcript in transcription_results:
+        transcript_start = transcript["start"]
+        transcript_end = transcript["end"]
+
+        overlaps = []
+        for speaker in diarization_results:
+            overlap_start = max(speaker["speaker_start"], transcript_start)
+            overlap_end = min(speaker["speaker_end"], transcript_end)
+            overlap_duration = max(0, overlap_end - overlap_start)
+            if overlap_duration > 0:
+                overlaps.append((speaker["speaker"], overlap_duration))
+
+        total_overlap = sum(duration for _, duration in overlaps)
+        majority_speaker = None
+        majority_overlap = 0
+        for speaker, duration in overlaps:
+            if duration / total_overlap > majority_overlap:
+                majority_speaker = speaker
+                majority_overlap = duration / total_overlap
+
+        if majority_overlap < overlap_threshold or majority_speaker is None:
+            speaker_id = "OVERLAPPED"
+        else:
+            speaker_id = majority_speaker
+        mapped_results.append({"start": transcript_start, "end": transcript_end, "speaker": speaker_id, "text": transcript["text"]})
+    return mapped_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=100_000)
+    parser.add_argument("--speakers", type=int, default=4)
+    parser.add_argument("--loop-segments", type=int, default=200)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--words-per-segment", type=int, default=0)
+    args = parser.parse_args()
+
+    segments, turns = make_synthetic(args.segments, args.speakers)
+    print(f"{len(segments)} segments, {len(turns)} diarization turns, {args.speakers} speakers")
+
+    t0 = time.perf_counter()
+    fast = speaker_mapping.map_speakers_to_transcription(segments, turns, args.threshold)
+    fast_time = time.perf_counter() - t0
+    print(f"interval engine: {fast_time:.3f}s")
+
+    n_loop = args.loop_segments or len(segments)
+    n_loop = min(n_loop, len(segments))
+    t0 = time.perf_counter()
+    slow = legacy_map_speakers(segments[:n_loop], turns, args.threshold)
+    loop_time = time.perf_counter() - t0
+    loop_estimate = loop_time * len(segments) / n_loop
+    label = "measured" if n_loop == len(segments) else f"extrapolated from {n_loop} segments"
+    print(f"original loop:   {loop_estimate:.3f}s ({label})")
+    print(f"speedup:         {loop_estimate / fast_time:.0f}x")
+
+    # The loop takes the majority per turn, the engine per speaker; they only differ when one
+    # speaker has several turns inside a segment.
+    agree = sum(a["speaker"] == b["speaker"] for a, b in zip(fast, slow))
+    print(f"label agreement on the loop subset: {agree}/{n_loop}")
+
+    if args.words_per_segment:
+        add_words(segments, args.words_per_segment)
+        t0 = time.perf_counter()
+        split = speaker_mapping.map_speakers_to_words(segments, turns, args.threshold)
+        word_time = time.perf_counter() - t0
+        n_words = len(segments) * args.words_per_segment
+        print(f"word-level engine: {word_time:.3f}s for {n_words} words ({n_words / word_time / 1e6:.2f}M words/s), "
+              f"{len(segments)} segments -> {len(split)}")
+        print(f"OVERLAPPED: {sum(r['speaker'] == 'OVERLAPPED' for r in fast)} segments at segment level, "
+              f"{sum(r['speaker'] == 'OVERLAPPED' for r in split)} after word-level splitting")
+
+
+if __name__ == "__main__":
+    main()
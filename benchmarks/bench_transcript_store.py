@@ -0,0 +1,108 @@
+"""
+Benchmark: indented JSON vs. the columnar .npz transcript store (transcript_store.py).
+
+    python -m benchmarks.bench_transcript_store --segments 5000 --words-per-segment 15
+    python -m benchmarks.bench_transcript_store --json Results/x/x_transcription_raw.json
+
+Reports file size and load time for: json.load, .npz + one column (word probabilities, what the
+HTML report needs), and .npz converted back to the full dict.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import transcript_store
+
+_WORDS = [" och", " det", " är", " jag", " så", " hon", " inte", " mycket", " var", " på", " Fårösund", " gården"]
+
+
+def make_synthetic(n_segments, words_per_segment, seed=0):
+    """A word-timestamped result shaped like whisper's model.transcribe output."""
+    rng = np.random.default_rng(seed)
+    segments = []
+    t = 0.0
+    for i in range(n_segments):
+        words = []
+        for _ in range(words_per_segment):
+            duration = float(rng.uniform(0.1, 0.6))
+            words.append({"word": str(rng.choice(_WORDS)), "start": round(t, 2), "end": round(t + duration, 2),
+                          "probability": float(np.float32(rng.random()))})
+            t += duration
+        segments.append({
+            "id": i, "seek": int(words[0]["start"] * 100), "start": words[0]["start"], "end": words[-1]["end"],
+            "text": "".join(word["word"] for word in words),
+            "tokens": rng.integers(50365, 51865, words_per_segment + 2).tolist(),
+            "temperature": 0.0, "avg_logprob": float(-rng.random()), "compression_ratio": float(rng.uniform(1, 2)),
+            "no_speech_prob": float(rng.random()), "words": words,
+        })
+    return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": "sv"}
+
+
+def best_of(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", help="existing *_transcription_raw.json to convert (default: synthetic)")
+    parser.add_argument("--segments", type=int, default=5000)
+    parser.add_argument("--words-per-segment", type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.json:
+            json_path = args.json
+            with open(json_path) as f:
+                result = json.load(f)
+        else:
+            result = make_synthetic(args.segments, args.words_per_segment)
+            json_path = os.path.join(tmp, "transcript.json")
+            with open(json_path, "w") as f:
+                json.dump(result, f, indent=4)
+        npz_path = os.path.join(tmp, "transcript.npz")
+        npz_compressed_path = os.path.join(tmp, "transcript_compressed.npz")
+        transcript_store.save(result, npz_path)
+        transcript_store.save(result, npz_compressed_path, compress=True)
+
+        n_words = sum(len(segment.get("words") or []) for segment in result["segments"])
+        print(f"{len(result['segments'])} segments, {n_words} words")
+
+        def load_json():
+            with open(json_path) as f:
+                return json.load(f)
+
+        def load_column(path):
+            with transcript_store.load(path) as transcript:
+                return transcript.column("words", "probability")
+
+        def load_dict(path):
+            with transcript_store.load(path) as transcript:
+                return transcript.to_dict()
+
+        assert load_dict(npz_path) == result, "round trip changed the transcript"
+
+        json_size = os.path.getsize(json_path)
+        json_time = best_of(load_json)
+        print(f"{'':28}{'size MB':>9}{'x smaller':>11}{'load s':>9}{'x faster':>10}")
+        print(f"{'json (indent=4), full load':28}{json_size / 1e6:>9.2f}{'':>11}{json_time:>9.3f}{'':>10}")
+        for label, path, loader in (
+            ("npz, word probabilities", npz_path, load_column),
+            ("npz, full dict", npz_path, load_dict),
+            ("npz compressed, word probs", npz_compressed_path, load_column),
+        ):
+            size = os.path.getsize(path)
+            seconds = best_of(lambda: loader(path))
+            print(f"{label:28}{size / 1e6:>9.2f}{json_size / size:>11.1f}{seconds:>9.3f}{json_time / seconds:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
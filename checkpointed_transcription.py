@@ -0,0 +1,160 @@
+"""
+Checkpointed, resumable transcription of long recordings.
+
+model.transcribe only returns once the whole file is decoded, so a container killed 100 minutes
+into a 2-hour file used to lose everything. Here the recording is decoded window by window:
+windows of about [Checkpoint] WindowMinutes, cut in pauses (sharded_transcription.plan_cuts). After
+each window its segments, in file time, are appended as one JSON line to a checkpoint file and
+fsync'ed. On restart the committed windows are read back and decoding continues at the first
+missing one. That window is prompted with the tail of the text decoded so far, which is the context
+condition_on_previous_text would have carried across the boundary.
+
+Checkpoints live under <cache dir>/checkpoints/ and are named by the transcription cache key, so a
+changed model, option or input never resumes from a stale file. A finished transcription deletes
+its checkpoint; the result itself goes to the result cache.
+
+Off by default ([Checkpoint] Enabled): windowed decoding with the prompt carry-over does not give
+exactly the same transcript as one pass over the whole file.
+"""
+import configparser
+import json
+import logging
+import math
+import os
+
+import audio_artifact
+import result_cache
+import sharded_transcription
+import vad
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Roughly what fits in Whisper's 224-token prompt
+_PROMPT_WORDS = 100
+
+
+def settings():
+    """Checkpoint settings, or None when checkpointing is off (part of the transcription cache key)."""
+    if not config.getboolean('Checkpoint', 'Enabled', fallback=False):
+        return None
+    return {"window_minutes": config.getfloat('Checkpoint', 'WindowMinutes', fallback=5.0)}
+
+
+def should_checkpoint(audio):
+    checkpoint_settings = settings()
+    return (checkpoint_settings is not None and isinstance(audio, audio_artifact.AudioArtifact)
+            and audio.duration > 2 * checkpoint_settings["window_minutes"] * 60)
+
+
+def checkpoint_path(key):
+    return os.path.join(result_cache.cache_dir(), 'checkpoints', f"{key}.jsonl")
+
+
+def load_checkpoint(path):
+    """Committed windows from a checkpoint file; a torn last line (killed mid-write) is ignored."""
+    windows = []
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    windows.append(json.loads(line))
+                except ValueError:
+                    logging.warning(f"Checkpoint: ignoring incomplete line in {path}")
+                    break
+    except IOError:
+        pass
+    return windows
+
+
+def _append(f, record):
+    f.write(json.dumps(record, separators=(',', ':'), default=str) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def prompt_context(previous_text, initial_prompt=None):
+    """Prompt carrying the tail of the text decoded so far, as condition_on_previous_text would."""
+    words = previous_text.split()[-_PROMPT_WORDS:]
+    tail = " ".join(words)
+    if initial_prompt:
+        return f"{initial_prompt} {tail}".strip()
+    return tail or None
+
+
+def transcribe_checkpointed(audio, transcribe, options, key):
+    """
+    Transcribe an AudioArtifact window by window with `transcribe(artifact, options)`, committing each
+    window to the checkpoint for `key` (the transcription cache key). Returns a whisper-style dict with
+    "text", "segments" (file time) and "language", or None if a window fails (the checkpoint is kept).
+    """
+    checkpoint_settings = settings() or {"window_minutes": 5.0}
+    window_seconds = checkpoint_settings["window_minutes"] * 60
+    sr = audio.sample_rate
+    n_windows = max(1, math.ceil(audio.duration / window_seconds))
+    bounds = [0.0] + sharded_transcription.plan_cuts(audio.samples, sr, n_windows) + [audio.duration]
+
+    path = checkpoint_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    windows = [window for window in load_checkpoint(path) if window.get("index", -1) < n_windows]
+    # Only a gap-free prefix whose boundaries match this plan can be resumed
+    committed = []
+    for i, window in enumerate(windows):
+        if window["index"] != i or abs(window["start"] - bounds[i]) > 1e-3:
+            break
+        committed.append(window)
+    if committed:
+        logging.info(f"Checkpoint: resuming {audio.source} at {committed[-1]['end']:.1f}s "
+                     f"({len(committed)}/{n_windows} windows committed)")
+
+    condition = options.get("condition_on_previous_text", True)
+    initial_prompt = options.get("initial_prompt")
+    previous_text = "".join(segment["text"] for window in committed for segment in window["segments"])
+
+    # Rewrite the file with just the valid prefix (atomically, a kill here must not lose it), then append
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        for window in committed:
+            _append(f, window)
+    os.replace(tmp_path, path)
+
+    with open(path, 'a') as f:
+        for i in range(len(committed), n_windows):
+            start, end = bounds[i], bounds[i + 1]
+            window_audio = audio_artifact.AudioArtifact(
+                audio.samples[int(start * sr):int(end * sr)], sr, source=audio.source, start_sec=audio.start_sec + start)
+            window_options = dict(options)
+            if i > 0 and condition:
+                window_options["initial_prompt"] = prompt_context(previous_text, initial_prompt)
+            result = transcribe(window_audio, window_options)
+            if hasattr(result, 'to_dict'):
+                # stable-ts WhisperResult
+                result = result.to_dict()
+            if not result:
+                logging.error(f"Checkpoint: window {i} ({start:.1f}-{end:.1f}s) of {audio.source} failed, "
+                              f"{path} kept for a resume")
+                return None
+
+            segments = [sharded_transcription.shift_segment(segment, start) for segment in result.get("segments", [])]
+            window = {"index": i, "start": start, "end": end, "language": result.get("language"), "segments": segments,
+                      "vad": result.get("vad")}
+            _append(f, window)
+            committed.append(window)
+            previous_text += "".join(segment["text"] for segment in segments)
+            logging.info(f"Checkpoint: committed {audio.source} up to {end:.1f}s ({i + 1}/{n_windows})")
+
+    segments = [segment for window in committed for segment in window["segments"]]
+    for i, segment in enumerate(segments):
+        segment["id"] = i
+    language = next((window["language"] for window in committed if window.get("language")), None)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # already cleaned up by a concurrent run of the same file
+    result = {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": language}
+    # Per-window VAD reports summed into the file-level one transcription.transcribe_audio would give
+    vad_report = vad.merge_reports(window.get("vad") for window in committed)
+    if vad_report is not None:
+        result["vad"] = vad_report
+    return result
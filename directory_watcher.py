@@ -0,0 +1,278 @@
+"""
+Watch mode: process files as they arrive in [General] InputDir, tracked in a SQLite job manifest.
+
+    python main.py --watch                      # or: python directory_watcher.py
+    python directory_watcher.py --once          # process what is new or failed, then exit
+    python directory_watcher.py --status        # counts per status and the failed files
+    python directory_watcher.py --retry-failed  # give failed files a fresh set of attempts
+
+Changes are noticed through inotify on Linux (the events only trigger a rescan, which is a single
+os.scandir pass diffed against the manifest) and by polling elsewhere or with --poll. A full rescan
+also runs every [Watch] RescanSeconds in case events were lost. A file is only picked up once its
+size and mtime have not changed for [Watch] StableSeconds, so files still being copied in are left
+alone; write them under a dot-name and rename them into place to skip the wait.
+
+Ready files run through the same preprocess -> process -> write stages as main.py. Each stage's
+outcome and wall time, the content fingerprint, attempts and errors are kept in job_manifest.py;
+a file counts as done once its final results were written in this attempt, and failed files are
+retried [Watch] RetrySeconds later, up to [Watch] MaxAttempts attempts in all. Files already done
+are never looked at again unless their size or mtime change, and then only reprocessed if their
+content actually changed.
+"""
+import argparse
+import configparser
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import sys
+import threading
+import time
+
+import instrumentation
+import job_manifest
+import staged_pipeline
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# inotify(7)
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF)
+
+
+def watch_settings():
+    return {
+        "stable_seconds": config.getfloat('Watch', 'StableSeconds', fallback=5.0),
+        "poll_seconds": config.getfloat('Watch', 'PollSeconds', fallback=2.0),
+        "rescan_seconds": config.getfloat('Watch', 'RescanSeconds', fallback=300.0),
+        "max_attempts": config.getint('Watch', 'MaxAttempts', fallback=3),
+        "retry_seconds": config.getfloat('Watch', 'RetrySeconds', fallback=60.0),
+        "batch_size": config.getint('Watch', 'BatchSize', fallback=50),
+        "use_inotify": config.getboolean('Watch', 'Inotify', fallback=True),
+    }
+
+
+class InotifyWatch:
+    """Minimal inotify on one directory via ctypes; wait() returns True if anything changed in it."""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # The events themselves aren't needed, the caller rescans; just drain the queue
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_inotify(directory):
+    """InotifyWatch on Linux, or None when it isn't available (the caller polls instead)."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return InotifyWatch(directory)
+    except (OSError, AttributeError) as e:
+        logging.warning(f"Watch: inotify unavailable for {directory} ({e}), polling instead")
+        return None
+
+
+class StageRecorder:
+    """instrumentation listener that writes each stage's outcome and wall time to the manifest."""
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event, stage, input_file, timer):
+        key = (input_file, stage, threading.get_ident())
+        if event == "start":
+            with self._lock:
+                self._started[key] = time.perf_counter()
+            return
+        with self._lock:
+            started = self._started.pop(key, None)
+        wall = time.perf_counter() - started if started is not None else None
+        self.manifest.record_stage(input_file, stage, timer.ok, wall, timer.audio_seconds)
+
+
+def _clear_stale_outputs(paths):
+    # main.transcribe_and_diarize reuses intermediate JSON files it finds; they belong to the old content
+    for key in ('transcription', 'transcription_raw', 'diarization'):
+        try:
+            os.remove(paths[key])
+        except OSError:
+            pass
+
+
+def process_files(manifest, files, preprocess, process, write, output_paths):
+    """Run `files` through the pipeline stages and record each one as done or failed in the manifest."""
+    started = {}
+    to_run = []
+    for path in files:
+        state = manifest.start(path)
+        if state is None:
+            continue
+        if state == "changed":
+            _clear_stale_outputs(output_paths(path))
+        started[path] = time.time()
+        to_run.append(path)
+    if not to_run:
+        return 0, 0
+
+    recorder = StageRecorder(manifest)
+    instrumentation.add_listener(recorder)
+    try:
+        staged_pipeline.run_pipeline(to_run, preprocess, process, write)
+    except Exception as e:
+        logging.error(f"Watch: pipeline error: {e}")
+    finally:
+        instrumentation.remove_listener(recorder)
+
+    done = failed = 0
+    for path in to_run:
+        final = output_paths(path)['final']
+        failed_stages = manifest.failed_stages(path, started[path])
+        try:
+            written = os.path.getmtime(final) >= started[path]
+        except OSError:
+            written = False
+        if written and not failed_stages:
+            manifest.finish(path)
+            done += 1
+        else:
+            reason = f"failed stages: {', '.join(failed_stages)}" if failed_stages else "no final results written"
+            manifest.fail(path, reason)
+            failed += 1
+            logging.error(f"Watch: {path} failed ({reason})")
+    return done, failed
+
+
+def scan(manifest, input_dir):
+    start = time.perf_counter()
+    found = job_manifest.scan_directory(input_dir)
+    new, changed = manifest.sync(found)
+    forgotten = manifest.forget_missing(input_dir, found)
+    if new or changed or forgotten:
+        logging.info(f"Watch: {len(found)} files in {input_dir}: {new} new, {changed} changed, {forgotten} removed "
+                     f"({time.perf_counter() - start:.2f}s)")
+    return found
+
+
+def watch(input_dir, preprocess, process, write, output_paths, once=False, poll=False, manifest=None):
+    """
+    Process new, changed and failed files in `input_dir`; keeps watching unless `once`.
+    Stage functions are main.preprocess_file, main.transcribe_and_diarize and main.write_outputs,
+    output_paths is main.construct_output_paths.
+    """
+    settings = watch_settings()
+    manifest = manifest or job_manifest.Manifest()
+    reset = manifest.reset_running()
+    if reset:
+        logging.info(f"Watch: {reset} files interrupted in an earlier run will be processed again")
+    notifier = None if (once or poll or not settings["use_inotify"]) else open_inotify(input_dir)
+    logging.info(f"Watch: {input_dir} ({'inotify' if notifier else 'polling'}), manifest {manifest.path}")
+
+    last_full_scan = 0.0
+    dirty = True
+    try:
+        while True:
+            if dirty or notifier is None or time.monotonic() - last_full_scan >= settings["rescan_seconds"]:
+                scan(manifest, input_dir)
+                last_full_scan = time.monotonic()
+                dirty = False
+
+            # With --once, failed files are retried right away instead of after RetrySeconds
+            retry_seconds = 0.0 if once else settings["retry_seconds"]
+            ready = manifest.ready(settings["stable_seconds"], settings["max_attempts"], retry_seconds,
+                                   limit=settings["batch_size"])
+            if ready:
+                instrumentation.start_run()
+                done, failed = process_files(manifest, ready, preprocess, process, write, output_paths)
+                instrumentation.export_prometheus()
+                logging.info(f"Watch: {done} done, {failed} failed; {manifest.summary()}")
+                # Files may have arrived or changed while we were busy
+                dirty = True
+                continue
+
+            if once:
+                waiting = manifest.waiting()
+                if not waiting:
+                    break
+                # Only files that aren't stable yet are left; wait for them
+                time.sleep(min(settings["poll_seconds"], settings["stable_seconds"]))
+                dirty = True
+                continue
+
+            waiting = manifest.waiting(settings["max_attempts"])
+            if notifier is None:
+                time.sleep(settings["poll_seconds"])
+            else:
+                # Wake up on events, or when a file still settling could have become stable
+                timeout = settings["poll_seconds"] if waiting else settings["rescan_seconds"]
+                dirty = notifier.wait(timeout)
+    except KeyboardInterrupt:
+        logging.info("Watch: stopped")
+    finally:
+        if notifier is not None:
+            notifier.close()
+    return manifest.summary()
+
+
+def print_status(manifest):
+    summary = manifest.summary()
+    print(", ".join(f"{status}: {count}" for status, count in sorted(summary.items())) or "manifest is empty")
+    for row in manifest.files('failed'):
+        print(f"FAILED {row['path']} (attempt {row['attempts']}): {row['error']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description="Process new and changed files in [General] InputDir as they arrive")
+    parser.add_argument('--input-dir', default=config.get('General', 'InputDir', fallback='Input_AV'))
+    parser.add_argument('--once', action='store_true', help="process pending and failed files, then exit")
+    parser.add_argument('--poll', action='store_true', help="poll instead of using inotify")
+    parser.add_argument('--status', action='store_true', help="show the manifest and exit")
+    parser.add_argument('--retry-failed', action='store_true', help="reset attempts of failed files before starting")
+    args = parser.parse_args()
+
+    manifest = job_manifest.Manifest()
+    if args.status:
+        print_status(manifest)
+        sys.exit(0)
+    if args.retry_failed:
+        logging.info(f"Watch: {manifest.retry_failed()} failed files will be retried")
+
+    import main
+    watch(args.input_dir, main.preprocess_file, main.transcribe_and_diarize, main.write_outputs,
+          main.construct_output_paths, once=args.once, poll=args.poll, manifest=manifest)
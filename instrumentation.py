@@ -0,0 +1,384 @@
+"""
+Per-stage performance metrics for every processed file.
+
+Each pipeline stage is wrapped in `with instrumentation.stage("transcribe", input_file) as s:`,
+which records wall time, CPU time (whole process including child processes such as ffmpeg, so
+stages that overlap in the staged pipeline see each other's CPU), the peak RSS while the stage ran,
+the audio seconds processed and the real-time factor (wall / audio seconds). One JSON line per
+stage, and a per-file summary line from file_done(), are appended to [Metrics] JsonlFile.
+
+peak_rss_bytes is the process RSS sampled every [Metrics] RssSampleMs while the stage runs (plus at
+its start and end), so a file's peak is the highest RSS seen during its own stages rather than the
+process's lifetime high-water mark, which is kept separately as process_peak_rss_bytes. Files that
+overlap in the staged pipeline share the process, so their peaks include each other's memory.
+Without /proc (not Linux) only the lifetime peak is available and both fields carry it.
+
+Stages: ingest (decode, trim to [General] DurationMinutes and enhancement; the trim happens inside
+the same ffmpeg decode, so it has no stage of its own), transcribe, diarize, map, render, mux.
+
+export_prometheus() aggregates this run's lines into a Prometheus text-format file
+([Metrics] PrometheusFile), written atomically so node_exporter's textfile collector can pick
+it up. The run id is shared with batch_runner worker processes through the environment, so
+their records are part of the same export.
+"""
+import configparser
+import contextlib
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import threading
+import time
+import uuid
+
+import profiling
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+_RUN_ENV = "TRANSCRIPTION_METRICS_RUN"
+_lock = threading.Lock()
+_file_stages = {}
+_listeners = []
+_run_offset = 0
+
+
+def enabled():
+    return config.getboolean('Metrics', 'Enabled', fallback=True)
+
+
+def metrics_dir():
+    results_dir = config.get('Results', 'ResultsDir', fallback='Results')
+    return config.get('Metrics', 'MetricsDir', fallback=os.path.join(results_dir, '.metrics'))
+
+
+def jsonl_path():
+    return config.get('Metrics', 'JsonlFile', fallback=os.path.join(metrics_dir(), 'stages.jsonl'))
+
+
+def prometheus_path():
+    return config.get('Metrics', 'PrometheusFile', fallback=os.path.join(metrics_dir(), 'transcription.prom'))
+
+
+def run_id():
+    """Id of the current run; set once in the parent and inherited by worker processes."""
+    if _RUN_ENV not in os.environ:
+        os.environ[_RUN_ENV] = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    return os.environ[_RUN_ENV]
+
+
+def start_run():
+    """Start a new run: later export_prometheus() calls only aggregate records from here on."""
+    global _run_offset
+    os.environ.pop(_RUN_ENV, None)
+    try:
+        _run_offset = os.path.getsize(jsonl_path())
+    except OSError:
+        _run_offset = 0
+    return run_id()
+
+
+def _cpu_seconds():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def peak_rss_bytes():
+    """Process lifetime peak RSS."""
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss_bytes():
+    """Current RSS from /proc/self/statm, or None where there is no /proc."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _RssSampler:
+    """One daemon thread raising `peak_rss` on every running StageTimer; idle when no stage runs."""
+
+    def __init__(self):
+        self._timers = set()
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, timer):
+        with self._lock:
+            self._timers.add(timer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, timer):
+        with self._lock:
+            self._timers.discard(timer)
+
+    def _run(self):
+        interval = config.getfloat('Metrics', 'RssSampleMs', fallback=50.0) / 1000
+        while True:
+            with self._lock:
+                timers = list(self._timers)
+                if not timers:
+                    self._wake.clear()
+            if not timers:
+                self._wake.wait()
+                continue
+            rss = current_rss_bytes()
+            if rss is None:
+                return
+            for timer in timers:
+                timer.sample(rss)
+            time.sleep(interval)
+
+
+_rss_sampler = _RssSampler()
+
+
+class StageTimer:
+    """Handed out by stage(); set audio_seconds or ok on it while the stage runs."""
+
+    def __init__(self, name, input_file, audio_seconds):
+        self.name = name
+        self.input_file = input_file
+        self.audio_seconds = audio_seconds
+        self.ok = True
+        self.peak_rss = None
+
+    def sample(self, rss=None):
+        rss = current_rss_bytes() if rss is None else rss
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+
+    def record(self, wall_seconds, cpu_seconds):
+        rtf = wall_seconds / self.audio_seconds if self.audio_seconds else None
+        return {
+            "type": "stage",
+            "run": run_id(),
+            "time": round(time.time(), 3),
+            "file": self.input_file,
+            "stage": self.name,
+            "ok": self.ok,
+            "wall_seconds": round(wall_seconds, 4),
+            "cpu_seconds": round(cpu_seconds, 4),
+            "peak_rss_bytes": self.peak_rss if self.peak_rss is not None else peak_rss_bytes(),
+            "process_peak_rss_bytes": peak_rss_bytes(),
+            "audio_seconds": round(self.audio_seconds, 3) if self.audio_seconds else None,
+            "rtf": round(rtf, 6) if rtf is not None else None,
+        }
+
+
+def _append(record):
+    path = jsonl_path()
+    line = json.dumps(record) + "\n"
+    with _lock:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # One write per line in append mode, so lines from worker processes don't interleave
+        with open(path, 'a') as f:
+            f.write(line)
+
+
+def add_listener(callback):
+    """Call callback(event, stage, input_file, timer) with event "start"/"end" around every stage (e.g. job progress)."""
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def _notify(event, name, input_file, timer):
+    for callback in list(_listeners):
+        try:
+            callback(event, name, input_file, timer)
+        except Exception as e:
+            logging.error(f"Metrics: stage listener failed: {e}")
+
+
+def stage(name, input_file=None, audio_seconds=None):
+    """
+    Time the body as stage `name` of `input_file`. An exception marks the stage as failed and propagates.
+    Stages selected in [Profiling] are also profiled (see profiling.py), and listeners are notified.
+    """
+    if profiling.active or _listeners:
+        return _observed_stage(name, input_file, audio_seconds)
+    return _stage(name, input_file, audio_seconds)
+
+
+@contextlib.contextmanager
+def _observed_stage(name, input_file, audio_seconds):
+    with _stage(name, input_file, audio_seconds) as timer:
+        _notify("start", name, input_file, timer)
+        try:
+            with profiling.profile(name, input_file):
+                yield timer
+        except BaseException:
+            timer.ok = False
+            raise
+        finally:
+            _notify("end", name, input_file, timer)
+
+
+@contextlib.contextmanager
+def _stage(name, input_file, audio_seconds):
+    timer = StageTimer(name, input_file, audio_seconds)
+    if not enabled():
+        yield timer
+        return
+    wall, cpu = time.perf_counter(), _cpu_seconds()
+    timer.sample()
+    _rss_sampler.add(timer)
+    try:
+        yield timer
+    except BaseException:
+        timer.ok = False
+        raise
+    finally:
+        _rss_sampler.remove(timer)
+        timer.sample()
+        try:
+            record = timer.record(time.perf_counter() - wall, _cpu_seconds() - cpu)
+            with _lock:
+                _file_stages.setdefault(input_file, []).append(record)
+            _append(record)
+        except Exception as e:
+            logging.error(f"Metrics: could not record stage {name} for {input_file}: {e}")
+
+
+def file_done(input_file, audio_seconds=None):
+    """Append the per-file summary of the stages recorded for `input_file` in this process."""
+    if not enabled():
+        return None
+    with _lock:
+        records = _file_stages.pop(input_file, [])
+    if not records:
+        return None
+    audio_seconds = audio_seconds or max((r["audio_seconds"] or 0 for r in records), default=0) or None
+    wall = sum(r["wall_seconds"] for r in records)
+    summary = {
+        "type": "file",
+        "run": run_id(),
+        "time": round(time.time(), 3),
+        "host": socket.gethostname(),
+        "file": input_file,
+        "ok": all(r["ok"] for r in records),
+        "audio_seconds": audio_seconds,
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(sum(r["cpu_seconds"] for r in records), 4),
+        "peak_rss_bytes": max(r["peak_rss_bytes"] for r in records),
+        "process_peak_rss_bytes": max(r.get("process_peak_rss_bytes", r["peak_rss_bytes"]) for r in records),
+        "rtf": round(wall / audio_seconds, 6) if audio_seconds else None,
+        "stages": {r["stage"]: r["wall_seconds"] for r in records},
+    }
+    try:
+        _append(summary)
+    except Exception as e:
+        logging.error(f"Metrics: could not record summary for {input_file}: {e}")
+    logging.info(f"Metrics: {input_file}: {wall:.1f}s wall"
+                 + (f", RTF {summary['rtf']:.3f}" if summary['rtf'] is not None else "")
+                 + ", " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in summary["stages"].items()))
+    return summary
+
+
+def run_records(run=None, offset=None):
+    """Records of one run (default: the current one) from the JSONL file."""
+    run = run or run_id()
+    records = []
+    try:
+        with open(jsonl_path(), 'r') as f:
+            f.seek(_run_offset if offset is None else offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("run") == run:
+                    records.append(record)
+    except OSError:
+        pass
+    return records
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(records):
+    """Prometheus text exposition of a run's records: per-stage counters plus file-level totals."""
+    stages = {}
+    files = [r for r in records if r["type"] == "file"]
+    for r in records:
+        if r["type"] != "stage":
+            continue
+        s = stages.setdefault(r["stage"], {"ok": 0, "error": 0, "wall": 0.0, "cpu": 0.0, "audio": 0.0, "rtf_wall": 0.0})
+        s["ok" if r["ok"] else "error"] += 1
+        s["wall"] += r["wall_seconds"]
+        s["cpu"] += r["cpu_seconds"]
+        if r["audio_seconds"]:
+            s["audio"] += r["audio_seconds"]
+            s["rtf_wall"] += r["wall_seconds"]
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    metric("transcription_stage_runs_total", "counter", "Stage executions by outcome.",
+           [({"stage": name, "status": status}, s[status]) for name, s in stages.items() for status in ("ok", "error")])
+    metric("transcription_stage_wall_seconds_total", "counter", "Wall-clock seconds spent in each stage.",
+           [({"stage": name}, round(s["wall"], 4)) for name, s in stages.items()])
+    metric("transcription_stage_cpu_seconds_total", "counter", "Process CPU seconds (incl. children) during each stage.",
+           [({"stage": name}, round(s["cpu"], 4)) for name, s in stages.items()])
+    metric("transcription_stage_audio_seconds_total", "counter", "Audio seconds processed by each stage.",
+           [({"stage": name}, round(s["audio"], 3)) for name, s in stages.items()])
+    metric("transcription_stage_real_time_factor", "gauge", "Wall seconds per audio second for each stage.",
+           [({"stage": name}, round(s["rtf_wall"] / s["audio"], 6)) for name, s in stages.items() if s["audio"]])
+    metric("transcription_files_total", "counter", "Files finished by outcome.",
+           [({"status": "ok"}, sum(f["ok"] for f in files)), ({"status": "error"}, sum(not f["ok"] for f in files))])
+    audio = sum(f["audio_seconds"] or 0 for f in files)
+    wall = sum(f["wall_seconds"] for f in files if f["audio_seconds"])
+    metric("transcription_audio_seconds_total", "counter", "Audio seconds in finished files.", [({}, round(audio, 3))])
+    if audio:
+        metric("transcription_real_time_factor", "gauge", "Summed stage wall seconds per audio second over finished files.",
+               [({}, round(wall / audio, 6))])
+    peak = max((r.get("process_peak_rss_bytes", r["peak_rss_bytes"]) for r in records), default=peak_rss_bytes())
+    metric("transcription_peak_rss_bytes", "gauge", "Highest lifetime peak resident set size of any process in the run.", [({}, peak)])
+    metric("transcription_file_peak_rss_bytes", "gauge", "Highest RSS sampled during any one file's stages.",
+           [({}, max((f["peak_rss_bytes"] for f in files), default=0))])
+    metric("transcription_last_run_timestamp_seconds", "gauge", "Unix time of this export.", [({}, round(time.time(), 3))])
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path=None):
+    """Write the current run's metrics to the Prometheus textfile (atomically); returns the path or None."""
+    if not enabled():
+        return None
+    path = path or prometheus_path()
+    try:
+        text = prometheus_text(run_records())
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        return path
+    except Exception as e:
+        logging.error(f"Metrics: could not write {path}: {e}")
+        return None
@@ -0,0 +1,220 @@
+"""
+Persistent SQLite manifest of input files and their processing state (used by directory_watcher.py).
+
+One row per input file with its size/mtime as last seen, when it last changed, a content
+fingerprint (utilities.file_fingerprint), its status (pending, running, done, failed), attempts,
+timings and the last error; plus one row per (file, stage) with the stage outcome and wall time.
+
+Change detection is a single os.scandir pass compared against one SELECT of the manifest, so
+checking a directory of 10k files is a fraction of a second. Only new, changed or failed files are
+handed out for processing. A file whose mtime changed but whose content fingerprint matches its
+last successful run is marked done again without reprocessing.
+"""
+import configparser
+import os
+import sqlite3
+import threading
+import time
+
+import utilities
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    changed_at REAL NOT NULL,
+    first_seen REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT,
+    done_hash TEXT,
+    started REAL,
+    finished REAL,
+    wall_seconds REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+CREATE TABLE IF NOT EXISTS stages (
+    path TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    wall_seconds REAL,
+    audio_seconds REAL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (path, stage)
+);
+"""
+
+
+def manifest_path():
+    results_dir = config.get('Results', 'ResultsDir', fallback='Results')
+    return config.get('Watch', 'ManifestFile', fallback=os.path.join(results_dir, '.manifest.sqlite'))
+
+
+def scan_directory(directory):
+    """{absolute path: (size, mtime_ns)} for the regular, non-hidden files directly in `directory`."""
+    found = {}
+    try:
+        with os.scandir(os.path.abspath(directory)) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        found[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue  # deleted while scanning
+    except FileNotFoundError:
+        pass
+    return found
+
+
+class Manifest:
+    """Thread-safe wrapper around the manifest database (one connection, serialized by a lock)."""
+
+    def __init__(self, path=None):
+        self.path = path or manifest_path()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def sync(self, found, now=None):
+        """
+        Record a scan result ({path: (size, mtime_ns)}): new files are added as pending, files whose
+        size or mtime changed go back to pending with a fresh change time. Returns (new, changed).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            known = {row["path"]: (row["size"], row["mtime_ns"]) for row in
+                     self._db.execute("SELECT path, size, mtime_ns FROM files")}
+            new = [(path, size, mtime, now, now) for path, (size, mtime) in found.items() if path not in known]
+            changed = [(size, mtime, now, path) for path, (size, mtime) in found.items()
+                       if path in known and known[path] != (size, mtime)]
+            if new or changed:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT INTO files (path, size, mtime_ns, changed_at, first_seen) VALUES (?, ?, ?, ?, ?)", new)
+                self._db.executemany(
+                    "UPDATE files SET size = ?, mtime_ns = ?, changed_at = ?, status = 'pending', attempts = 0, "
+                    "content_hash = NULL, error = NULL WHERE path = ? AND status != 'running'", changed)
+                self._db.execute("COMMIT")
+        return len(new), len(changed)
+
+    def ready(self, stable_seconds, max_attempts, retry_seconds=0.0, now=None, limit=None):
+        """
+        Paths to process, oldest first: pending files, and failed ones with attempts left that failed
+        at least `retry_seconds` ago, whose size and mtime have not changed for `stable_seconds` (so
+        files still being copied in are left alone).
+        """
+        now = time.time() if now is None else now
+        cutoff = now - stable_seconds
+        query = ("SELECT path FROM files WHERE (status = 'pending' OR (status = 'failed' AND attempts < ? AND finished <= ?)) "
+                 "AND changed_at <= ? AND mtime_ns <= ? ORDER BY first_seen, path")
+        params = [max_attempts, now - retry_seconds, cutoff, int(cutoff * 1e9)]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [row["path"] for row in self._db.execute(query, params)]
+
+    def waiting(self, max_attempts=None):
+        """Number of pending files (plus failed ones with attempts left, if max_attempts is given)."""
+        query = "SELECT COUNT(*) FROM files WHERE status = 'pending'"
+        params = []
+        if max_attempts is not None:
+            query += " OR (status = 'failed' AND attempts < ?)"
+            params.append(max_attempts)
+        with self._lock:
+            return self._db.execute(query, params).fetchone()[0]
+
+    def start(self, path):
+        """
+        Fingerprint `path` and mark it running. Returns "new", or "changed" when it was processed
+        before with other content, or None (marking it done again) when the content is unchanged
+        since its last successful run and it need not be processed.
+        """
+        try:
+            fingerprint = utilities.file_fingerprint(path)
+        except OSError as e:
+            self.fail(path, f"cannot read file: {e}")
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT done_hash FROM files WHERE path = ?", (path,)).fetchone()
+            previous = row["done_hash"] if row is not None else None
+            if previous == fingerprint:
+                self._db.execute("UPDATE files SET status = 'done', content_hash = ?, error = NULL WHERE path = ?",
+                                 (fingerprint, path))
+                return None
+            self._db.execute("UPDATE files SET status = 'running', content_hash = ?, attempts = attempts + 1, "
+                             "started = ?, finished = NULL, error = NULL WHERE path = ?", (fingerprint, time.time(), path))
+            return "changed" if previous else "new"
+
+    def record_stage(self, path, stage, ok, wall_seconds=None, audio_seconds=None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stages (path, stage, ok, wall_seconds, audio_seconds, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, stage, int(bool(ok)), wall_seconds, audio_seconds, time.time()))
+
+    def failed_stages(self, path, since):
+        with self._lock:
+            return [row["stage"] for row in self._db.execute(
+                "SELECT stage FROM stages WHERE path = ? AND ok = 0 AND updated >= ?", (path, since))]
+
+    def finish(self, path):
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE files SET status = 'done', done_hash = content_hash, finished = ?, "
+                             "wall_seconds = ? - started, error = NULL WHERE path = ?", (now, now, path))
+
+    def fail(self, path, error):
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE files SET status = 'failed', finished = ?, wall_seconds = ? - COALESCE(started, ?), "
+                             "error = ? WHERE path = ?", (now, now, now, str(error)[:2000], path))
+
+    def reset_running(self):
+        """Files left 'running' by a crashed or killed run become pending again."""
+        with self._lock:
+            return self._db.execute("UPDATE files SET status = 'pending' WHERE status = 'running'").rowcount
+
+    def retry_failed(self):
+        with self._lock:
+            return self._db.execute("UPDATE files SET status = 'pending', attempts = 0 WHERE status = 'failed'").rowcount
+
+    def forget_missing(self, directory, found):
+        """Drop rows of files in `directory` that are not in its latest scan (`found`)."""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            known = [row["path"] for row in self._db.execute("SELECT path FROM files")]
+            gone = [(path,) for path in known if path not in found and os.path.dirname(path) == directory]
+            if gone:
+                self._db.execute("BEGIN")
+                self._db.executemany("DELETE FROM files WHERE path = ?", gone)
+                self._db.executemany("DELETE FROM stages WHERE path = ?", gone)
+                self._db.execute("COMMIT")
+        return len(gone)
+
+    def summary(self):
+        with self._lock:
+            return {row["status"]: row["n"] for row in
+                    self._db.execute("SELECT status, COUNT(*) AS n FROM files GROUP BY status")}
+
+    def files(self, status=None):
+        query = "SELECT * FROM files" + (" WHERE status = ?" if status else "") + " ORDER BY first_seen, path"
+        with self._lock:
+            return [dict(row) for row in self._db.execute(query, (status,) if status else ())]
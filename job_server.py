@@ -0,0 +1,551 @@
+"""
+Long-running HTTP job server: models stay loaded between jobs instead of being reloaded per batch.
+
+    python job_server.py --port 8080                    # full pipeline (main.py stages)
+    python job_server.py --backend stub --port 8080     # no models, for testing the service itself
+
+Endpoints (JSON unless noted):
+
+    POST   /jobs                    {"path": "...", "priority": 0, "options": {...}}  -> 202 job
+    POST   /jobs?filename=x.mp3&priority=5   raw upload of the file as the request body -> 202 job
+    GET    /jobs                    all known jobs
+    GET    /jobs/<id>               status, current stage, progress, queue position, error
+    GET    /jobs/<id>/result        final segments and output files (409 until the job is done)
+    GET    /jobs/<id>/events        progress as a text/event-stream until the job finishes
+    DELETE /jobs/<id>               cancel a queued job
+    GET    /health                  queue sizes and loaded models
+
+Jobs wait in a priority queue (higher priority first, then submission order) and [Server]
+Concurrency jobs run at a time. With the pipeline backend decoding and writing overlap between
+jobs while the model stage (transcription + diarization) runs one job at a time, as in
+staged_pipeline.py. Jobs writing the same results directory (same file name) never run at the
+same time. Per-job "options" are merged into the Whisper transcription options.
+Progress events come from the instrumentation.stage() hooks, so they follow the real stages.
+
+Submitted paths must be inside [Server] AllowedDirs (default: [General] InputDir and the upload
+directory). The server binds to 127.0.0.1 unless told otherwise.
+"""
+import argparse
+import configparser
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import wave
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import instrumentation
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+_COPY_BYTES = 1 << 20
+
+
+def server_settings():
+    results_dir = config.get('Results', 'ResultsDir', fallback='Results')
+    upload_dir = config.get('Server', 'UploadDir', fallback=os.path.join(results_dir, '.uploads'))
+    allowed = config.get('Server', 'AllowedDirs', fallback='')
+    return {
+        "host": config.get('Server', 'Host', fallback='127.0.0.1'),
+        "port": config.getint('Server', 'Port', fallback=8080),
+        "backend": config.get('Server', 'Backend', fallback='pipeline'),
+        "concurrency": config.getint('Server', 'Concurrency', fallback=1),
+        "warm_models": config.getboolean('Server', 'WarmModels', fallback=True),
+        "upload_dir": upload_dir,
+        "allowed_dirs": [d.strip() for d in allowed.split(',') if d.strip()]
+                        or [config.get('General', 'InputDir', fallback='Input_AV'), upload_dir],
+        "max_upload_bytes": int(config.getfloat('Server', 'MaxUploadMB', fallback=4096) * 1024 * 1024),
+        "keep_jobs": config.getint('Server', 'KeepJobs', fallback=1000),
+    }
+
+
+# Backends: run(job) -> result dict, the stage names they go through, and an optional warm-up
+
+_model_lock = threading.Lock()
+_output_locks = {}
+_output_locks_guard = threading.Lock()
+PIPELINE_STAGES = ["ingest", "transcribe", "diarize", "map", "render", "mux"]
+
+
+def _output_lock(path):
+    # Results directories are named after the file's base name (main.construct_output_paths),
+    # so jobs for the same path, or the same name in another directory, would write the same files
+    key = os.path.splitext(os.path.basename(path))[0]
+    with _output_locks_guard:
+        return _output_locks.setdefault(key, threading.Lock())
+
+
+def run_pipeline_job(job):
+    """
+    main.py's stages for one file; the model stage is serialized across concurrent jobs, and jobs
+    writing the same results directory run one after the other.
+    """
+    import main
+    with _output_lock(job.path):
+        started = time.time()
+        prepared = main.preprocess_file(job.path)
+        if prepared is None:
+            raise RuntimeError(f"could not decode {job.path}")
+        paths = prepared[0]
+        with _model_lock:
+            stage_results = main.transcribe_and_diarize(job.path, prepared, job.options or None)
+        del prepared
+        main.write_outputs(job.path, stage_results)
+        # write_outputs logs its own errors; a final_results.json from an earlier run doesn't count
+        try:
+            written = os.path.getmtime(paths['final']) >= started
+        except OSError:
+            written = False
+        if not written:
+            raise RuntimeError("transcription or diarization failed, no final results were written (see the server log)")
+        with open(paths['final'], 'r') as f:
+            segments = json.load(f)
+        files = {name: paths[name] for name in ('final', 'srt', 'text', 'vtt', 'html', 'mp4', 'transcription_raw')
+                 if os.path.exists(paths[name])}
+    return {"segments": segments, "files": files}
+
+
+def warm_pipeline():
+    """Load Whisper and the diarization pipeline into the model registry before the first job."""
+    import speaker_diarization
+    import transcription
+    with _model_lock:
+        transcription.get_model()
+        speaker_diarization.get_pipeline()
+
+
+STUB_STAGES = ["ingest", "transcribe", "diarize", "map", "render"]
+
+
+def _read_audio(path):
+    """Samples of a WAV via the wave module (no ffmpeg needed), anything else through ffmpeg."""
+    import audio_artifact
+    if path.lower().endswith('.wav'):
+        with wave.open(path, 'rb') as f:
+            if f.getsampwidth() == 2 and f.getframerate() == audio_artifact.SAMPLE_RATE:
+                pcm = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').reshape(-1, f.getnchannels())
+                return audio_artifact.AudioArtifact(pcm.mean(axis=1) / 32768, source=path)
+    return audio_artifact.load_audio_artifact(path)
+
+
+def run_stub_job(job):
+    """
+    Model-free stand-in with the same stages: a segment per VAD speech region, speakers alternating
+    per region. options["delay"] sleeps that many seconds in each stage (for testing progress).
+    """
+    import output_renderer
+    import speaker_mapping
+    import vad
+    delay = float(job.options.get("delay", 0))
+    with instrumentation.stage("ingest", job.path) as timer:
+        audio = _read_audio(job.path)
+        timer.audio_seconds = audio.duration
+        time.sleep(delay)
+    with instrumentation.stage("transcribe", job.path, audio.duration):
+        intervals = vad.speech_intervals(audio.samples, audio.sample_rate, **(vad.settings() or {}))
+        segments = [{"start": round(start, 3), "end": round(end, 3), "text": f" speech {start:.1f}-{end:.1f}"}
+                    for start, end in intervals]
+        time.sleep(delay)
+    with instrumentation.stage("diarize", job.path, audio.duration):
+        turns = [{"start": s["start"], "end": s["end"], "speaker": f"SPEAKER_{i % 2:02}"} for i, s in enumerate(segments)]
+        time.sleep(delay)
+    with instrumentation.stage("map", job.path, audio.duration):
+        final = speaker_mapping.map_speakers_to_transcription(segments, turns, 0.5)
+        time.sleep(delay)
+    with instrumentation.stage("render", job.path, audio.duration):
+        output_dir = os.path.join(config.get('Results', 'ResultsDir', fallback='Results'), '.jobs', job.id)
+        files = {name: os.path.join(output_dir, f"final_results.{name}") for name in ("json", "srt", "txt")}
+        output_renderer.render(final, files)
+        time.sleep(delay)
+    return {"segments": final, "files": files}
+
+
+BACKENDS = {
+    "pipeline": (run_pipeline_job, PIPELINE_STAGES, warm_pipeline),
+    "stub": (run_stub_job, STUB_STAGES, None),
+}
+
+
+class Job:
+    def __init__(self, path, priority=0, options=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.priority = priority
+        self.options = options or {}
+        self.status = "queued"
+        self.stage = None
+        self.stages_done = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+
+    def to_dict(self, expected_stages, position=None):
+        progress = 1.0 if self.status == "done" else min(0.99, self.stages_done / max(1, len(expected_stages)))
+        return {
+            "id": self.id, "path": self.path, "priority": self.priority, "options": self.options,
+            "status": self.status, "stage": self.stage, "progress": round(progress, 3),
+            "queue_position": position, "submitted": self.submitted, "started": self.started,
+            "finished": self.finished, "error": self.error,
+        }
+
+
+class JobManager:
+    """Priority queue of jobs with a fixed number of worker threads."""
+
+    def __init__(self, backend="pipeline", concurrency=1, keep_jobs=1000):
+        self.run_job, self.stages, self.warm = BACKENDS[backend]
+        self.backend = backend
+        self.keep_jobs = keep_jobs
+        self._jobs = OrderedDict()
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._current = threading.local()
+        instrumentation.add_listener(self._on_stage)
+        self._workers = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                         for i in range(max(1, concurrency))]
+        for worker in self._workers:
+            worker.start()
+
+    def _event(self, job, event, **fields):
+        # Caller holds self._cond
+        job.events.append(dict(fields, event=event, time=round(time.time(), 3)))
+        self._cond.notify_all()
+
+    def submit(self, path, priority=0, options=None):
+        job = Job(path, priority, options)
+        with self._cond:
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (-priority, next(self._order), job.id))
+            self._event(job, "queued", priority=priority)
+            self._forget_old()
+        return job
+
+    def _forget_old(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(self._jobs) - self.keep_jobs)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def describe(self, job):
+        with self._cond:
+            position = None
+            if job.status == "queued":
+                ahead = sorted(entry for entry in self._heap if self._jobs.get(entry[2]) is not None
+                               and self._jobs[entry[2]].status == "queued")
+                position = next((i for i, entry in enumerate(ahead) if entry[2] == job.id), None)
+            return job.to_dict(self.stages, position)
+
+    def list(self):
+        with self._cond:
+            jobs = list(self._jobs.values())
+        return [self.describe(job) for job in jobs]
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return False
+            job.status = "cancelled"
+            job.finished = time.time()
+            self._event(job, "cancelled")
+            return True
+
+    def counts(self):
+        with self._cond:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed", "cancelled")}
+
+    def wait_events(self, job, start, timeout=15.0):
+        """Events of `job` from index `start` on, waiting up to `timeout` for new ones."""
+        with self._cond:
+            if len(job.events) <= start and job.finished is None:
+                self._cond.wait_for(lambda: len(job.events) > start or job.finished is not None, timeout)
+            return job.events[start:], job.finished is not None
+
+    def _on_stage(self, event, stage, input_file, timer):
+        job = getattr(self._current, "job", None)
+        if job is None:
+            return
+        with self._cond:
+            if event == "start":
+                job.stage = stage
+                self._event(job, "stage_start", stage=stage)
+            else:
+                job.stages_done += 1
+                self._event(job, "stage_end", stage=stage, ok=timer.ok)
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    job = self._jobs.get(job_id)
+                    if job is not None and job.status == "queued":
+                        job.status = "running"
+                        job.started = time.time()
+                        self._event(job, "started")
+                        return job
+                if self._closing:
+                    return None
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._current.job = job
+            try:
+                result = self.run_job(job)
+                error = None
+            except Exception as e:
+                logging.error(f"Job server: job {job.id} ({job.path}) failed: {e}")
+                result, error = None, str(e)
+            finally:
+                self._current.job = None
+            instrumentation.file_done(job.path)
+            with self._cond:
+                job.result = result
+                job.error = error
+                job.status = "failed" if error else "done"
+                job.finished = time.time()
+                self._event(job, job.status, **({"error": error} if error else {}))
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        instrumentation.remove_listener(self._on_stage)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+def _inside(path, roots):
+    real = os.path.realpath(path)
+    return any(real == os.path.realpath(root) or real.startswith(os.path.realpath(root) + os.sep) for root in roots)
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    server_version = "TranscriptionJobServer/1.0"
+    # Set on the server instance by make_server()
+    manager = None
+    settings = None
+
+    def log_message(self, format, *args):
+        logging.debug(f"Job server: {self.address_string()} {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send_json(status, {"error": message})
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        return parts, parse_qs(url.query)
+
+    def _job_or_404(self, job_id):
+        job = self.server.manager.get(job_id)
+        if job is None:
+            self._error(404, f"no job {job_id}")
+        return job
+
+    def do_GET(self):
+        parts, _ = self._route()
+        manager = self.server.manager
+        if parts == ["health"]:
+            import model_registry
+            self._send_json(200, {"status": "ok", "backend": manager.backend, "jobs": manager.counts(),
+                                  "models": model_registry.registry.metrics()})
+        elif parts == ["jobs"]:
+            self._send_json(200, {"jobs": manager.list()})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job_or_404(parts[1])
+            if job is not None:
+                self._send_json(200, manager.describe(job))
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            job = self._job_or_404(parts[1])
+            if job is None:
+                return
+            if job.status == "done":
+                self._send_json(200, dict(manager.describe(job), result=job.result))
+            elif job.status in ("failed", "cancelled"):
+                self._send_json(410, manager.describe(job))
+            else:
+                self._send_json(409, manager.describe(job))
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            job = self._job_or_404(parts[1])
+            if job is not None:
+                self._stream_events(job)
+        else:
+            self._error(404, "unknown endpoint")
+
+    def _stream_events(self, job):
+        """Server-sent events: every progress event of the job, then the connection is closed."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        sent = 0
+        try:
+            while True:
+                events, finished = self.server.manager.wait_events(job, sent)
+                for event in events:
+                    self.wfile.write(f"event: {event['event']}\ndata: {json.dumps(event)}\n\n".encode('utf-8'))
+                sent += len(events)
+                if not events:
+                    # Keeps proxies from timing out the idle connection
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+                if finished and not events:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def do_POST(self):
+        parts, query = self._route()
+        if parts != ["jobs"]:
+            self._error(404, "unknown endpoint")
+            return
+        settings = self.server.settings
+        try:
+            if self.headers.get("Content-Type", "").split(';')[0].strip() == "application/json":
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                path = request.get("path")
+                if not path:
+                    self._error(400, "'path' is required (or upload the file as the request body)")
+                    return
+                if not _inside(path, settings["allowed_dirs"]):
+                    self._error(403, f"{path} is outside the allowed directories")
+                    return
+                if not os.path.isfile(path):
+                    self._error(404, f"{path} does not exist")
+                    return
+                priority = int(request.get("priority", 0))
+                options = request.get("options") or {}
+            else:
+                path = self._receive_upload(query)
+                if path is None:
+                    return
+                priority = int(query.get("priority", ["0"])[0])
+                options = json.loads(query.get("options", ["{}"])[0])
+            if not isinstance(options, dict):
+                raise ValueError("'options' must be a JSON object")
+        except ValueError as e:
+            self._error(400, f"bad request: {e}")
+            return
+        job = self.server.manager.submit(path, priority, options)
+        self._send_json(202, self.server.manager.describe(job))
+
+    def _receive_upload(self, query):
+        """Stream the request body to the upload directory; returns the saved path or None (after an error reply)."""
+        settings = self.server.settings
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self._error(411, "uploads need a Content-Length")
+            return None
+        length = int(length)
+        if length > settings["max_upload_bytes"]:
+            self._error(413, f"upload larger than {settings['max_upload_bytes']} bytes")
+            return None
+        filename = os.path.basename(query.get("filename", ["upload"])[0])
+        filename = re.sub(r'[^\w.\- ]', '_', filename) or "upload"
+        os.makedirs(settings["upload_dir"], exist_ok=True)
+        # Unique name: outputs are placed by the file's base name (main.construct_output_paths)
+        path = os.path.join(settings["upload_dir"], f"{uuid.uuid4().hex[:8]}_{filename}")
+        remaining = length
+        with open(path, 'wb') as f:
+            while remaining > 0:
+                chunk = self.rfile.read(min(_COPY_BYTES, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            os.remove(path)
+            self._error(400, "upload ended early")
+            return None
+        return path
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            self._error(404, "unknown endpoint")
+            return
+        job = self._job_or_404(parts[1])
+        if job is None:
+            return
+        if self.server.manager.cancel(job.id):
+            self._send_json(200, self.server.manager.describe(job))
+        else:
+            self._send_json(409, dict(self.server.manager.describe(job), error="only queued jobs can be cancelled"))
+
+
+def make_server(host=None, port=None, backend=None, concurrency=None, warm=None):
+    """A ready-to-serve ThreadingHTTPServer with its JobManager attached (port 0 picks a free port)."""
+    settings = server_settings()
+    backend = backend or settings["backend"]
+    manager = JobManager(backend, concurrency or settings["concurrency"], settings["keep_jobs"])
+    server = ThreadingHTTPServer((host or settings["host"], settings["port"] if port is None else port), JobRequestHandler)
+    server.daemon_threads = True
+    server.manager = manager
+    server.settings = settings
+    if (settings["warm_models"] if warm is None else warm) and manager.warm is not None:
+        # Load the models in the background; the first job waits for them through the model lock
+        threading.Thread(target=manager.warm, name="warm-models", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', help="default [Server] Host (127.0.0.1)")
+    parser.add_argument('--port', type=int, help="default [Server] Port (8080)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), help="default [Server] Backend (pipeline)")
+    parser.add_argument('--concurrency', type=int, help="jobs running at once, default [Server] Concurrency (1)")
+    parser.add_argument('--no-warm', action='store_true', help="load models on the first job instead of at startup")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.backend, args.concurrency, warm=False if args.no_warm else None)
+    instrumentation.start_run()
+    host, port = server.server_address[:2]
+    logging.info(f"Job server: {server.manager.backend} backend listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.manager.shutdown(wait=False)
+        instrumentation.export_prometheus()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,241 @@
+"""
+Live transcription of a stream that is still being recorded.
+
+    ffmpeg -f pulse -i default -f wav - | python live_transcription.py --input - --output session.jsonl
+    python live_transcription.py --input /run/session.fifo
+    python live_transcription.py --input recording.wav --follow    # file that is still growing
+
+Audio is decoded by ffmpeg in small blocks on a reader thread (so a slow decode never blocks the
+recorder) and collected in a buffer that starts at the last finalized segment. Every
+[Live] LatencySeconds of new audio the buffer (at most [Live] MaxWindowSeconds, Whisper's own
+window) is transcribed:
+
+  - segments ending at least [Live] FinalizeMarginSeconds before the end of the buffer, except the
+    last one, are final: they are written as {"type": "final", ...} and dropped from the buffer;
+  - the rest are written as {"type": "partial", ...} and may still change with the next pass.
+
+If the buffer reaches the maximum window without a final segment, all but the last segment are
+forced final. Every line has the usual "start"/"end"/"text" segment fields in stream time, so
+load_final_segments() gives input that main.map_speakers_to_transcription and the SRT/TXT writers
+take as is. The finalized text is passed on as the prompt, much like condition_on_previous_text.
+"""
+import argparse
+import configparser
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+import audio_artifact
+import audio_stream
+import checkpointed_transcription
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+_END = object()
+
+
+def live_settings():
+    return {
+        "latency_seconds": config.getfloat('Live', 'LatencySeconds', fallback=2.0),
+        "max_window_seconds": config.getfloat('Live', 'MaxWindowSeconds', fallback=30.0),
+        "finalize_margin_seconds": config.getfloat('Live', 'FinalizeMarginSeconds', fallback=3.0),
+    }
+
+
+class LiveTranscriber:
+    """Sliding-window transcription of a growing buffer; emit(record) receives each JSONL record."""
+
+    def __init__(self, transcribe, options, emit, sample_rate=audio_artifact.SAMPLE_RATE, latency_seconds=2.0,
+                 max_window_seconds=30.0, finalize_margin_seconds=3.0):
+        self.transcribe = transcribe
+        self.options = options
+        self.emit = emit
+        self.sample_rate = sample_rate
+        self.latency_seconds = latency_seconds
+        self.max_window_seconds = max_window_seconds
+        self.finalize_margin_seconds = finalize_margin_seconds
+        self.buffer = np.empty(0, dtype=np.float32)
+        self.buffer_start = 0.0  # stream time of buffer[0]
+        self.pending_seconds = 0.0  # audio received since the last pass
+        self.final_count = 0
+        self.final_text = ""
+
+    @property
+    def buffer_end(self):
+        return self.buffer_start + len(self.buffer) / self.sample_rate
+
+    def feed(self, block):
+        self.buffer = np.concatenate((self.buffer, block))
+        self.pending_seconds += len(block) / self.sample_rate
+
+    def due(self):
+        return self.pending_seconds >= self.latency_seconds
+
+    def _drop_until(self, t):
+        cut = int(round((t - self.buffer_start) * self.sample_rate))
+        cut = min(max(cut, 0), len(self.buffer))
+        self.buffer = self.buffer[cut:]
+        self.buffer_start += cut / self.sample_rate
+
+    def update(self, end_of_stream=False):
+        """Transcribe the buffer and emit final/partial segments."""
+        self.pending_seconds = 0.0
+        if len(self.buffer) == 0:
+            return
+        window = audio_artifact.AudioArtifact(self.buffer, self.sample_rate, source="live", start_sec=self.buffer_start)
+        options = dict(self.options)
+        if self.final_text:
+            options["initial_prompt"] = checkpointed_transcription.prompt_context(self.final_text, self.options.get("initial_prompt"))
+        started = time.perf_counter()
+        result = self.transcribe(window, options)
+        elapsed = time.perf_counter() - started
+        if hasattr(result, 'to_dict'):
+            # stable-ts WhisperResult
+            result = result.to_dict()
+        if elapsed > self.latency_seconds:
+            logging.warning(f"Live: transcribing {window.duration:.1f}s took {elapsed:.1f}s, over the {self.latency_seconds:.1f}s latency target")
+
+        segments = [{"start": round(self.buffer_start + segment["start"], 3),
+                     "end": round(self.buffer_start + segment["end"], 3),
+                     "text": segment["text"]}
+                    for segment in (result or {}).get("segments", []) if segment["text"].strip()]
+
+        if end_of_stream:
+            n_final = len(segments)
+        else:
+            horizon = self.buffer_end - self.finalize_margin_seconds
+            n_final = 0
+            while n_final < len(segments) - 1 and segments[n_final]["end"] <= horizon:
+                n_final += 1
+            if n_final == 0 and self.buffer_end - self.buffer_start >= self.max_window_seconds:
+                # Window is full: force all but the last segment (or the only one) final
+                n_final = max(1, len(segments) - 1) if segments else 0
+
+        for segment in segments[:n_final]:
+            self.emit(dict(segment, type="final", id=self.final_count))
+            self.final_count += 1
+            self.final_text += segment["text"]
+        for segment in segments[n_final:]:
+            self.emit(dict(segment, type="partial"))
+
+        if n_final:
+            self._drop_until(segments[n_final - 1]["end"])
+        elif not segments and self.buffer_end - self.buffer_start >= self.max_window_seconds:
+            # Nothing said in a whole window: keep only the margin, which may hold the start of a word
+            self._drop_until(self.buffer_end - self.finalize_margin_seconds)
+        if end_of_stream:
+            self.buffer = self.buffer[:0]
+
+
+def _read_blocks(blocks, out_queue):
+    try:
+        for block in blocks:
+            out_queue.put(block)
+    except Exception as e:
+        logging.error(f"Live: error reading audio: {e}")
+    finally:
+        out_queue.put(_END)
+
+
+def run_live(input_file, transcribe, options, emit, input_args=None, block_seconds=0.5, **settings):
+    """Transcribe `input_file` ("-" for stdin, a FIFO or a growing file) until the stream ends."""
+    transcriber = LiveTranscriber(transcribe, options, emit, **dict(live_settings(), **settings))
+    blocks = audio_stream.iter_pcm_blocks(input_file, transcriber.sample_rate, seconds=block_seconds,
+                                          input_args=input_args, stdin=sys.stdin.buffer)
+    incoming = queue.Queue()
+    threading.Thread(target=_read_blocks, args=(blocks, incoming), name="live-reader", daemon=True).start()
+
+    while True:
+        block = incoming.get()
+        if block is _END:
+            break
+        transcriber.feed(block)
+        # Take everything that arrived while we were transcribing before the next pass
+        try:
+            while True:
+                block = incoming.get_nowait()
+                if block is _END:
+                    transcriber.update(end_of_stream=True)
+                    return transcriber.final_count
+                transcriber.feed(block)
+        except queue.Empty:
+            pass
+        if transcriber.due():
+            transcriber.update()
+    transcriber.update(end_of_stream=True)
+    return transcriber.final_count
+
+
+def load_final_segments(jsonl_path):
+    """Finalized segments of a live JSONL file as start/end/text dicts (a torn last line is ignored)."""
+    segments = []
+    with open(jsonl_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if record.get("type") == "final":
+                segments.append({"start": record["start"], "end": record["end"], "text": record["text"]})
+    return segments
+
+
+def _backend(name):
+    if name == "stable-ts":
+        import transcription_stablets
+        return transcription_stablets.transcribe_audio, dict(transcription_stablets.transcription_options(), verbose=None)
+    import transcription
+    # Short overlapping windows: the finalized text is passed as the prompt instead
+    return transcription.transcribe_audio, dict(transcription.transcription_options(), verbose=None,
+                                                condition_on_previous_text=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', default='-', help="'-' for stdin, a named pipe, or a file (see --follow)")
+    parser.add_argument('--output', help="JSONL output file (default stdout)")
+    parser.add_argument('--follow', action='store_true', help="keep reading a file that is still being written")
+    parser.add_argument('--idle-timeout', type=float, default=30.0, help="with --follow, stop after this many seconds without new data")
+    parser.add_argument('--input-format', help="ffmpeg format of raw input, e.g. s16le (with --input-rate/--input-channels)")
+    parser.add_argument('--input-rate', type=int)
+    parser.add_argument('--input-channels', type=int)
+    parser.add_argument('--backend', choices=['whisper', 'stable-ts'], default='whisper')
+    parser.add_argument('--latency', type=float, help="seconds of new audio between passes (default [Live] LatencySeconds)")
+    args = parser.parse_args()
+
+    input_args = []
+    if args.input_format:
+        input_args += ['-f', args.input_format]
+    if args.input_rate:
+        input_args += ['-ar', str(args.input_rate)]
+    if args.input_channels:
+        input_args += ['-ac', str(args.input_channels)]
+    if args.follow:
+        input_args += ['-follow', '1', '-rw_timeout', str(int(args.idle_timeout * 1e6))]
+
+    out = open(args.output, 'a') if args.output else sys.stdout
+
+    def emit(record):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    settings = {"latency_seconds": args.latency} if args.latency else {}
+    transcribe, options = _backend(args.backend)
+    try:
+        count = run_live(args.input, transcribe, options, emit, input_args, **settings)
+        logging.info(f"Live: stream ended, {count} final segments")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    main()
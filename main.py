@@ -1,7 +1,22 @@
 import audio_processing
 import speaker_diarization
 import transcription
-import transcription_whisper_sv
+import speaker_mapping
+import model_registry
+import staged_pipeline
+import result_cache
+import audio_artifact
+import batch_runner
+import vad
+import sharded_transcription
+import checkpointed_transcription
+import transcript_store
+import output_renderer
+import instrumentation
+import profiling
+import directory_watcher
+import results_index
+import argparse
 import logging
 import configparser
 import os
@@ -38,74 +53,37 @@ def load_results_from_file(file_path):
 def file_exists(file_path):
     return os.path.exists(file_path)
 
-def map_speakers_to_transcription(transcription_results, diarization_results, overlap_threshold):
-    mapped_results = []
-
-    for transcript in transcription_results:
-        transcript_start = transcript["start"]
-        transcript_end = transcript["end"]
-        transcript_duration = transcript_end - transcript_start
-
-        # Find overlapping diarization segments and calculate overlap duration
-        overlaps = []
-        for speaker in diarization_results:
-            overlap_start = max(speaker["start"], transcript_start)
-            overlap_end = min(speaker["end"], transcript_end)
-            overlap_duration = max(0, overlap_end - overlap_start)
-            if overlap_duration > 0:
-                overlaps.append((speaker["speaker"], overlap_duration))
-
-        # Calculate total overlap duration to find the majority speaker
-        total_overlap = sum(duration for _, duration in overlaps)
-
-        # Determine the speaker based on the majority overlap
-        majority_speaker = None
-        majority_overlap = 0
-        for speaker, duration in overlaps:
-            if duration / total_overlap > majority_overlap:
-                majority_speaker = speaker
-                majority_overlap = duration / total_overlap
-
-        # Check if the majority overlap meets the threshold
-        if majority_overlap < overlap_threshold or majority_speaker is None:
-            speaker_id = "OVERLAPPED"
-        else:
-            speaker_id = majority_speaker
-
-        mapped_results.append({
-            "start": transcript_start,
-            "end": transcript_end,
-            "speaker": speaker_id,
-            "text": transcript["text"]
-        })
+def word_level_speakers():
+    """[Diarization] WordLevelSpeakers: attribute speakers per word and split segments at speaker changes."""
+    return config.getboolean('Diarization', 'WordLevelSpeakers', fallback=True)
 
-    return mapped_results
+def map_speakers_to_transcription(transcription_results, diarization_results, overlap_threshold):
+    # Sorted-interval engine, see speaker_mapping.py (accepts start/end and speaker_start/speaker_end turns)
+    if word_level_speakers():
+        # Segments without word timestamps fall back to one speaker per segment
+        return speaker_mapping.map_speakers_to_words(transcription_results, diarization_results, overlap_threshold)
+    return speaker_mapping.map_speakers_to_transcription(transcription_results, diarization_results, overlap_threshold)
 
 def save_results_to_srt(results, srt_file_path):
-    os.makedirs(os.path.dirname(srt_file_path), exist_ok=True)  # Ensure the directory exists
     try:
-        with open(srt_file_path, 'w') as f:
-            for i, result in enumerate(results, start=1):
-                start = format_time(result['start'])
-                end = format_time(result['end'])
-                speaker_number = result['speaker'].replace('SPEAKER_', '')  # Remove 'SPEAKER_' prefix
-                text = f"({speaker_number}) {result['text']}"  # Include speaker number in parentheses
-                f.write(f"{i}\n{start} --> {end}\n{text}\n\n")
+        output_renderer.render(results, {'srt': srt_file_path})
     except IOError as e:
         logging.error(f"Failed to save SRT to {srt_file_path}: {e}")
 
 def save_results_to_text(results, text_file_path):
-    os.makedirs(os.path.dirname(text_file_path), exist_ok=True)  # Ensure the directory exists
     try:
-        with open(text_file_path, 'w') as f:
-            for result in results:
-                # Format start time as [HH:MM:SS]
-                start_time = format_time_simple(result['start'])
-                # Include speaker label and text, minimize timestamp usage
-                f.write(f"[{start_time}] {result['speaker']}: {result['text']}\n")
+        # [HH:MM:SS] SPEAKER: text per line
+        output_renderer.render(results, {'txt': text_file_path})
     except IOError as e:
         logging.error(f"Failed to save human-readable text to {text_file_path}: {e}")
 
+def output_formats():
+    """[Results] OutputFormats: which of output_renderer's formats write_outputs produces."""
+    formats = [name.strip() for name in config.get('Results', 'OutputFormats', fallback='json,srt,txt').split(',') if name.strip()]
+    if 'srt' not in formats:
+        formats.append('srt')  # needed for the MP4 subtitles
+    return formats
+
 
 def format_time(seconds):
     """Convert seconds to SRT time format."""
@@ -128,105 +106,219 @@ def construct_output_paths(input_file):
         'final': os.path.join(results_dir, f"{base_name}_final_results.json"),
         'srt': os.path.join(results_dir, f"{base_name}_final_results.srt"),  
         'text': os.path.join(results_dir, f"{base_name}_final_results.txt"),
+        'vtt': os.path.join(results_dir, f"{base_name}_final_results.vtt"),
+        'html': os.path.join(results_dir, f"{base_name}_final_results.html"),
         'mp4' : os.path.join(results_dir, f"{base_name}_final_results.mp4")  
     }
 
 import sys  # Make sure this import is at the top of your script
 
-def main(input_dir):
-    # Iterate over audio files in the specified input directory
-    logging.info(f"Processing audio in directory {input_dir}")
-    logging.info(f"loading: {input_file}")
-
-    for input_file in glob.glob(os.path.join(input_dir, '*')):
-      
-
-        # Ensure 'paths' is defined outside of any conditional blocks
-        paths = construct_output_paths(input_file)
-
-        # Proceed with ensuring the directory exists
-        os.makedirs(os.path.dirname(paths['audio']), exist_ok=True)
-
-        try:
-            logging.info(f"About to try processing the file")
-            # Audio processing and transcription logic
-            if input_file.endswith(('.mp4', '.mkv', '.avi')):
-                audio_processing.extract_audio_from_video(input_file, paths['audio'])
-            audio_processing.trim_audio(input_file, paths['audio'], config.getint('General', 'DurationMinutes'))
-
-
-            print("Step 2: Transcription")
-            if not file_exists(paths['transcription']):
-                try:
-                    transcription_results = transcription.transcribe_audio(paths['audio'])
-                    save_results_to_file(transcription_results, paths['transcription_raw'])
-                    
-                    # Extract and format transcription results
-                    transcription_segments = []
-                    for segment in transcription_results["segments"]:
-                        transcription_segments.append({
-                            "start": segment["start"],
-                            "end": segment["end"],
-                            "text": segment["text"]
-                        })
-                    transcription_results = transcription_segments
-                    save_results_to_file(transcription_segments, paths['transcription'])
-                except Exception as e:
-                    logging.error(f"Error during transcription: {e}")                 
-
-            print("Step 3: Speaker Diarization")
-            if not file_exists(paths['diarization']):
-                try:
-                    # Use None as a fallback if they are not specified or not integers
-                    num_speakers = config.getint('Diarization', 'NumSpeakers', fallback=None)
-                    min_speakers = config.getint('Diarization', 'MinSpeakers', fallback=None)
-                    max_speakers = config.getint('Diarization', 'MaxSpeakers', fallback=None) 
+def preprocessing_options():
+    """Settings that change the preprocessed audio; part of every result cache key."""
+    return {
+        "duration_minutes": config.getint('General', 'DurationMinutes'),
+        "audio": audio_processing.enhancement_settings(),
+        "decoder": f"ffmpeg-mono-f32-{audio_artifact.SAMPLE_RATE}",
+    }
 
+def preprocess_file(input_file):
+    """Decode stage (prefetch pool): decode and trim the audio once into a 16 kHz AudioArtifact."""
+    # Ensure 'paths' is defined outside of any conditional blocks
+    paths = construct_output_paths(input_file)
+
+    # Proceed with ensuring the directory exists
+    os.makedirs(os.path.dirname(paths['audio']), exist_ok=True)
+
+    logging.info(f"Step 1: Preprocessing {input_file}")
+    # ffmpeg decodes video containers directly, no separate audio extraction needed
+    # "ingest" covers decode, trim to DurationMinutes and enhancement: the trim is part of the same ffmpeg decode
+    with instrumentation.stage("ingest", input_file) as timer:
+        audio = audio_processing.preprocess_audio(input_file, config.getint('General', 'DurationMinutes'))
+        timer.ok = audio is not None
+        if audio is not None:
+            timer.audio_seconds = audio.duration
+    if audio is None:
+        instrumentation.file_done(input_file)
+        return None
+    return paths, audio
+
+def transcribe_and_diarize(input_file, prepared, transcription_overrides=None):
+    """
+    Model stage (main thread): transcription and diarization of the shared AudioArtifact.
+    transcription_overrides are merged into the [Whisper] transcription options (e.g. per job_server job).
+    """
+    paths, audio = prepared
+    transcription_results = None
+    diarization_results = None
+
+    print("Step 2: Transcription")
+    with instrumentation.stage("transcribe", input_file, audio.duration) as timer:
+        if not transcription_overrides and not result_cache.enabled() and file_exists(paths['transcription']):
+            transcription_results = load_results_from_file(paths['transcription'])
+        else:
+            try:
+                # Keyed by audio content + model + options, so renamed files hit and changed options miss
+                options = dict(transcription.transcription_options(), **(transcription_overrides or {}))
+                cache_key = result_cache.make_key(
+                    input_file, config.get('Whisper', 'ModelID'), dict(options, preprocessing=preprocessing_options(), vad=vad.settings(),
+                                                                    sharding=sharded_transcription.settings(),
+                                                                    checkpoint=checkpointed_transcription.settings())
+                )
+                transcription_results = result_cache.get('transcription', cache_key)
+                if transcription_results is None:
+                    if sharded_transcription.should_shard(audio):
+                        # Long recording: shards cut at silences, transcribed in parallel processes
+                        transcription_results = sharded_transcription.transcribe_sharded(audio, transcription.transcribe_audio, options)
+                    elif checkpointed_transcription.should_checkpoint(audio):
+                        # Window by window with a resumable checkpoint, see checkpointed_transcription.py
+                        transcription_results = checkpointed_transcription.transcribe_checkpointed(
+                            audio, transcription.transcribe_audio, options, cache_key)
+                    else:
+                        transcription_results = transcription.transcribe_audio(audio, options)
+                    if transcription_results and sharded_transcription.is_complete(transcription_results):
+                        # A result with failed shards is used for this run but not cached, so a rerun retries them
+                        result_cache.put('transcription', cache_key, transcription_results)
+                if transcription_results:
+                    # Which model and options produced this transcript, for results_index.py
+                    transcription_results["model"] = config.get('Whisper', 'ModelID')
+                    transcription_results["options_hash"] = results_index.options_hash(options)
+                save_results_to_file(transcription_results, paths['transcription_raw'])
+                if transcription_results and transcript_store.enabled():
+                    # Columnar copy: a fraction of the size and much faster to load, see transcript_store.py
+                    transcript_store.save(transcription_results, transcript_store.npz_path_for(paths['transcription_raw']))
+
+                # Extract and format transcription results
+                transcription_segments = []
+                keep_words = word_level_speakers()
+                for segment in transcription_results["segments"]:
+                    transcription_segment = {
+                        "start": segment["start"],
+                        "end": segment["end"],
+                        "text": segment["text"]
+                    }
+                    if keep_words and segment.get("words"):
+                        transcription_segment["words"] = [{"start": word["start"], "end": word["end"], "word": word["word"]}
+                                                          for word in segment["words"]]
+                    transcription_segments.append(transcription_segment)
+                transcription_results = transcription_segments
+                save_results_to_file(transcription_segments, paths['transcription'])
+            except Exception as e:
+                logging.error(f"Error during transcription: {e}")
+        timer.ok = bool(transcription_results)
+
+    print("Step 3: Speaker Diarization")
+    with instrumentation.stage("diarize", input_file, audio.duration) as timer:
+        if not result_cache.enabled() and file_exists(paths['diarization']):
+            diarization_results = load_results_from_file(paths['diarization'])
+        else:
+            try:
+                # Use None as a fallback if they are not specified or not integers
+                num_speakers = config.getint('Diarization', 'NumSpeakers', fallback=None)
+                min_speakers = config.getint('Diarization', 'MinSpeakers', fallback=None)
+                max_speakers = config.getint('Diarization', 'MaxSpeakers', fallback=None)
+
+                cache_key = result_cache.make_key(
+                    input_file,
+                    config.get('Models', 'DiarizationModel', fallback='pyannote/speaker-diarization-3.1'),
+                    {"num_speakers": num_speakers, "min_speakers": min_speakers, "max_speakers": max_speakers,
+                     "preprocessing": preprocessing_options()}
+                )
+                diarization_results = result_cache.get('diarization', cache_key)
+                if diarization_results is None:
                     diarization_results = speaker_diarization.diarize_audio(
-                        paths['audio'], 
-                        num_speakers=num_speakers, 
-                        min_speakers=min_speakers, 
+                        audio,
+                        num_speakers=num_speakers,
+                        min_speakers=min_speakers,
                         max_speakers=max_speakers
                         )
-                    save_results_to_file(diarization_results, paths['diarization'])
-                except Exception as e:
-                    logging.error(f"Error during speaker diarization: {e}")
+                    if diarization_results:
+                        result_cache.put('diarization', cache_key, diarization_results)
+                save_results_to_file(diarization_results, paths['diarization'])
+            except Exception as e:
+                logging.error(f"Error during speaker diarization: {e}")
+        timer.ok = bool(diarization_results)
 
-        except Exception as e:
-            logging.error(f"Error during processing: {e}")
+    return paths, audio.duration, transcription_results, diarization_results
 
+def write_outputs(input_file, stage_results):
+    """Writer stage (writer pool): speaker mapping and JSON/SRT/TXT/MP4 output."""
+    paths, audio_duration, transcription_results, diarization_results = stage_results
+    written = False
 
-        print("Step 4: Matching Diarization with Transcription")
-        try:
-            if diarization_results and transcription_results:  # Ensure both results are available
-                overlap_threshold = float(config.get('Diarization', 'OverlapThreshold', fallback='0.5'))  # Default to 0.5 if not specified
-                #final_results = match_diarization_with_transcription(diarization_results, transcription_results)
+    print("Step 4: Matching Diarization with Transcription")
+    try:
+        if diarization_results and transcription_results:  # Ensure both results are available
+            overlap_threshold = float(config.get('Diarization', 'OverlapThreshold', fallback='0.5'))  # Default to 0.5 if not specified
+            with instrumentation.stage("map", input_file, audio_duration):
                 final_results = map_speakers_to_transcription(transcription_results, diarization_results, overlap_threshold)
-                save_results_to_file(final_results, paths['final']) # Save final results
-                save_results_to_srt(final_results, paths['srt'])  # Save results to SRT
-                save_results_to_text(final_results, paths['text']) # Save results to human readable text
-                audio_processing.combine_audio_subtitles(paths['audio'], paths['srt'], paths['mp4']) #combine into MP4
-
-                #Cleanup
-                if os.path.exists(paths['audio']):
-                    os.remove(paths['audio'])
-                    logging.info(f"Temporary audio file {paths['audio']} removed successfully.")
-
-            else:
-                logging.error("Diarization or transcription results are missing, cannot proceed to matching.")
+            # JSON/SRT/TXT (and VTT/HTML if configured) in one pass over the segments
+            format_paths = {'json': paths['final'], 'srt': paths['srt'], 'txt': paths['text'], 'vtt': paths['vtt'], 'html': paths['html']}
+            with instrumentation.stage("render", input_file, audio_duration):
+                output_renderer.render(final_results, {name: format_paths[name] for name in output_formats()})
+            written = True
+            with instrumentation.stage("mux", input_file, audio_duration):
+                audio_processing.combine_audio_subtitles(input_file, paths['srt'], paths['mp4'], audio_duration) #combine into MP4, audio cut to the transcribed duration
 
-        # Move processed file to results directory
-        #os.rename(input_file, os.path.join(paths['results'], os.path.basename(input_file)))
-        #logging.info(f"Processed file moved to {paths['results']}")
+        else:
+            logging.error(f"Diarization or transcription results are missing for {input_file}, cannot proceed to matching.")
 
-        except Exception as e:
-            logging.error(f"Error during matching diarization with transcription: {e}")
+    except Exception as e:
+        logging.error(f"Error during matching diarization with transcription: {e}")
+    # Per-file summary line in the metrics JSONL, see instrumentation.py
+    summary = instrumentation.file_done(input_file, audio_duration)
+    # Queryable per-file/per-speaker rows, see results_index.py
+    if written:
+        results_index.index_file(input_file, paths, summary)
+
+def main(input_dir, workers=1):
+    # Iterate over audio files in the specified input directory
+    logging.info(f"Processing audio in directory {input_dir}")
+    input_files = glob.glob(os.path.join(input_dir, '*'))
+    # Stage timings of this run go to the metrics JSONL (worker processes included)
+    instrumentation.start_run()
+
+    if workers > 1:
+        # One file per worker process, cores split between them, see batch_runner.py; it also logs
+        # the model registry and result cache counters summed over the workers
+        batch_runner.run_batch(input_files, preprocess_file, transcribe_and_diarize, write_outputs, workers)
+        instrumentation.export_prometheus()
+        return
+
+    # Decoding of the next files and writing of finished ones overlap with the model stage, see [Pipeline] in config.ini
+    staged_pipeline.run_pipeline(
+        input_files,
+        preprocess_file,
+        transcribe_and_diarize,
+        write_outputs
+    )
+
+    # Model load times and reuse across the whole directory
+    model_registry.log_metrics()
+    result_cache.log_report()
+    # Per-stage totals for node_exporter's textfile collector
+    instrumentation.export_prometheus()
 
 
 # Example usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe and diarize every file in [General] InputDir")
+    parser.add_argument('--workers', type=int, default=batch_runner.default_workers(),
+                        help="worker processes, one file each (default [Pipeline] Workers, 1 = staged single-process pipeline)")
+    parser.add_argument('--profile', metavar='STAGES',
+                        help="profile these stages (comma-separated, e.g. transcribe,diarize or *), overrides [Profiling]")
+    parser.add_argument('--profiler', choices=profiling.PROFILERS, default='cprofile',
+                        help="cprofile (.prof), torch (Chrome trace) or sampler (folded stacks)")
+    parser.add_argument('--profile-files', metavar='GLOBS', help="only profile files matching these filename globs")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep watching InputDir and process new, changed and failed files, see directory_watcher.py")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.configure(args.profile, args.profiler, args.profile_files)
     try:
         input_dir = config.get('General', 'InputDir', fallback='Input_AV')  # Provide a default path in case it's not specified
-        main(input_dir)
+        if args.watch:
+            directory_watcher.watch(input_dir, preprocess_file, transcribe_and_diarize, write_outputs, construct_output_paths)
+        else:
+            main(input_dir, args.workers)
     except Exception as e:
         logging.error(f"Failed to start processing: {e}")
\ No newline at end of file
@@ -2,7 +2,18 @@
 import audio_processing_in_memory
 import transcription_stablets
 import speaker_diarization
+import speaker_mapping
+import model_registry
+import staged_pipeline
+import result_cache
+import audio_artifact
 import utilities
+import batch_runner
+import sharded_transcription
+import checkpointed_transcription
+import transcript_store
+import instrumentation
+import profiling
 
 import logging
 import configparser
@@ -10,6 +21,8 @@ import os
 import json
 import glob
 import sys
+import functools
+import argparse
 
 
 # Load configurations
@@ -36,95 +49,172 @@ def construct_output_paths(input_file):
         'mp4' : os.path.join(results_dir, f"{base_name}_final_results.mp4")  
     }
 
-def transcribe_all_files(input_dir):
-    #Iterate over all files in the input dir, load the audio file into memory via audio_processing_in_memory.load_resample_trim_audio(input_file) and call transcription_stablets.transcribe_audio(audio in memory) then save the result of transcribe_audio to disk:
+def preprocessing_options():
+    """Settings that change the preprocessed audio; part of every result cache key."""
+    options = dict(config.items('Audio_Preprocess')) if config.has_section('Audio_Preprocess') else {}
+    options["decoder"] = f"ffmpeg-mono-f32-{audio_artifact.SAMPLE_RATE}"
+    return options
 
-    logging.info(f"Transcribing audio in directory {input_dir}")
+def diarization_options():
+    # Use None as a fallback if they are not specified or not integers
+    return {
+        "num_speakers": config.getint('Diarization', 'NumSpeakers', fallback=None),
+        "min_speakers": config.getint('Diarization', 'MinSpeakers', fallback=None),
+        "max_speakers": config.getint('Diarization', 'MaxSpeakers', fallback=None),
+    }
 
-    for input_file in glob.glob(os.path.join(input_dir, '*')):
-        logging.info(f"Processing audio in {input_file}")
+def cache_keys(input_file, transcribe, diarize):
+    # Keyed by audio content + model + options: renamed/duplicate files hit, changed options miss
+    keys = {}
+    if transcribe:
+        keys['transcription'] = result_cache.make_key(
+            input_file,
+            f"stable-ts:{config.get('Whisper', 'ModelID')}",
+            dict(transcription_stablets.transcription_options(), preprocessing=preprocessing_options(),
+                 sharding=sharded_transcription.settings(), checkpoint=checkpointed_transcription.settings())
+        )
+    if diarize:
+        keys['diarization'] = result_cache.make_key(
+            input_file,
+            config.get('Models', 'DiarizationModel', fallback='pyannote/speaker-diarization-3.1'),
+            dict(diarization_options(), preprocessing=preprocessing_options())
+        )
+    return keys
 
-        paths = construct_output_paths(input_file)
+def preprocess_file(input_file, transcribe=True, diarize=True):
+    logging.info(f"Preprocessing and loading {input_file}")
 
-        # Ensure 'paths' is defined outside of any conditional blocks
-        # Proceed with ensuring the directory exists
-        os.makedirs(os.path.dirname(paths['audio']), exist_ok=True)
+    paths = construct_output_paths(input_file)
+    # Proceed with ensuring the directory exists
+    os.makedirs(os.path.dirname(paths['audio']), exist_ok=True)
 
-        logging.info(f"Preprocessing and loading {input_file}")
-        # Audio processing via audio_processing_in_memory.load_resample_trim_audio(input_file)
-        try:
-            audio_loaded_to_memory = audio_processing_in_memory.load_resample_trim_audio(input_file)
-        except Exception as e:
-            logging.error(f"Main: Error processing audio {input_file}: {e}")
-            continue
+    keys = cache_keys(input_file, transcribe, diarize)
+    results = {stage: result_cache.get(stage, key) for stage, key in keys.items()}
+    if all(result is not None for result in results.values()):
+        # Everything is cached, no need to decode the audio at all
+        return keys, results, None
 
-        logging.info(f"Transcribing {input_file}")
-        # Transcription via transcription_stablets.transcribe_audio(audio in memory)
-        try:
-            transcription_results = transcription_stablets.transcribe_audio(audio_loaded_to_memory)
+    # Decode once via audio_processing_in_memory.load_resample_trim_audio(input_file); transcription and diarization share it
+    # "ingest" covers decode, resample and trim, which happen in the same pass
+    with instrumentation.stage("ingest", input_file) as timer:
+        audio_loaded_to_memory = audio_processing_in_memory.load_resample_trim_audio(input_file)
+        timer.ok = audio_loaded_to_memory is not None
+        if audio_loaded_to_memory is not None:
+            timer.audio_seconds = audio_loaded_to_memory.duration
+    if audio_loaded_to_memory is None:
+        logging.error(f"Main: Error processing audio {input_file}")
+        instrumentation.file_done(input_file)
+        return None
+    return keys, results, audio_loaded_to_memory
+
+def process_file(input_file, prepared):
+    keys, results, audio_loaded_to_memory = prepared
+
+    if 'transcription' in keys and results['transcription'] is None:
+        with instrumentation.stage("transcribe", input_file, audio_loaded_to_memory.duration) as timer:
+            logging.info(f"Transcribing {input_file}")
+            # Transcription via transcription_stablets.transcribe_audio(audio in memory)
+            if sharded_transcription.should_shard(audio_loaded_to_memory):
+                # Long recording: shards cut at silences, transcribed in parallel processes (result is a dict)
+                transcription_results = sharded_transcription.transcribe_sharded(audio_loaded_to_memory, transcription_stablets.transcribe_audio)
+            elif checkpointed_transcription.should_checkpoint(audio_loaded_to_memory):
+                # Window by window with a resumable checkpoint (result is a dict)
+                transcription_results = checkpointed_transcription.transcribe_checkpointed(
+                    audio_loaded_to_memory, transcription_stablets.transcribe_audio,
+                    transcription_stablets.transcription_options(), keys['transcription'])
+            else:
+                transcription_results = transcription_stablets.transcribe_audio(audio_loaded_to_memory)
+            if transcription_results is None:
+                logging.error(f"Main: Error transcribing audio {input_file}")
+            elif not isinstance(transcription_results, dict) or sharded_transcription.is_complete(transcription_results):
+                # A result with failed shards is used for this run but not cached, so a rerun retries them
+                result_cache.put('transcription', keys['transcription'],
+                                 transcription_results if isinstance(transcription_results, dict) else transcription_results.to_dict())
+            results['transcription'] = transcription_results
+            timer.ok = transcription_results is not None
+
+    if 'diarization' in keys and results['diarization'] is None:
+        with instrumentation.stage("diarize", input_file, audio_loaded_to_memory.duration) as timer:
+            logging.info(f"Diarizing {input_file}")
+            try:
+                # Try to diarize based on the range of possible speakers
+                diarization_results = speaker_diarization.diarize_audio(audio_loaded_to_memory, **diarization_options())
+                if diarization_results:
+                    result_cache.put('diarization', keys['diarization'], diarization_results)
+                results['diarization'] = diarization_results
+            except Exception as e:
+                logging.error(f"Error during speaker diarization: {e}")
+            timer.ok = bool(results['diarization'])
+
+    return results
+
+def save_results(input_file, results):
+    paths = construct_output_paths(input_file)
+
+    with instrumentation.stage("render", input_file):
+        transcription_results = results.get('transcription')
+        if isinstance(transcription_results, dict):
+            # Result came from the cache
+            utilities.save_results_to_file(transcription_results, paths['transcription_raw'])
+        elif transcription_results is not None:
             transcription_results.save_as_json(paths['transcription_raw'])
-        except Exception as e:
-            logging.error(f"Main: Error transcribing audio {input_file}: {e}")
-            continue
+        if transcription_results is not None and transcript_store.enabled():
+            # Columnar copy, read back by the speaker mapping step, see transcript_store.py
+            transcript_store.save(transcription_results if isinstance(transcription_results, dict) else transcription_results.to_dict(),
+                                  transcript_store.npz_path_for(paths['transcription_raw']))
 
-def diarize_audio(input_dir):
-    #if not file_exists(paths['diarization']):
-    for input_file in glob.glob(os.path.join(input_dir, '*')):
-        paths = construct_output_paths(input_file)
-        logging.info(f"Diarizing audio in directory {input_dir}")
-        try:
-            # Use None as a fallback if they are not specified or not integers
-            num_speakers = config.getint('Diarization', 'NumSpeakers', fallback=None)
-            min_speakers = config.getint('Diarization', 'MinSpeakers', fallback=None)
-            max_speakers = config.getint('Diarization', 'MaxSpeakers', fallback=None) 
-            # Try to diarize based on the range of possible speakers
-            diarization_results = speaker_diarization.diarize_audio(
-                input_file, 
-                num_speakers = num_speakers, 
-                min_speakers = min_speakers, 
-                max_speakers = max_speakers
-                )
-            #Save to file
-            #diarization_results.save_as_json(paths['diarization'])
+        diarization_results = results.get('diarization')
+        if diarization_results is not None:
             utilities.save_results_to_file(diarization_results, paths['diarization'])
-        except Exception as e:
-            logging.error(f"Error during speaker diarization: {e}")
+    # Per-file summary line in the metrics JSONL, see instrumentation.py
+    instrumentation.file_done(input_file)
+
+def process_all_files(input_dir, transcribe=True, diarize=True, workers=1):
+    #Iterate over all files in the input dir, decode each one once into memory via audio_processing_in_memory.load_resample_trim_audio(input_file),
+    #transcribe (transcription_stablets) and/or diarize (speaker_diarization) that same buffer, then save the results to disk.
+    #Loading of the next files and saving of finished ones run alongside the models, see [Pipeline] in config.ini
+
+    logging.info(f"Processing audio in directory {input_dir}")
+
+    input_files = glob.glob(os.path.join(input_dir, '*'))
+    preprocess = functools.partial(preprocess_file, transcribe=transcribe, diarize=diarize)
+    if workers > 1:
+        # One file per worker process, cores split between them, see batch_runner.py
+        batch_runner.run_batch(input_files, preprocess, process_file, save_results, workers)
+        return
+
+    staged_pipeline.run_pipeline(input_files, preprocess, process_file, save_results)
 
 def map_speakers_to_transcription(input_dir):
     for input_file in glob.glob(os.path.join(input_dir, '*')):
 
         paths = construct_output_paths(input_file)
-        transcription_results = utilities.load_results_from_file(paths['transcription_raw'])
+        try:
+            # The .npz copy when there is one (faster), else the JSON
+            transcription_results = transcript_store.load_result(paths['transcription_raw'])
+        except (IOError, ValueError) as e:
+            logging.error(f"Failed to load results from {paths['transcription_raw']}: {e}")
+            transcription_results = None
         diarization_results = utilities.load_results_from_file(paths['diarization'])
         overlap_threshold = config.getfloat('Diarization', 'OverlapThreshold', fallback=0.5)
-        #print(f"diarization results: {diarization_results}")
-    
-        #if os.path.exists(paths['transcription']) and os.path.exists(paths['diarization']):
-
-
-            #  For the transcription_results, iterate through each transcription_results.segments "start" and "end" and load them into variables
-
-        for segment in transcription_results["segments"]:
-            # Find the corresponding mapped_result for this segment
-            transcript_start = segment['start']
-            transcript_end = segment['end']
-            print(f"Transcript segment start: {transcript_start}, transcript segment end: {transcript_end}")
-            for diarization_segment in diarization_results:
-                print(f"Diarization segment start: {diarization_segment['speaker_start']}, diarization segment end: {diarization_segment['speaker_end']}")
-                # Calculate the overlap duration and percentage
-                overlap_duration = max(0, min(segment['end'], diarization_segment['speaker_end']) - max(segment['start'], diarization_segment["speaker_start"]))
-                print(f"Overlap duration: {overlap_duration}")
-                segment_duration = segment['end'] - segment['start']
-                print(f"Segment duration: {segment_duration}")
-                overlap_percentage = overlap_duration / segment_duration
-                print(f"Overlap percentage: {overlap_percentage}")
-                # Check if the overlap percentage meets the threshold
-                if overlap_percentage >= overlap_threshold:
-                    # Add the speaker name to the segment dictionary
-                    segment['speaker'] = diarization_segment['speaker']
-                    # Break the inner loop once the match is found
-                    break
-        utilities.save_results_to_file(transcription_results, paths['mapped_T_D'])
+        if not transcription_results or diarization_results is None:
+            logging.error(f"Transcription or diarization results missing for {input_file}, skipping speaker mapping")
+            continue
+
+        with instrumentation.stage("map", input_file):
+            # Overlap-weighted majority speaker per segment via the sorted-interval engine
+            segments = transcription_results["segments"]
+            speakers = speaker_mapping.assign_speakers(segments, diarization_results, overlap_threshold)
+            for segment, speaker in zip(segments, speakers):
+                segment['speaker'] = speaker
+            if config.getboolean('Diarization', 'WordLevelSpeakers', fallback=True):
+                # Speaker per word as well (word midpoint vs. diarization turns), see speaker_mapping.label_words
+                words = [word for segment in segments for word in segment.get('words') or []]
+                labels, names = speaker_mapping.label_words(words, diarization_results, overlap_threshold)
+                for word, label in zip(words, labels.tolist()):
+                    word['speaker'] = names[label]
+            utilities.save_results_to_file(transcription_results, paths['mapped_T_D'])
+        instrumentation.file_done(input_file)
 
 
     return None
@@ -132,24 +222,40 @@ def map_speakers_to_transcription(input_dir):
 
 
 
-def main(input_dir):
+def main(input_dir, workers=1):
     # Iterate over audio files in the specified input directory
     logging.info(f"Processing audio in directory {input_dir}")
 
-    if config.getboolean('General', 'Transcribe'):
-        results = transcribe_all_files(input_dir)
-    if config.getboolean('General', 'Diarize'):
-        diarize_audio(input_dir)
+    # Stage timings of this run go to the metrics JSONL (worker processes included)
+    instrumentation.start_run()
+    transcribe = config.getboolean('General', 'Transcribe')
+    diarize = config.getboolean('General', 'Diarize')
+    if transcribe or diarize:
+        process_all_files(input_dir, transcribe=transcribe, diarize=diarize, workers=workers)
     if config.getboolean('General', 'MapSpeakers'):
         map_speakers_to_transcription(input_dir)
+    model_registry.log_metrics()
+    result_cache.log_report()
+    instrumentation.export_prometheus()
     #if config.getboolean('General', 'LLM'):
 
             
 
 # Example usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe and/or diarize every file in [General] InputDir")
+    parser.add_argument('--workers', type=int, default=batch_runner.default_workers(),
+                        help="worker processes, one file each (default [Pipeline] Workers, 1 = staged single-process pipeline)")
+    parser.add_argument('--profile', metavar='STAGES',
+                        help="profile these stages (comma-separated, e.g. transcribe,diarize or *), overrides [Profiling]")
+    parser.add_argument('--profiler', choices=profiling.PROFILERS, default='cprofile',
+                        help="cprofile (.prof), torch (Chrome trace) or sampler (folded stacks)")
+    parser.add_argument('--profile-files', metavar='GLOBS', help="only profile files matching these filename globs")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.configure(args.profile, args.profiler, args.profile_files)
     try:
         input_dir = config.get('General', 'InputDir', fallback='Input_AV')  # Provide a default path in case it's not specified
-        main(input_dir)
+        main(input_dir, args.workers)
     except Exception as e:
         logging.error(f"Failed to start processing: {e}")
@@ -0,0 +1,171 @@
+"""
+Process-wide registry of loaded models (diarization pipeline, Whisper, HF pipelines, wav2vec2).
+
+Models are loaded lazily on first use and kept warm for the rest of the process, keyed by
+(model id, device, dtype). When the estimated memory of the loaded models exceeds
+[Models] MemoryBudgetMB the least recently used ones are dropped. Load times, hits and
+evictions are kept per key and can be logged with log_metrics().
+"""
+import configparser
+import gc
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+
+def default_device(fallback='GPU'):
+    """cuda when [CPU_GPU] Hardware allows it and a GPU is present, otherwise cpu."""
+    import torch
+    hardware_config = config.get('CPU_GPU', 'Hardware', fallback=fallback).upper()
+    return "cuda" if hardware_config == 'GPU' and torch.cuda.is_available() else "cpu"
+
+
+def estimate_model_bytes(obj, _depth=0, _seen=None):
+    """
+    Rough memory footprint of a model object: the size of all torch parameters and buffers reachable
+    from it (nn.Modules, HF pipelines via .model, pyannote pipelines via their attributes, tuples).
+    """
+    _seen = set() if _seen is None else _seen
+    if obj is None or id(obj) in _seen or _depth > 3:
+        return 0
+    _seen.add(id(obj))
+
+    if hasattr(obj, 'parameters') and hasattr(obj, 'buffers') and callable(obj.parameters):
+        try:
+            tensors = list(obj.parameters()) + list(obj.buffers())
+            return sum(t.numel() * t.element_size() for t in tensors)
+        except Exception:
+            return 0
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_model_bytes(item, _depth + 1, _seen) for item in obj)
+    if isinstance(obj, dict):
+        return sum(estimate_model_bytes(item, _depth + 1, _seen) for item in obj.values())
+    if hasattr(obj, '__dict__') and not isinstance(obj, type):
+        return sum(estimate_model_bytes(item, _depth + 1, _seen) for item in vars(obj).values())
+    return 0
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget_mb=0):
+        # 0 (or less) means no budget, models are never evicted
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._models = OrderedDict()  # key -> (model, size in bytes), least recently used first
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._metrics = {}
+
+    def _metrics_for(self, key):
+        return self._metrics.setdefault(key, {"loads": 0, "load_seconds": 0.0, "hits": 0, "evictions": 0, "bytes": 0})
+
+    def get(self, model_id, loader, device="cpu", dtype=None):
+        """
+        Return the model for (model_id, device, dtype), calling loader() to build it on first use.
+
+        Concurrent callers asking for the same key wait for a single load; different keys load in parallel.
+        """
+        key = (model_id, str(device), str(dtype) if dtype is not None else None)
+
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self._metrics_for(key)["hits"] += 1
+                return self._models[key][0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have finished loading while we waited
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    self._metrics_for(key)["hits"] += 1
+                    return self._models[key][0]
+
+            logging.info(f"Model registry: loading {key}")
+            start = time.perf_counter()
+            model = loader()
+            elapsed = time.perf_counter() - start
+            size = estimate_model_bytes(model)
+            logging.info(f"Model registry: loaded {key} in {elapsed:.2f}s (~{size / 1024 ** 2:.0f} MB)")
+
+            with self._lock:
+                metrics = self._metrics_for(key)
+                metrics["loads"] += 1
+                metrics["load_seconds"] += elapsed
+                metrics["bytes"] = size
+                self._models[key] = (model, size)
+                self._evict_over_budget(keep=key)
+        return model
+
+    def _evict_over_budget(self, keep):
+        # Called with self._lock held
+        if self.memory_budget_bytes <= 0:
+            return
+        evicted = False
+        while self.total_bytes() > self.memory_budget_bytes:
+            victim = next((k for k in self._models if k != keep), None)
+            if victim is None:
+                logging.warning(f"Model registry: {keep} alone exceeds the memory budget")
+                break
+            del self._models[victim]
+            self._metrics_for(victim)["evictions"] += 1
+            logging.info(f"Model registry: evicted {victim}")
+            evicted = True
+        if evicted:
+            gc.collect()
+            torch = sys.modules.get('torch')
+            if torch is not None and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def total_bytes(self):
+        return sum(size for _, size in self._models.values())
+
+    def evict(self, model_id=None):
+        """Drop one model id (all devices/dtypes) or, with no argument, every loaded model."""
+        with self._lock:
+            for key in [k for k in self._models if model_id is None or k[0] == model_id]:
+                del self._models[key]
+                self._metrics_for(key)["evictions"] += 1
+        gc.collect()
+
+    def metrics(self):
+        with self._lock:
+            return {key: dict(values, loaded=key in self._models) for key, values in self._metrics.items()}
+
+    def log_metrics(self, metrics=None):
+        for key, values in (self.metrics() if metrics is None else metrics).items():
+            logging.info(
+                f"Model registry: {key} loads={values['loads']} load_time={values['load_seconds']:.2f}s "
+                f"hits={values['hits']} evictions={values['evictions']} size=~{values['bytes'] / 1024 ** 2:.0f}MB "
+                f"loaded={values['loaded']}"
+            )
+
+
+registry = ModelRegistry(config.getfloat('Models', 'MemoryBudgetMB', fallback=0))
+
+
+def get_model(model_id, loader, device="cpu", dtype=None):
+    return registry.get(model_id, loader, device=device, dtype=dtype)
+
+
+def merge_metrics(snapshots):
+    """Combine registry.metrics() snapshots from several processes: counts and load time summed."""
+    merged = {}
+    for snapshot in snapshots:
+        for key, values in snapshot.items():
+            totals = merged.setdefault(key, {"loads": 0, "load_seconds": 0.0, "hits": 0, "evictions": 0, "bytes": 0, "loaded": False})
+            for name in ("loads", "load_seconds", "hits", "evictions"):
+                totals[name] += values[name]
+            totals["bytes"] = max(totals["bytes"], values["bytes"])
+            totals["loaded"] = totals["loaded"] or values["loaded"]
+    return merged
+
+
+def log_metrics(metrics=None):
+    """Log this process's registry metrics, or `metrics` (see merge_metrics)."""
+    registry.log_metrics(metrics)
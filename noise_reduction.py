@@ -0,0 +1,148 @@
+"""
+Block-wise, parallel noise reduction for long recordings.
+
+noisereduce's default (non-stationary) mode on a whole 2-hour file is single-threaded and keeps
+several full-length STFT buffers alive. Here the noise profile is computed once, from the quietest
+frames of the whole recording, and the audio is cut into hop-aligned chunks with a little context
+on each side. The chunks are gated independently in a process pool (stationary spectral gating
+against the shared profile) and the context is cropped off again, so the stitched result has no
+seams. Only a bounded number of chunks is in flight, so peak memory depends on the chunk size and
+the number of workers, not on the length of the file.
+
+Everything stays float32; there is no int/float round trip.
+"""
+import configparser
+import heapq
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Same spectral settings audio_processing has always used
+N_FFT = 512
+HOP_LENGTH = N_FFT // 4
+NOISE_REDUCE_OPTIONS = {"prop_decrease": 0.3, "n_std_thresh_stationary": 2.25, "n_fft": N_FFT, "win_length": N_FFT}
+
+
+def settings():
+    return {
+        "chunk_seconds": config.getfloat('Audio', 'NoiseReductionChunkSeconds', fallback=30.0),
+        # Inside a batch worker (batch_runner.py) OMP_NUM_THREADS is that worker's share of the cores
+        "workers": config.getint('Audio', 'NoiseReductionWorkers',
+                                 fallback=int(os.environ.get('OMP_NUM_THREADS', 0)) or os.cpu_count() or 1),
+    }
+
+
+def noise_clip(blocks, sample_rate, frame_seconds=0.5, max_seconds=10.0):
+    """
+    Concatenate the lowest-energy frames of the whole stream (up to `max_seconds` of audio) into a noise
+    sample. Takes any iterable of float32 blocks and keeps only the candidate frames in memory.
+    """
+    frame_len = int(frame_seconds * sample_rate)
+    keep = max(1, int(max_seconds / frame_seconds))
+    quietest = []  # max-heap on energy via negated keys: (-energy, index, frame)
+    index = 0
+    carry = np.empty(0, dtype=np.float32)
+    for block in blocks:
+        block = np.concatenate((carry, block)) if len(carry) else block
+        n_frames = len(block) // frame_len
+        for i in range(n_frames):
+            frame = block[i * frame_len:(i + 1) * frame_len]
+            energy = float(np.dot(frame, frame))
+            if len(quietest) < keep:
+                heapq.heappush(quietest, (-energy, index, frame.copy()))
+            elif energy < -quietest[0][0]:
+                heapq.heapreplace(quietest, (-energy, index, frame.copy()))
+            index += 1
+        carry = block[n_frames * frame_len:].copy()
+    if not quietest:
+        return carry
+    # Keep the frames in their original order
+    return np.concatenate([frame for _, _, frame in sorted(quietest, key=lambda entry: entry[1])])
+
+
+def _rechunk(blocks, chunk_len):
+    """Regroup an iterable of blocks into arrays of exactly chunk_len samples (the last may be shorter)."""
+    pending = []
+    pending_len = 0
+    for block in blocks:
+        pending.append(block)
+        pending_len += len(block)
+        while pending_len >= chunk_len:
+            joined = np.concatenate(pending) if len(pending) > 1 else pending[0]
+            yield joined[:chunk_len]
+            rest = joined[chunk_len:]
+            pending = [rest] if len(rest) else []
+            pending_len = len(rest)
+    if pending_len:
+        yield np.concatenate(pending) if len(pending) > 1 else pending[0]
+
+
+def _reduce_chunk(padded, offset, length, sample_rate, noise):
+    import noisereduce as nr
+    # chunk_size: the chunk is already small, don't let noisereduce split it again (with its own seams).
+    # clip_noise_stationary would cut the noise sample to chunk_size, i.e. give every chunk its own profile
+    reduced = nr.reduce_noise(y=padded, sr=sample_rate, y_noise=noise, stationary=True, chunk_size=len(padded) + 1,
+                              clip_noise_stationary=False, **NOISE_REDUCE_OPTIONS)
+    return np.asarray(reduced[offset:offset + length], dtype=np.float32)
+
+
+def reduce_noise_stream(blocks, sample_rate, noise, chunk_seconds=None, workers=None):
+    """
+    Yield noise-reduced chunks, in order, for an iterable of float32 blocks.
+
+    Chunks and their context are multiples of the STFT hop and every chunk is gated against the same
+    noise thresholds, so the result matches gating the whole signal at once (to float32 rounding; see
+    noise_reduction_test.py). The one non-local step in noisereduce is its 80 dB floor below each
+    frequency bin's loudest frame, taken per chunk; it can only move bins already that far down.
+    """
+    defaults = settings()
+    chunk_seconds = chunk_seconds or defaults["chunk_seconds"]
+    workers = max(1, workers or defaults["workers"])
+    chunk_len = max(HOP_LENGTH, int(chunk_seconds * sample_rate) // HOP_LENGTH * HOP_LENGTH)
+    # Enough context for the STFT window and noisereduce's time smoothing of the mask
+    context = (sample_rate // 2) // HOP_LENGTH * HOP_LENGTH + N_FFT
+
+    chunks = _rechunk(blocks, chunk_len)
+    with ProcessPoolExecutor(workers) as pool:
+        in_flight = deque()
+        prev_tail = np.empty(0, dtype=np.float32)
+        current = next(chunks, None)
+        while current is not None:
+            following = next(chunks, None)
+            head = following[:context] if following is not None else np.empty(0, dtype=np.float32)
+            padded = np.concatenate((prev_tail, current, head)).astype(np.float32, copy=False)
+            in_flight.append(pool.submit(_reduce_chunk, padded, len(prev_tail), len(current), sample_rate, noise))
+            # Copy: callers may write results back into the buffer `current` is a view of
+            prev_tail = current[-context:].copy()
+            current = following
+            while len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def _views(samples, block_len):
+    for start in range(0, len(samples), block_len):
+        yield samples[start:start + block_len]
+
+
+def reduce_noise(samples, sample_rate, out=None, chunk_seconds=None, workers=None):
+    """
+    Noise-reduce a float32 array (or memory map). Results are written into `out`, which may be
+    `samples` itself for in-place processing; returns `out`.
+    """
+    if out is None:
+        out = np.empty(len(samples), dtype=np.float32)
+    block_len = int(settings()["chunk_seconds"] * sample_rate)
+    noise = noise_clip(_views(samples, block_len), sample_rate)
+    position = 0
+    for chunk in reduce_noise_stream(_views(samples, block_len), sample_rate, noise, chunk_seconds, workers):
+        out[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    return out
@@ -0,0 +1,37 @@
+"""
+Checks that block-wise noise reduction (noise_reduction.py) matches gating the whole signal at once.
+
+    python -m unittest noise_reduction_test
+"""
+import unittest
+
+import numpy as np
+
+import noise_reduction
+
+
+def _signal(sample_rate, seconds):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    # A tone switched on and off every ~1.7 s over background noise
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.3 * t) > 0)
+    return (tone + 0.02 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+class ChunkedNoiseReductionTest(unittest.TestCase):
+
+    def test_chunks_match_whole_signal(self):
+        sample_rate = 16000
+        samples = _signal(sample_rate, 20)
+        noise = noise_reduction.noise_clip(noise_reduction._views(samples, sample_rate * 5), sample_rate)
+        whole = noise_reduction._reduce_chunk(samples, 0, len(samples), sample_rate, noise)
+        # 3 s chunks fed in 2.5 s blocks, so chunk boundaries don't line up with the input blocks
+        chunks = noise_reduction.reduce_noise_stream(noise_reduction._views(samples, int(sample_rate * 2.5)),
+                                                     sample_rate, noise, chunk_seconds=3, workers=2)
+        stitched = np.concatenate(list(chunks))
+        self.assertEqual(len(stitched), len(samples))
+        np.testing.assert_allclose(stitched, whole, rtol=0, atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+"""
+Single-pass rendering of final (speaker-mapped) segments to any set of output formats.
+
+    output_renderer.render(final_results, {"json": ".../x_final_results.json", "srt": ".../x.srt"})
+
+The segments are walked once, in chunks. For each chunk the timestamp columns are formatted for
+the whole chunk at once: the digits are computed with NumPy integer arithmetic into a fixed-width
+byte matrix, not per line with format_time. The chunk is then handed to every requested writer. Writers
+stream to large buffered files, so memory stays flat however long the transcript is.
+
+Formats are registered with @register_writer("name"); json, srt, txt, vtt and html are built in.
+The json/srt/txt output is byte-for-byte what main.save_results_to_file/srt/text used to write.
+"""
+import html
+import json
+import os
+
+import numpy as np
+
+CHUNK_SEGMENTS = 4096
+_BUFFER_BYTES = 1 << 20
+
+WRITERS = {}
+
+
+def register_writer(name):
+    def decorator(cls):
+        WRITERS[name] = cls
+        return cls
+    return decorator
+
+
+def format_timestamps(seconds, millis_separator=',', with_millis=True):
+    """
+    Vectorized main.format_time (HH:MM:SS,mmm) / format_time_simple (HH:MM:SS, with_millis=False)
+    for an array of non-negative seconds. Same truncation and formatting as the scalar versions,
+    including hours past 99, which take as many digits as each value needs (as :02 does).
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    if len(seconds) == 0:
+        return []
+    whole = np.trunc(seconds)
+    millis = np.trunc((seconds - whole) * 1000).astype(np.int64)
+    whole = whole.astype(np.int64)
+    hours, minutes, secs = whole // 3600, whole % 3600 // 60, whole % 60
+
+    hour_digits = max(2, len(str(int(hours.max()))))
+    fields = [(hours, hour_digits), (minutes, 2), (secs, 2)] + ([(millis, 3)] if with_millis else [])
+    width = hour_digits + 6 + (4 if with_millis else 0)
+    out = np.empty((len(seconds), width), dtype=np.uint8)
+    column = 0
+    for i, (values, digits) in enumerate(fields):
+        if i:
+            out[:, column] = ord(millis_separator if i == 3 else ':')
+            column += 1
+        for power in range(digits - 1, -1, -1):
+            out[:, column] = values // 10 ** power % 10 + ord('0')
+            column += 1
+    formatted = out.view(f'S{width}').ravel().astype(str).tolist()
+    if hour_digits > 2:
+        # Rows were padded to the widest hour; drop the extra leading zeros of the shorter ones
+        row_digits = np.maximum(2, np.char.str_len(hours.astype(str)))
+        for i in np.flatnonzero(row_digits < hour_digits).tolist():
+            formatted[i] = formatted[i][hour_digits - row_digits[i]:]
+    return formatted
+
+
+class _Writer:
+    """Base writer: a large write buffer, header/footer hooks and one write per chunk."""
+    header = ""
+    footer = ""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', buffering=_BUFFER_BYTES)
+        self.count = 0
+        if self.header:
+            self.file.write(self.header)
+
+    def write_chunk(self, chunk):
+        self.file.write("".join(self.lines(chunk)))
+        self.count += len(chunk["segments"])
+
+    def lines(self, chunk):
+        raise NotImplementedError
+
+    def close(self):
+        if self.footer:
+            self.file.write(self.footer)
+        self.file.close()
+
+
+_SCALARS = (str, int, float, bool, type(None))
+# Without indent json uses its C encoder; these separators put each key on its own line at item depth
+_flat_item_encoder = json.JSONEncoder(separators=(",\n        ", ": "))
+
+
+@register_writer("json")
+class JsonWriter(_Writer):
+    """
+    Same bytes as json.dump(results, f, indent=4), written item by item. json.dump with indent runs
+    the pure-Python encoder; flat segment dicts (scalar values only, the usual case) go through the
+    C encoder with newline separators instead, which gives the identical text.
+    """
+
+    def lines(self, chunk):
+        encode = _flat_item_encoder.encode
+        for i, segment in enumerate(chunk["segments"]):
+            if segment and all(isinstance(value, _SCALARS) for value in segment.values()):
+                item = "    {\n        " + encode(segment)[1:-1] + "\n    }"
+            else:
+                item = "    " + json.dumps(segment, indent=4).replace("\n", "\n    ")
+            yield ("[\n" if self.count == 0 and i == 0 else ",\n") + item
+
+    def close(self):
+        self.file.write("\n]" if self.count else "[]")
+        self.file.close()
+
+
+def _speaker_number(speaker):
+    return str(speaker).replace('SPEAKER_', '')
+
+
+@register_writer("srt")
+class SrtWriter(_Writer):
+    def lines(self, chunk):
+        for i, (segment, start, end) in enumerate(zip(chunk["segments"], chunk["srt_start"], chunk["srt_end"]),
+                                                  start=self.count + 1):
+            yield f"{i}\n{start} --> {end}\n({_speaker_number(segment['speaker'])}) {segment['text']}\n\n"
+
+
+@register_writer("txt")
+class TextWriter(_Writer):
+    def lines(self, chunk):
+        for segment, start in zip(chunk["segments"], chunk["simple_start"]):
+            yield f"[{start}] {segment['speaker']}: {segment['text']}\n"
+
+
+@register_writer("vtt")
+class VttWriter(_Writer):
+    header = "WEBVTT\n\n"
+
+    def lines(self, chunk):
+        for segment, start, end in zip(chunk["segments"], chunk["vtt_start"], chunk["vtt_end"]):
+            # Cue text must not contain "-->" or a blank line
+            text = html.escape(segment['text'].strip().replace("-->", "->"), quote=False).replace("\n\n", "\n")
+            yield f"{start} --> {end}\n<v {html.escape(str(segment['speaker']))}>{text}\n\n"
+
+
+# Distinct background colours per speaker, cycled
+_SPEAKER_COLOURS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f"]
+
+
+@register_writer("html")
+class HtmlWriter(_Writer):
+    header = ('<html><head><meta charset="utf-8"></head>'
+              '<body style="background-color: #333333; color: #FFFFFF; font-family: Arial, sans-serif;">\n')
+    footer = '</body></html>\n'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.colours = {}
+
+    def lines(self, chunk):
+        for segment, start in zip(chunk["segments"], chunk["simple_start"]):
+            speaker = str(segment['speaker'])
+            colour = self.colours.setdefault(speaker, _SPEAKER_COLOURS[len(self.colours) % len(_SPEAKER_COLOURS)])
+            yield (f'<p>[{start}] <span style="color:{colour};font-weight:bold;">{html.escape(speaker)}</span> '
+                   f'{html.escape(segment["text"])}</p>\n')
+
+
+def _chunk(segments, formats):
+    chunk = {"segments": segments}
+    if not formats & {"srt", "vtt", "txt", "html"}:
+        return chunk
+    starts = np.fromiter((segment['start'] for segment in segments), dtype=np.float64, count=len(segments))
+    if formats & {"srt", "vtt"}:
+        ends = np.fromiter((segment['end'] for segment in segments), dtype=np.float64, count=len(segments))
+    if "srt" in formats:
+        chunk["srt_start"], chunk["srt_end"] = format_timestamps(starts), format_timestamps(ends)
+    if "vtt" in formats:
+        chunk["vtt_start"], chunk["vtt_end"] = format_timestamps(starts, '.'), format_timestamps(ends, '.')
+    if formats & {"txt", "html"}:
+        chunk["simple_start"] = format_timestamps(starts, with_millis=False)
+    return chunk
+
+
+def render(segments, outputs):
+    """
+    Write `segments` (start/end/speaker/text dicts, any iterable) once to every format in `outputs`,
+    a dict of format name -> path. Returns the number of segments written.
+    """
+    unknown = set(outputs) - set(WRITERS)
+    if unknown:
+        raise ValueError(f"unknown output format(s): {', '.join(sorted(unknown))}")
+    for path in outputs.values():
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    formats = set(outputs)
+    writers = [WRITERS[name](path) for name, path in outputs.items()]
+    count = 0
+    try:
+        batch = []
+        for segment in segments:
+            batch.append(segment)
+            if len(batch) == CHUNK_SEGMENTS:
+                chunk = _chunk(batch, formats)
+                for writer in writers:
+                    writer.write_chunk(chunk)
+                count += len(batch)
+                batch = []
+        if batch:
+            chunk = _chunk(batch, formats)
+            for writer in writers:
+                writer.write_chunk(chunk)
+            count += len(batch)
+    finally:
+        for writer in writers:
+            writer.close()
+    return count
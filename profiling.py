@@ -0,0 +1,199 @@
+"""
+Opt-in profiling of chosen pipeline stages and files.
+
+Every stage wrapped in instrumentation.stage() can be profiled; which ones is set in [Profiling]
+(or with main.py --profile/--profiler, which take precedence):
+
+    Enabled = True
+    Profiler = cprofile        # cprofile | torch | sampler
+    Stages = transcribe        # comma-separated stage names, * for all
+    Files = *interview*.mp3    # comma-separated filename globs, empty for all
+    SampleIntervalMs = 5       # sampler only
+
+Output goes to the file's results directory (or [Profiling] OutputDir) as
+<name>_<stage>_<time>.prof (cProfile, for pstats/snakeviz), .trace.json (torch.profiler CPU
+activity as a Chrome trace, for chrome://tracing or Perfetto) or .folded (the sampler's
+collapsed stacks, for flamegraph.pl or speedscope). The sampler reads the profiled thread's stack
+from another thread, so it also sees time inside C extensions (beam search, DTW, clustering) at
+much lower overhead than cProfile.
+
+When profiling is off, instrumentation.stage() only checks one module-level flag.
+"""
+import collections
+import configparser
+import contextlib
+import fnmatch
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+PROFILERS = ("cprofile", "torch", "sampler")
+_ENV = "TRANSCRIPTION_PROFILE"
+
+
+def settings():
+    """Effective settings: the --profile override (inherited by worker processes) or [Profiling]."""
+    if _ENV in os.environ:
+        return json.loads(os.environ[_ENV])
+    if not config.getboolean('Profiling', 'Enabled', fallback=False):
+        return None
+    return {
+        "profiler": config.get('Profiling', 'Profiler', fallback='cprofile').strip().lower(),
+        "stages": [s.strip() for s in config.get('Profiling', 'Stages', fallback='*').split(',') if s.strip()],
+        "files": [f.strip() for f in config.get('Profiling', 'Files', fallback='').split(',') if f.strip()],
+        "output_dir": config.get('Profiling', 'OutputDir', fallback=None),
+        "interval_ms": config.getfloat('Profiling', 'SampleIntervalMs', fallback=5.0),
+    }
+
+
+def configure(stages, profiler="cprofile", files=None, output_dir=None, interval_ms=5.0):
+    """Turn profiling on from the command line; overrides [Profiling] here and in worker processes."""
+    global active
+    if profiler not in PROFILERS:
+        raise ValueError(f"profiler must be one of {', '.join(PROFILERS)}, not {profiler!r}")
+    os.environ[_ENV] = json.dumps({
+        "profiler": profiler,
+        "stages": [s.strip() for s in stages.split(',')] if isinstance(stages, str) else list(stages),
+        "files": [f.strip() for f in files.split(',')] if isinstance(files, str) else list(files or []),
+        "output_dir": output_dir,
+        "interval_ms": interval_ms,
+    })
+    active = True
+
+
+active = settings() is not None
+
+
+def wants(stage, input_file):
+    current = settings()
+    if current is None:
+        return False
+    if '*' not in current["stages"] and stage not in current["stages"]:
+        return False
+    if current["files"] and input_file is not None:
+        name = os.path.basename(str(input_file))
+        return any(fnmatch.fnmatch(name, pattern) for pattern in current["files"])
+    return True
+
+
+def output_path(stage, input_file, suffix, output_dir=None):
+    base_name = os.path.splitext(os.path.basename(str(input_file)))[0] if input_file else "run"
+    if not output_dir:
+        results_dir = config.get('Results', 'ResultsDir', fallback='Results')
+        output_dir = os.path.join(results_dir, base_name) if input_file else os.path.join(results_dir, '.profiles')
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, f"{base_name}_{stage}_{time.strftime('%Y%m%d_%H%M%S')}{suffix}")
+
+
+@contextlib.contextmanager
+def _cprofile(path):
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+        logging.debug(summary.getvalue())
+
+
+@contextlib.contextmanager
+def _torch_profile(path):
+    import torch.profiler
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], with_stack=True) as profiler:
+        yield
+    profiler.export_chrome_trace(path)
+    logging.debug(profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds and counts identical stacks."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextlib.contextmanager
+def _sampler(path, interval_ms):
+    sampler = StackSampler(threading.get_ident(), interval_ms / 1000)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        sampler.write_folded(path)
+
+
+_SUFFIXES = {"cprofile": ".prof", "torch": ".trace.json", "sampler": ".folded"}
+
+
+@contextlib.contextmanager
+def profile(stage, input_file=None):
+    """Profile the body if [Profiling] selects this stage and file; otherwise do nothing."""
+    if not active or not wants(stage, input_file):
+        yield
+        return
+    current = settings()
+    name = current["profiler"]
+    profiler = None
+    try:
+        path = output_path(stage, input_file, _SUFFIXES[name], current.get("output_dir"))
+        if name == "torch":
+            profiler = _torch_profile(path)
+        elif name == "sampler":
+            profiler = _sampler(path, current.get("interval_ms") or 5.0)
+        else:
+            profiler = _cprofile(path)
+        profiler.__enter__()
+    except Exception as e:
+        # A missing torch, another active profiler or an unwritable directory must not fail the stage itself
+        logging.error(f"Profiling: could not start {name} for {stage} of {input_file}: {e}")
+        profiler = None
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            try:
+                profiler.__exit__(None, None, None)
+                logging.info(f"Profiling: {stage} of {input_file} written to {path}")
+            except Exception as e:
+                logging.error(f"Profiling: could not write {path}: {e}")
@@ -0,0 +1,134 @@
+"""
+Content-addressed cache for transcription and diarization results.
+
+Entries are keyed by a fingerprint of the input audio (utilities.file_fingerprint, so renamed or
+duplicated files hit the same entry) together with the model id and the effective options dict,
+so changing e.g. beam_size or the model is a miss instead of silently reusing stale results.
+
+Entries are compact JSON files under [Cache] CacheDir/<stage>/. The cache is bounded by
+[Cache] MaxSizeMB; the least recently used entries (by mtime, refreshed on every hit) are
+evicted first. Hits and misses per stage are logged with log_report().
+"""
+import configparser
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import utilities
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+_lock = threading.Lock()
+_stats = {}
+_cache_bytes = None  # total size on disk, computed lazily on the first put
+
+
+def enabled():
+    return config.getboolean('Cache', 'Enabled', fallback=True)
+
+
+def cache_dir():
+    results_dir = config.get('Results', 'ResultsDir', fallback='Results')
+    return config.get('Cache', 'CacheDir', fallback=os.path.join(results_dir, '.cache'))
+
+
+def max_size_bytes():
+    return int(config.getfloat('Cache', 'MaxSizeMB', fallback=2048) * 1024 * 1024)
+
+
+def make_key(input_file, model_id, options):
+    """Cache key for `input_file` processed by `model_id` with `options` (any JSON-serialisable dict)."""
+    payload = json.dumps(
+        {"audio": utilities.file_fingerprint(input_file), "model": model_id, "options": options},
+        sort_keys=True, default=str
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+
+def _entry_path(stage, key):
+    return os.path.join(cache_dir(), stage, key[:2], f"{key}.json")
+
+
+def _count(stage, outcome):
+    with _lock:
+        stage_stats = _stats.setdefault(stage, {"hits": 0, "misses": 0, "stores": 0})
+        stage_stats[outcome] += 1
+
+
+def get(stage, key):
+    """Return the cached result for (stage, key), or None on a miss."""
+    if not enabled():
+        return None
+    path = _entry_path(stage, key)
+    try:
+        with open(path, 'r') as f:
+            result = json.load(f)
+    except (IOError, ValueError):
+        _count(stage, "misses")
+        return None
+    # Refresh the entry's position in the LRU order
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    _count(stage, "hits")
+    logging.info(f"Cache: {stage} hit {key}")
+    return result
+
+
+def put(stage, key, result):
+    """Store a JSON-serialisable result and evict old entries if the cache is over its size limit."""
+    global _cache_bytes
+    if not enabled() or result is None:
+        return
+    path = _entry_path(stage, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f, separators=(',', ':'), default=str)
+        os.replace(tmp_path, path)
+    except (IOError, TypeError, ValueError) as e:
+        logging.error(f"Cache: failed to store {stage} result {key}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    _count(stage, "stores")
+
+    with _lock:
+        if _cache_bytes is None:
+            # First store of the process: measure what is already on disk (evicting if needed)
+            _cache_bytes = utilities.evict_least_recently_used(cache_dir(), max_size_bytes(), '.json', keep=path)
+        else:
+            _cache_bytes += os.path.getsize(path)
+            if _cache_bytes > max_size_bytes():
+                _cache_bytes = utilities.evict_least_recently_used(cache_dir(), max_size_bytes(), '.json', keep=path)
+
+
+def stats():
+    with _lock:
+        return {stage: dict(values) for stage, values in _stats.items()}
+
+
+def merge_stats(snapshots):
+    """Sum stats() snapshots, e.g. from batch_runner worker processes."""
+    merged = {}
+    for snapshot in snapshots:
+        for stage, values in snapshot.items():
+            totals = merged.setdefault(stage, {"hits": 0, "misses": 0, "stores": 0})
+            for name, value in values.items():
+                totals[name] = totals.get(name, 0) + value
+    return merged
+
+
+def log_report(stage_stats=None):
+    """Log hits/misses per stage: this process's, or `stage_stats` (see merge_stats)."""
+    for stage, values in (stats() if stage_stats is None else stage_stats).items():
+        lookups = values["hits"] + values["misses"]
+        hit_rate = values["hits"] / lookups if lookups else 0.0
+        logging.info(f"Cache: {stage} hits={values['hits']} misses={values['misses']} "
+                     f"stored={values['stores']} hit_rate={hit_rate:.0%}")
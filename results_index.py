@@ -0,0 +1,493 @@
+"""
+SQLite index of finished results, so questions across thousands of recordings are one query
+instead of opening every JSON file under [Results] ResultsDir.
+
+main.write_outputs() adds a file's rows as soon as it finishes; existing results directories are
+indexed with a process pool:
+
+    python results_index.py backfill --workers 8
+    python results_index.py files --speaker SPEAKER_01 --min-talk-minutes 20
+    python results_index.py files --model KBLab/kb-whisper-large --language sv
+    python results_index.py speakers --min-talk-minutes 20
+    python results_index.py sql "SELECT model, COUNT(*), SUM(duration) / 3600 FROM files GROUP BY model"
+
+Tables (one row per results directory, keyed by its name):
+
+    files      name, input_file, results_dir, duration, model, options_hash, segments, words,
+               speakers, mean_confidence (mean word probability), mean_logprob, wall_seconds,
+               rtf, final_mtime, indexed_at
+    languages  name, language
+    speakers   name, speaker, talk_seconds (union of the speaker's diarization turns), segments, words
+    stages     name, stage, wall_seconds (from the metrics JSONL, see instrumentation.py)
+
+model and options_hash come from the raw transcript (written there by main.transcribe_and_diarize),
+so results made before that are indexed with NULLs.
+"""
+import argparse
+import configparser
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import instrumentation
+import speaker_mapping
+import transcript_store
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    input_file TEXT,
+    results_dir TEXT NOT NULL,
+    duration REAL,
+    model TEXT,
+    options_hash TEXT,
+    segments INTEGER,
+    words INTEGER,
+    speakers INTEGER,
+    mean_confidence REAL,
+    mean_logprob REAL,
+    wall_seconds REAL,
+    rtf REAL,
+    final_mtime REAL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_model ON files (model);
+CREATE TABLE IF NOT EXISTS languages (
+    name TEXT NOT NULL,
+    language TEXT NOT NULL,
+    PRIMARY KEY (name, language)
+);
+CREATE INDEX IF NOT EXISTS languages_language ON languages (language);
+CREATE TABLE IF NOT EXISTS speakers (
+    name TEXT NOT NULL,
+    speaker TEXT NOT NULL,
+    talk_seconds REAL NOT NULL,
+    segments INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    PRIMARY KEY (name, speaker)
+);
+CREATE INDEX IF NOT EXISTS speakers_talk ON speakers (speaker, talk_seconds);
+CREATE TABLE IF NOT EXISTS stages (
+    name TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    wall_seconds REAL,
+    PRIMARY KEY (name, stage)
+);
+"""
+
+
+def enabled():
+    return config.getboolean('Index', 'Enabled', fallback=True)
+
+
+def results_dir():
+    return config.get('Results', 'ResultsDir', fallback='Results')
+
+
+def database_path():
+    return config.get('Index', 'Database', fallback=os.path.join(results_dir(), '.index.sqlite'))
+
+
+def options_hash(options):
+    """Short stable hash of a transcription options dict (stored with the raw transcript)."""
+    payload = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def connect(path=None):
+    path = path or database_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Writer threads and batch_runner worker processes add rows concurrently; WAL plus a busy timeout serializes them
+    db = sqlite3.connect(path, timeout=60, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(_SCHEMA)
+    return db
+
+
+def result_paths(directory):
+    """The files of one results directory, named as in main.construct_output_paths."""
+    base_name = os.path.basename(os.path.normpath(directory))
+    return {
+        'diarization': os.path.join(directory, f"{base_name}_diarization.json"),
+        'transcription_raw': os.path.join(directory, f"{base_name}_transcription_raw.json"),
+        'final': os.path.join(directory, f"{base_name}_final_results.json"),
+    }
+
+
+def _load_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def talk_time(turns):
+    """
+    Seconds per speaker covered by their turns, overlapping turns of one speaker counted once.
+    Turns in either schema (speaker_start/speaker_end as written by speaker_diarization.py, or start/end).
+    """
+    starts, ends = speaker_mapping.intervals_to_arrays(turns)
+    by_speaker = {}
+    for turn, start, end in zip(turns, starts.tolist(), ends.tolist()):
+        by_speaker.setdefault(turn["speaker"], []).append((start, end))
+    totals = {}
+    for speaker, spans in by_speaker.items():
+        spans.sort()
+        total, current_start, current_end = 0.0, spans[0][0], spans[0][1]
+        for start, end in spans[1:]:
+            if start > current_end:
+                total += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        totals[speaker] = total + current_end - current_start
+    return totals
+
+
+def _transcript_stats(raw_path):
+    """Languages, model, options hash, word count and confidences of a raw transcript (.npz when there is one)."""
+    npz_path = transcript_store.npz_path_for(raw_path)
+    if os.path.exists(npz_path) and (not os.path.exists(raw_path) or os.path.getmtime(npz_path) >= os.path.getmtime(raw_path)):
+        # Columns only: the words' text is never decoded
+        with transcript_store.load(npz_path) as transcript:
+            meta = transcript.meta
+            probability = transcript.column('words', 'probability').astype(np.float64)
+            logprob = transcript.column('segments', 'avg_logprob')
+            segment_languages = []
+    else:
+        result = _load_json(raw_path)
+        if not isinstance(result, dict):
+            return None
+        meta = result
+        segments = result.get("segments") or []
+        probability = np.array([word.get("probability", np.nan) for segment in segments
+                                for word in segment.get("words") or []], dtype=np.float64)
+        logprob = np.array([segment.get("avg_logprob", np.nan) for segment in segments], dtype=np.float64)
+        segment_languages = [segment.get("language") for segment in segments]
+
+    languages = [meta.get("language")] + [shard.get("language") for shard in meta.get("shards") or []] + segment_languages
+    return {
+        "languages": sorted({language for language in languages if language}),
+        "model": meta.get("model"),
+        "options_hash": meta.get("options_hash"),
+        "words": int(probability.size),
+        "mean_confidence": float(np.nanmean(probability)) if np.isfinite(probability).any() else None,
+        "mean_logprob": float(np.nanmean(logprob)) if np.isfinite(logprob).any() else None,
+    }
+
+
+def summarize(paths, input_file=None, metrics=None):
+    """
+    Index rows for one finished file from its results files (`paths` as from main.construct_output_paths)
+    and optionally its instrumentation file summary (`metrics`). None if there are no final results.
+    """
+    final = _load_json(paths['final'])
+    if not isinstance(final, list):
+        return None
+    directory = os.path.dirname(paths['final'])
+    name = os.path.basename(directory)
+    transcript = _transcript_stats(paths['transcription_raw']) or {}
+    turns = _load_json(paths['diarization']) or []
+    turn_ends = speaker_mapping.intervals_to_arrays(turns)[1].tolist()
+
+    speakers = {}
+    for segment in final:
+        entry = speakers.setdefault(segment.get("speaker"), {"talk_seconds": 0.0, "segments": 0, "words": 0})
+        entry["segments"] += 1
+        entry["words"] += len(segment.get("words") or []) or len(segment.get("text", "").split())
+    if turns:
+        for speaker, seconds in talk_time(turns).items():
+            speakers.setdefault(speaker, {"talk_seconds": 0.0, "segments": 0, "words": 0})["talk_seconds"] = seconds
+    else:
+        # No diarization file: attributed transcript time instead
+        for segment in final:
+            speakers[segment.get("speaker")]["talk_seconds"] += segment["end"] - segment["start"]
+    speakers.pop(None, None)
+
+    metrics = metrics or {}
+    duration = metrics.get("audio_seconds") or max(
+        [segment["end"] for segment in final] + turn_ends, default=None)
+    wall = metrics.get("wall_seconds")
+    return {
+        "name": name,
+        "input_file": input_file or metrics.get("file"),
+        "results_dir": os.path.abspath(directory),
+        "duration": duration,
+        "model": transcript.get("model"),
+        "options_hash": transcript.get("options_hash"),
+        "segments": len(final),
+        "words": transcript.get("words", sum(entry["words"] for entry in speakers.values())),
+        "speakers": len(speakers),
+        "mean_confidence": transcript.get("mean_confidence"),
+        "mean_logprob": transcript.get("mean_logprob"),
+        "wall_seconds": wall,
+        "rtf": wall / duration if wall and duration else None,
+        "final_mtime": os.path.getmtime(paths['final']),
+        "indexed_at": time.time(),
+        "languages": transcript.get("languages", []),
+        "speaker_rows": speakers,
+        "stages": metrics.get("stages") or {},
+    }
+
+
+def write_rows(db, rows):
+    """Replace the index rows of every summary in `rows` in one transaction."""
+    file_columns = ("name", "input_file", "results_dir", "duration", "model", "options_hash", "segments", "words",
+                    "speakers", "mean_confidence", "mean_logprob", "wall_seconds", "rtf", "final_mtime", "indexed_at")
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for row in rows:
+            name = row["name"]
+            for table in ("languages", "speakers", "stages"):
+                db.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+            db.execute(f"INSERT OR REPLACE INTO files ({', '.join(file_columns)}) VALUES ({', '.join('?' * len(file_columns))})",
+                       [row[column] for column in file_columns])
+            db.executemany("INSERT INTO languages (name, language) VALUES (?, ?)",
+                           [(name, language) for language in row["languages"]])
+            db.executemany("INSERT INTO speakers (name, speaker, talk_seconds, segments, words) VALUES (?, ?, ?, ?, ?)",
+                           [(name, str(speaker), entry["talk_seconds"], entry["segments"], entry["words"])
+                            for speaker, entry in row["speaker_rows"].items()])
+            db.executemany("INSERT INTO stages (name, stage, wall_seconds) VALUES (?, ?, ?)",
+                           [(name, stage, seconds) for stage, seconds in row["stages"].items()])
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+
+def index_file(input_file, paths, metrics=None):
+    """Add or replace one finished file in the index (called from main.write_outputs)."""
+    if not enabled():
+        return None
+    try:
+        row = summarize(paths, input_file, metrics)
+        if row is None:
+            return None
+        db = connect()
+        try:
+            write_rows(db, [row])
+        finally:
+            db.close()
+        return row
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f"Index: could not index {input_file}: {e}")
+        return None
+    except (KeyError, TypeError, ValueError):
+        # Results in a shape summarize() doesn't understand: a bug to fix, not a file to skip quietly
+        logging.exception(f"Index: unexpected results format for {input_file} in {os.path.dirname(paths['final'])}")
+        return None
+
+
+def latest_file_metrics():
+    """The last instrumentation file summary per results directory name, from the metrics JSONL."""
+    latest = {}
+    try:
+        with open(instrumentation.jsonl_path(), 'r') as f:
+            for line in f:
+                if '"type": "file"' not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("file"):
+                    latest[os.path.splitext(os.path.basename(record["file"]))[0]] = record
+    except OSError:
+        pass
+    return latest
+
+
+def _backfill_one(args):
+    directory, metrics = args
+    try:
+        return summarize(result_paths(directory), metrics=metrics)
+    except OSError as e:
+        logging.error(f"Index: could not index {directory}: {e}")
+        return None
+    except (KeyError, TypeError, ValueError):
+        logging.exception(f"Index: unexpected results format in {directory}")
+        return None
+
+
+def backfill(root=None, workers=None, force=False, batch=200):
+    """
+    Index every results directory under `root` with a process pool. Directories whose final results
+    haven't changed since they were indexed are skipped unless `force`. Returns the number indexed.
+    """
+    root = root or results_dir()
+    db = connect()
+    indexed = {} if force else dict(db.execute("SELECT name, final_mtime FROM files"))
+    todo = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_dir():
+                continue
+            try:
+                mtime = os.path.getmtime(result_paths(entry.path)['final'])
+            except OSError:
+                continue
+            if indexed.get(entry.name) != mtime:
+                todo.append(entry.path)
+    if not todo:
+        logging.info(f"Index: {root} is up to date ({len(indexed)} files)")
+        db.close()
+        return 0
+
+    metrics = latest_file_metrics()
+    workers = max(1, workers or os.cpu_count() or 1)
+    start = time.perf_counter()
+    done = 0
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        jobs = [(directory, metrics.get(os.path.basename(directory))) for directory in todo]
+        # Workers only read and summarize; all writes go through this process's connection, in batches
+        for row in pool.map(_backfill_one, jobs, chunksize=max(1, min(64, len(jobs) // (workers * 4)))):
+            if row is not None:
+                rows.append(row)
+            if len(rows) >= batch:
+                write_rows(db, rows)
+                done += len(rows)
+                rows = []
+    if rows:
+        write_rows(db, rows)
+        done += len(rows)
+    db.close()
+    logging.info(f"Index: {done} of {len(todo)} results directories indexed in {time.perf_counter() - start:.1f}s")
+    return done
+
+
+def query_files(db, model=None, language=None, speaker=None, min_talk_minutes=None, min_duration_minutes=None,
+                max_confidence=None, limit=None):
+    """Rows of `files` matching every given filter (talk time is per speaker, any speaker if none given)."""
+    where, params = [], []
+    if model:
+        where.append("f.model = ?")
+        params.append(model)
+    if language:
+        where.append("EXISTS (SELECT 1 FROM languages l WHERE l.name = f.name AND l.language = ?)")
+        params.append(language)
+    if speaker or min_talk_minutes is not None:
+        condition = "s.name = f.name"
+        if speaker:
+            condition += " AND s.speaker = ?"
+            params.append(speaker)
+        if min_talk_minutes is not None:
+            condition += " AND s.talk_seconds >= ?"
+            params.append(min_talk_minutes * 60)
+        where.append(f"EXISTS (SELECT 1 FROM speakers s WHERE {condition})")
+    if min_duration_minutes is not None:
+        where.append("f.duration >= ?")
+        params.append(min_duration_minutes * 60)
+    if max_confidence is not None:
+        where.append("f.mean_confidence <= ?")
+        params.append(max_confidence)
+    query = ("SELECT f.name, ROUND(f.duration / 60, 1) AS minutes, f.model, "
+             "(SELECT group_concat(language) FROM languages l WHERE l.name = f.name) AS languages, "
+             "f.speakers, f.segments, f.words, f.mean_confidence, f.rtf, f.input_file FROM files f"
+             + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY f.name")
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return _fetch(db, query, params)
+
+
+def query_speakers(db, speaker=None, min_talk_minutes=None, limit=None):
+    where, params = [], []
+    if speaker:
+        where.append("speaker = ?")
+        params.append(speaker)
+    if min_talk_minutes is not None:
+        where.append("talk_seconds >= ?")
+        params.append(min_talk_minutes * 60)
+    query = ("SELECT name, speaker, ROUND(talk_seconds / 60, 2) AS talk_minutes, segments, words FROM speakers"
+             + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY talk_seconds DESC")
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return _fetch(db, query, params)
+
+
+def _fetch(db, query, params=()):
+    cursor = db.execute(query, params)
+    columns = [description[0] for description in cursor.description or []]
+    return columns, cursor.fetchall()
+
+
+def _print_table(columns, rows, as_json=False):
+    if as_json:
+        for row in rows:
+            print(json.dumps(dict(zip(columns, row))))
+        return
+    cells = [[("" if value is None else f"{value:.3f}" if isinstance(value, float) else str(value)) for value in row]
+             for row in rows]
+    widths = [max([len(column)] + [len(row[i]) for row in cells]) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description="Index and query finished results")
+    parser.add_argument('--db', help="index database (default [Index] Database)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = commands.add_parser('backfill', help="index existing results directories")
+    backfill_parser.add_argument('--results-dir', help="default [Results] ResultsDir")
+    backfill_parser.add_argument('--workers', type=int, default=config.getint('Index', 'BackfillWorkers', fallback=0) or None)
+    backfill_parser.add_argument('--force', action='store_true', help="re-index directories that are already up to date")
+
+    files_parser = commands.add_parser('files', help="files matching all the given filters")
+    files_parser.add_argument('--model')
+    files_parser.add_argument('--language')
+    files_parser.add_argument('--speaker')
+    files_parser.add_argument('--min-talk-minutes', type=float, help="with --speaker: that speaker, otherwise any speaker")
+    files_parser.add_argument('--min-duration-minutes', type=float)
+    files_parser.add_argument('--max-confidence', type=float, help="mean word probability at most this")
+
+    speakers_parser = commands.add_parser('speakers', help="per-file speaker talk time, longest first")
+    speakers_parser.add_argument('--speaker')
+    speakers_parser.add_argument('--min-talk-minutes', type=float)
+
+    sql_parser = commands.add_parser('sql', help="run a read-only SQL query")
+    sql_parser.add_argument('query')
+
+    for sub in (files_parser, speakers_parser, sql_parser):
+        sub.add_argument('--limit', type=int)
+        sub.add_argument('--json', action='store_true', help="one JSON object per row")
+    args = parser.parse_args()
+
+    if args.db:
+        config.read_dict({'Index': {'Database': args.db}})
+    if args.command == 'backfill':
+        backfill(args.results_dir, args.workers, args.force)
+        sys.exit(0)
+
+    if not os.path.exists(database_path()):
+        sys.exit(f"No index at {database_path()}, run: python results_index.py backfill")
+    db = sqlite3.connect(f"file:{database_path()}?mode=ro", uri=True)
+    try:
+        if args.command == 'files':
+            columns, rows = query_files(db, args.model, args.language, args.speaker, args.min_talk_minutes,
+                                        args.min_duration_minutes, args.max_confidence, args.limit)
+        elif args.command == 'speakers':
+            columns, rows = query_speakers(db, args.speaker, args.min_talk_minutes, args.limit)
+        else:
+            columns, rows = _fetch(db, args.query)
+            rows = rows[:args.limit] if args.limit else rows
+    except sqlite3.Error as e:
+        sys.exit(f"Query failed: {e}")
+    _print_table(columns, rows, args.json)
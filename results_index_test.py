@@ -0,0 +1,82 @@
+"""
+Checks for results_index.py on results in the schema the pipeline actually writes.
+
+    python -m unittest results_index_test
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import results_index
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+class IndexRealSchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.tmp.name, 'index.sqlite')
+        results_index.config.read_dict({'Index': {'Enabled': 'True', 'Database': self.database}})
+        directory = os.path.join(self.tmp.name, 'rec')
+        os.makedirs(directory)
+        self.paths = results_index.result_paths(directory)
+        # As written by speaker_diarization.diarize_audio: speaker_start/speaker_end
+        _write_json(self.paths['diarization'], [
+            {"speaker_start": 0.0, "speaker_end": 10.0, "speaker": "SPEAKER_00"},
+            {"speaker_start": 8.0, "speaker_end": 12.0, "speaker": "SPEAKER_00"},
+            {"speaker_start": 12.0, "speaker_end": 30.5, "speaker": "SPEAKER_01"},
+        ])
+        # main.write_outputs (speaker_mapping.map_speakers_to_transcription): start/end/speaker/text
+        _write_json(self.paths['final'], [
+            {"start": 0.5, "end": 11.0, "speaker": "SPEAKER_00", "text": " Hej hej"},
+            {"start": 12.5, "end": 29.0, "speaker": "SPEAKER_01", "text": " Hej på dig"},
+        ])
+        _write_json(self.paths['transcription_raw'], {
+            "text": " Hej hej Hej på dig", "language": "sv", "model": "m", "options_hash": "abc",
+            "segments": [
+                {"start": 0.5, "end": 11.0, "text": " Hej hej", "avg_logprob": -0.2,
+                 "words": [{"word": " Hej", "start": 0.5, "end": 1.0, "probability": 0.9},
+                           {"word": " hej", "start": 1.0, "end": 11.0, "probability": 0.7}]},
+                {"start": 12.5, "end": 29.0, "text": " Hej på dig", "avg_logprob": -0.4,
+                 "words": [{"word": " Hej", "start": 12.5, "end": 13.0, "probability": 0.8}]},
+            ],
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_talk_time_accepts_both_turn_schemas(self):
+        turns = [{"speaker_start": 0.0, "speaker_end": 10.0, "speaker": "A"},
+                 {"speaker_start": 8.0, "speaker_end": 12.0, "speaker": "A"}]
+        self.assertEqual(results_index.talk_time(turns), {"A": 12.0})
+        turns = [{"start": 0.0, "end": 10.0, "speaker": "A"}, {"start": 8.0, "end": 12.0, "speaker": "A"}]
+        self.assertEqual(results_index.talk_time(turns), {"A": 12.0})
+
+    def test_index_file_writes_rows(self):
+        row = results_index.index_file('/in/rec.wav', self.paths, {"audio_seconds": 31.0, "wall_seconds": 3.1,
+                                                                   "stages": {"transcribe": 2.0}})
+        self.assertIsNotNone(row)
+        db = sqlite3.connect(self.database)
+        try:
+            name, duration, words, speakers, model = db.execute(
+                "SELECT name, duration, words, speakers, model FROM files").fetchone()
+            self.assertEqual((name, duration, words, speakers, model), ('rec', 31.0, 3, 2, 'm'))
+            talk = dict(db.execute("SELECT speaker, talk_seconds FROM speakers"))
+            self.assertEqual(talk, {"SPEAKER_00": 12.0, "SPEAKER_01": 18.5})
+            self.assertEqual(db.execute("SELECT language FROM languages").fetchall(), [('sv',)])
+        finally:
+            db.close()
+
+    def test_duration_falls_back_to_diarization_turns(self):
+        row = results_index.summarize(self.paths)
+        self.assertEqual(row["duration"], 30.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
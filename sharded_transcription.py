@@ -0,0 +1,227 @@
+"""
+Shard mode: transcribe one long recording in parallel and stitch the results.
+
+The recording is cut into K shards at silences, never inside speech: the cut points are the
+middles of the pauses found by vad.py that lie closest to the evenly spaced targets (or the
+quietest frame near the target when there is no usable pause). Each shard is transcribed in its
+own worker process, with the cores split between workers as in batch mode (batch_runner.py).
+
+Every shard except the first also decodes [Sharding] PrerollSeconds of audio before its cut. The
+model then reaches the cut with real previous text to condition on (condition_on_previous_text),
+instead of starting cold. Stitching uses ownership: each shard owns [cut_i, cut_i+1), and a
+segment or word is kept only by the shard that owns its midpoint, so text decoded twice around a
+boundary appears once. Timestamps are shifted to file time.
+
+Shards of a memory-mapped artifact (audio_store.py) are opened from the store by the workers, so
+the samples are not pickled across processes.
+"""
+import configparser
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import audio_artifact
+import batch_runner
+import vad
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+
+def settings():
+    """Shard settings, or None when shard mode is off (part of the transcription cache key)."""
+    if not config.getboolean('Sharding', 'Enabled', fallback=False):
+        return None
+    return {
+        "shards": config.getint('Sharding', 'Shards', fallback=0),
+        "min_shard_minutes": config.getfloat('Sharding', 'MinShardMinutes', fallback=10.0),
+        "preroll_seconds": config.getfloat('Sharding', 'PrerollSeconds', fallback=10.0),
+    }
+
+
+def shard_count(duration, shards=0, min_shard_minutes=10.0, workers=None):
+    """Number of shards for `duration` seconds: [Sharding] Shards, or one per core, but no shard shorter than the minimum."""
+    wanted = shards or workers or batch_runner.available_cores()
+    return max(1, min(wanted, int(duration // (min_shard_minutes * 60))))
+
+
+def should_shard(audio):
+    shard_settings = settings()
+    return (shard_settings is not None and isinstance(audio, audio_artifact.AudioArtifact)
+            and shard_count(audio.duration, shard_settings["shards"], shard_settings["min_shard_minutes"]) > 1)
+
+
+def _quietest_point(samples, sample_rate, target, search_seconds=30.0, frame_ms=30.0):
+    """Time (s) of the quietest frame within +-search_seconds of `target`."""
+    lo = max(0, int((target - search_seconds) * sample_rate))
+    hi = min(len(samples), int((target + search_seconds) * sample_rate))
+    levels = vad.frame_levels(samples[lo:hi], sample_rate, frame_ms)
+    if len(levels) == 0:
+        return target
+    return lo / sample_rate + (int(np.argmin(levels)) + 0.5) * frame_ms / 1000
+
+
+def plan_cuts(samples, sample_rate, n_shards, intervals=None):
+    """
+    Cut points (seconds) splitting the audio into `n_shards` roughly equal parts, each placed in the
+    middle of the speech pause closest to its target.
+    """
+    duration = len(samples) / sample_rate
+    if intervals is None:
+        intervals = vad.speech_intervals(samples, sample_rate)
+    # Pauses between consecutive speech intervals, as (middle, length)
+    pauses = [((end + next_start) / 2, next_start - end)
+              for (_, end), (next_start, _) in zip(intervals, intervals[1:])]
+    cuts = []
+    for i in range(1, n_shards):
+        target = duration * i / n_shards
+        candidates = [middle for middle, length in pauses
+                      if abs(middle - target) < duration / (2 * n_shards) and (not cuts or middle > cuts[-1])]
+        if candidates:
+            cuts.append(min(candidates, key=lambda middle: abs(middle - target)))
+        else:
+            cuts.append(_quietest_point(samples, sample_rate, target))
+    return cuts
+
+
+def _shard_source(audio, start, end):
+    """What a worker needs to get the shard's samples: the store path and offsets for a memory map, else the samples."""
+    samples = audio.samples
+    mapped = samples
+    # AudioArtifact may hold a plain ndarray view of the memmap np.load returned
+    while mapped is not None and not isinstance(mapped, np.memmap):
+        mapped = mapped.base if isinstance(mapped.base, np.ndarray) else None
+    if mapped is not None and getattr(mapped, 'filename', None) and len(mapped) == len(samples):
+        return ("store", mapped.filename, start, end)
+    return ("array", np.asarray(samples[start:end]))
+
+
+def _transcribe_shard(transcribe, options, source, sample_rate, offset_sec, name):
+    """Worker: transcribe one shard. Returns the whisper-style result dict with shard-relative times."""
+    if source[0] == "store":
+        _, filename, start, end = source
+        samples = np.load(filename, mmap_mode='r')[start:end]
+    else:
+        samples = source[1]
+    shard = audio_artifact.AudioArtifact(samples, sample_rate, source=name, start_sec=offset_sec)
+    result = transcribe(shard) if options is None else transcribe(shard, options)
+    if hasattr(result, 'to_dict'):
+        # stable-ts WhisperResult
+        result = result.to_dict()
+    return result
+
+
+def shift_segment(segment, offset):
+    """Copy of a whisper segment moved `offset` seconds later: start/end, its words and seek."""
+    segment = dict(segment, start=segment["start"] + offset, end=segment["end"] + offset)
+    if segment.get("words"):
+        segment["words"] = [dict(word, start=word["start"] + offset, end=word["end"] + offset)
+                            for word in segment["words"]]
+    if "seek" in segment:
+        # Mel frames (100 per second), as in whisper
+        segment["seek"] = segment["seek"] + int(round(offset * 100))
+    return segment
+
+
+def _midpoint(item):
+    return (item["start"] + item["end"]) / 2
+
+
+def stitch(shard_results, offsets, owned):
+    """
+    Merge per-shard results into one whisper-style result in file time.
+
+    `offsets[i]` is where shard i's audio starts in the file and `owned[i]` the (start, end) range
+    it is responsible for; segments and words are kept by the shard owning their midpoint.
+    """
+    segments = []
+    language = None
+    for result, offset, (own_start, own_end) in zip(shard_results, offsets, owned):
+        if not result:
+            continue
+        language = language or result.get("language")
+        for segment in result.get("segments", []):
+            segment = shift_segment(segment, offset)
+            words = segment.get("words")
+            if words:
+                kept = [word for word in words if own_start <= _midpoint(word) < own_end]
+                if not kept:
+                    continue
+                if len(kept) < len(words):
+                    # Segment straddles the cut: keep our words only
+                    segment.update(start=kept[0]["start"], end=kept[-1]["end"],
+                                   text="".join(word["word"] for word in kept))
+                segment["words"] = kept
+            elif not own_start <= _midpoint(segment) < own_end:
+                continue
+            segments.append(segment)
+
+    segments.sort(key=lambda segment: segment["start"])
+    for i, segment in enumerate(segments):
+        segment["id"] = i
+    stitched = {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": language}
+    # Per-shard VAD reports summed (prerolls are counted in both shards they belong to)
+    vad_report = vad.merge_reports(result.get("vad") for result in shard_results if result)
+    if vad_report is not None:
+        stitched["vad"] = vad_report
+    return stitched
+
+
+def transcribe_sharded(audio, transcribe, options=None, workers=None):
+    """
+    Transcribe an AudioArtifact as parallel shards with `transcribe(artifact[, options])`, which must be a
+    module-level function (e.g. transcription.transcribe_audio). Returns a whisper-style dict with
+    "text", "segments" (file time) and "language", plus a "shards" summary; None if every shard failed.
+    """
+    shard_settings = settings() or {"shards": 0, "min_shard_minutes": 10.0, "preroll_seconds": 10.0}
+    n_shards = shard_count(audio.duration, shard_settings["shards"], shard_settings["min_shard_minutes"], workers)
+    workers = min(workers or n_shards, n_shards)
+    sr = audio.sample_rate
+
+    cuts = plan_cuts(audio.samples, sr, n_shards)
+    bounds = [0.0] + cuts + [audio.duration]
+    owned = list(zip(bounds[:-1], bounds[1:]))
+    offsets = [max(0.0, start - shard_settings["preroll_seconds"]) if i else 0.0 for i, (start, _) in enumerate(owned)]
+    logging.info(f"Sharding: {audio.source} ({audio.duration:.0f}s) into {n_shards} shards cut at "
+                 f"{', '.join(f'{cut:.1f}s' for cut in cuts)} across {workers} workers")
+
+    start_time = time.perf_counter()
+    threads = batch_runner.thread_budget(workers)
+    context = multiprocessing.get_context("spawn")
+    with batch_runner.worker_thread_env(threads), \
+            ProcessPoolExecutor(workers, mp_context=context, initializer=batch_runner.init_worker, initargs=(threads,)) as pool:
+        futures = [
+            pool.submit(_transcribe_shard, transcribe, options,
+                        _shard_source(audio, int(offset * sr), int(own_end * sr)), sr,
+                        audio.start_sec + offset, f"{audio.source}#shard{i}")
+            for i, (offset, (_, own_end)) in enumerate(zip(offsets, owned))
+        ]
+        shard_results = []
+        for i, future in enumerate(futures):
+            try:
+                shard_results.append(future.result())
+            except Exception as e:
+                logging.error(f"Sharding: shard {i} of {audio.source} failed: {e}")
+                shard_results.append(None)
+
+    if not any(shard_results):
+        return None
+    result = stitch(shard_results, offsets, owned)
+    result["shards"] = [{"start": start, "end": end, "ok": bool(shard), "language": shard.get("language") if shard else None}
+                        for (start, end), shard in zip(owned, shard_results)]
+    logging.info(f"Sharding: {audio.source} transcribed in {time.perf_counter() - start_time:.1f}s "
+                 f"({len(result['segments'])} segments)")
+    if not is_complete(result):
+        failed = [f"{shard['start']:.0f}-{shard['end']:.0f}s" for shard in result["shards"] if not shard["ok"]]
+        logging.warning(f"Sharding: {audio.source} is missing {', '.join(failed)} (failed shards), "
+                        f"the result will not be cached")
+    return result
+
+
+def is_complete(result):
+    """False for a sharded result with failed shards (a hole in the transcript); it must not be cached."""
+    return all(shard["ok"] for shard in result.get("shards") or [])
@@ -1,28 +1,40 @@
 import json
 import logging
-import torch
-from pyannote.audio import Pipeline
 import configparser
-import torchaudio 
+import model_registry
+import audio_artifact
 
 # Load configurations
 config = configparser.ConfigParser()
 config.read('config.ini')
 
+def get_pipeline():
+    model_id = config.get('Models', 'DiarizationModel', fallback="pyannote/speaker-diarization-3.1")
+    # Ensure GPU if possible
+    device = model_registry.default_device()
+
+    def load_pipeline():
+        import torch
+        from pyannote.audio import Pipeline
+        pipeline = Pipeline.from_pretrained(model_id, use_auth_token=config.get('Models', 'AuthToken'))
+        pipeline.to(torch.device(device))
+        return pipeline
+
+    return model_registry.get_model(model_id, load_pipeline, device=device)
+
 def diarize_audio(input_audio_file, num_speakers=None, min_speakers=None, max_speakers=None):
     try:
-        # Load the pre-trained diarization pipeline with configurations
-        pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1",
-            use_auth_token=config.get('Models', 'AuthToken')
-        )
-
-        # Ensure GPU if possible
-        pipeline.to(torch.device("cuda" if torch.cuda.is_available() else "cpu"))
-
-        # Load audio into memory for faster processing (optional)
-        waveform, sample_rate = torchaudio.load(input_audio_file)
-        audio_data = {"waveform": waveform, "sample_rate": sample_rate}
+        # The pre-trained diarization pipeline is loaded once per process and reused for every file
+        pipeline = get_pipeline()
+
+        if isinstance(input_audio_file, audio_artifact.AudioArtifact):
+            # Already decoded: share the 16 kHz buffer with the transcription stage
+            audio_data = input_audio_file.as_pyannote()
+        else:
+            # Load audio into memory for faster processing (optional)
+            import torchaudio
+            waveform, sample_rate = torchaudio.load(input_audio_file)
+            audio_data = {"waveform": waveform, "sample_rate": sample_rate}
 
         # Run the pipeline with progress monitoring
         from pyannote.audio.pipelines.utils.hook import ProgressHook
@@ -0,0 +1,244 @@
+"""
+Interval engine for attributing diarization speakers to transcript segments.
+
+Instead of comparing every transcript segment with every diarization turn, the turns are
+sorted once and the overlap of any segment [a, b] with all turns of a speaker is read off
+a cumulative "talk time" function built from prefix sums:
+
+    C(t) = sum(t - start_i for start_i < t) - sum(t - end_i for end_i < t)
+
+so overlap(a, b) = C(b) - C(a). Each C(t) is two np.searchsorted lookups, which gives
+O((N + M) log M) for N segments and M turns.
+
+Word-level attribution (map_speakers_to_words) maps every word's midpoint to the diarization
+turns active at that instant, again with np.searchsorted over the sorted turn boundaries, and
+splits segments wherever the speaker changes between consecutive words. It is O(W log M) for W
+words.
+
+Both result schemas are supported: main.py stores turns as start/end, speaker_diarization.py
+(and main_test.py) as speaker_start/speaker_end.
+"""
+import numpy as np
+
+OVERLAPPED = "OVERLAPPED"
+
+
+def _interval_keys(item):
+    """Return the (start, end) keys used by a segment or diarization turn."""
+    if "speaker_start" in item:
+        return "speaker_start", "speaker_end"
+    return "start", "end"
+
+
+def intervals_to_arrays(items):
+    """Convert a list of dicts (either key schema) to float64 start and end arrays."""
+    if not items:
+        return np.empty(0), np.empty(0)
+    start_key, end_key = _interval_keys(items[0])
+    starts = np.fromiter((item[start_key] for item in items), dtype=np.float64, count=len(items))
+    ends = np.fromiter((item[end_key] for item in items), dtype=np.float64, count=len(items))
+    return starts, ends
+
+
+def diarization_to_arrays(diarization_results):
+    """Split diarization turns into start/end arrays, a speaker index per turn and the speaker labels."""
+    turn_starts, turn_ends = intervals_to_arrays(diarization_results)
+    speakers, speaker_idx = np.unique([turn["speaker"] for turn in diarization_results], return_inverse=True)
+    return turn_starts, turn_ends, speaker_idx.astype(np.intp), [str(s) for s in speakers]
+
+
+def _talk_time(times, sorted_starts, start_prefix, sorted_ends, end_prefix):
+    """Evaluate C(t) for every t in `times` for one set of turns."""
+    n_started = np.searchsorted(sorted_starts, times, side="left")
+    n_ended = np.searchsorted(sorted_ends, times, side="left")
+    return (n_started * times - start_prefix[n_started]) - (n_ended * times - end_prefix[n_ended])
+
+
+def speaker_overlap_matrix(seg_starts, seg_ends, turn_starts, turn_ends, speaker_idx, n_speakers):
+    """
+    Overlap duration in seconds between every segment and every speaker.
+
+    Returns an (N, n_speakers) float64 array. If turns of the same speaker overlap each other,
+    their overlaps with a segment are summed.
+    """
+    seg_starts = np.asarray(seg_starts, dtype=np.float64)
+    seg_ends = np.asarray(seg_ends, dtype=np.float64)
+    overlaps = np.zeros((len(seg_starts), n_speakers))
+
+    for s in range(n_speakers):
+        mask = speaker_idx == s
+        sorted_starts = np.sort(turn_starts[mask])
+        sorted_ends = np.sort(turn_ends[mask])
+        start_prefix = np.concatenate(([0.0], np.cumsum(sorted_starts)))
+        end_prefix = np.concatenate(([0.0], np.cumsum(sorted_ends)))
+        overlaps[:, s] = (_talk_time(seg_ends, sorted_starts, start_prefix, sorted_ends, end_prefix)
+                          - _talk_time(seg_starts, sorted_starts, start_prefix, sorted_ends, end_prefix))
+
+    # Prefix-sum differences leave rounding residue (well under a microsecond) where there is no overlap
+    overlaps[overlaps < 1e-6] = 0.0
+    return overlaps
+
+
+def majority_speakers(overlaps, speakers, overlap_threshold):
+    """
+    Pick the overlap-weighted majority speaker for each row of an overlap matrix.
+
+    A segment is labelled OVERLAPPED when nobody overlaps it or when the majority speaker's share
+    of the total overlap is below `overlap_threshold`.
+    """
+    if overlaps.shape[1] == 0:
+        return [OVERLAPPED] * overlaps.shape[0]
+    total = overlaps.sum(axis=1)
+    best = overlaps.argmax(axis=1)
+    best_overlap = overlaps[np.arange(len(best)), best]
+    share = np.divide(best_overlap, total, out=np.zeros_like(total), where=total > 0)
+
+    labels = np.asarray(speakers, dtype=object)[best]
+    labels[(total <= 0) | (share < overlap_threshold)] = OVERLAPPED
+    return labels.tolist()
+
+
+def assign_speakers(segments, diarization_results, overlap_threshold):
+    """Return one speaker label per segment (either key schema for both inputs)."""
+    seg_starts, seg_ends = intervals_to_arrays(segments)
+    if not diarization_results:
+        return [OVERLAPPED] * len(segments)
+    turn_starts, turn_ends, speaker_idx, speakers = diarization_to_arrays(diarization_results)
+    overlaps = speaker_overlap_matrix(seg_starts, seg_ends, turn_starts, turn_ends, speaker_idx, len(speakers))
+    return majority_speakers(overlaps, speakers, overlap_threshold)
+
+
+def map_speakers_to_transcription(transcription_results, diarization_results, overlap_threshold):
+    """Build the final start/end/speaker/text records from transcript segments and diarization turns."""
+    speakers = assign_speakers(transcription_results, diarization_results, overlap_threshold)
+    start_key, end_key = _interval_keys(transcription_results[0]) if transcription_results else ("start", "end")
+    return [
+        {
+            "start": transcript[start_key],
+            "end": transcript[end_key],
+            "speaker": speaker_id,
+            "text": transcript["text"]
+        }
+        for transcript, speaker_id in zip(transcription_results, speakers)
+    ]
+
+
+def _nearest_turn_speaker(times, turn_starts, turn_ends, speaker_idx):
+    """Speaker index of the turn closest to each time (for times that fall in gaps between turns)."""
+    order = np.argsort(turn_starts, kind="stable")
+    sorted_starts = turn_starts[order]
+    ends = turn_ends[order]
+    # Turn with the latest end among those starting at or before t: the closest one behind t
+    latest = np.maximum.accumulate(ends)
+    new_max = np.r_[True, ends[1:] > latest[:-1]]
+    latest_turn = np.maximum.accumulate(np.where(new_max, np.arange(len(ends)), 0))
+
+    n_before = np.searchsorted(sorted_starts, times, side="right")
+    before = np.maximum(n_before - 1, 0)
+    after = np.minimum(n_before, len(sorted_starts) - 1)
+    gap_before = np.where(n_before > 0, times - latest[before], np.inf)
+    gap_after = np.where(n_before < len(sorted_starts), sorted_starts[after] - times, np.inf)
+    nearest = np.where(gap_before <= gap_after, latest_turn[before], after)
+    return speaker_idx[order][nearest]
+
+
+def word_speakers(word_starts, word_ends, turn_starts, turn_ends, speaker_idx, n_speakers, overlap_threshold):
+    """
+    Speaker index per word, -1 for OVERLAPPED.
+
+    A word belongs to the speaker whose turn contains its midpoint. Where turns of several
+    speakers contain it (cross-talk) the word goes to the speaker with the most overlap over the
+    word's whole span, with the same OVERLAPPED threshold as for segments. Words in gaps between
+    turns go to the nearest turn.
+    """
+    word_starts = np.asarray(word_starts, dtype=np.float64)
+    word_ends = np.asarray(word_ends, dtype=np.float64)
+    midpoints = (word_starts + word_ends) / 2
+    labels = np.full(len(midpoints), -1, dtype=np.intp)
+    if len(midpoints) == 0 or len(turn_starts) == 0:
+        return labels
+
+    # Number of active turns of each speaker at each midpoint; turns cover [start, end)
+    active = np.zeros((len(midpoints), n_speakers), dtype=np.int32)
+    for s in range(n_speakers):
+        mask = speaker_idx == s
+        active[:, s] = (np.searchsorted(np.sort(turn_starts[mask]), midpoints, side="right")
+                        - np.searchsorted(np.sort(turn_ends[mask]), midpoints, side="right"))
+    n_active = np.count_nonzero(active > 0, axis=1)
+
+    single = n_active == 1
+    labels[single] = np.argmax(active[single] > 0, axis=1)
+
+    crosstalk = np.flatnonzero(n_active > 1)
+    if len(crosstalk):
+        overlaps = speaker_overlap_matrix(word_starts[crosstalk], word_ends[crosstalk],
+                                          turn_starts, turn_ends, speaker_idx, n_speakers)
+        overlaps[active[crosstalk] == 0] = 0.0
+        picked = majority_speakers(overlaps, list(range(n_speakers)), overlap_threshold)
+        labels[crosstalk] = [-1 if label == OVERLAPPED else label for label in picked]
+
+    gaps = np.flatnonzero(n_active == 0)
+    if len(gaps):
+        labels[gaps] = _nearest_turn_speaker(midpoints[gaps], turn_starts, turn_ends, speaker_idx)
+    return labels
+
+
+def label_words(words, diarization_results, overlap_threshold):
+    """
+    Speaker index per word (start/end dicts) and the speaker names it indexes; index -1 is
+    OVERLAPPED, so names[label] always works.
+    """
+    word_starts = np.fromiter((word["start"] for word in words), dtype=np.float64, count=len(words))
+    word_ends = np.fromiter((word["end"] for word in words), dtype=np.float64, count=len(words))
+    if not diarization_results:
+        return np.full(len(words), -1, dtype=np.intp), [OVERLAPPED]
+    turn_starts, turn_ends, speaker_idx, speakers = diarization_to_arrays(diarization_results)
+    labels = word_speakers(word_starts, word_ends, turn_starts, turn_ends, speaker_idx, len(speakers), overlap_threshold)
+    return labels, speakers + [OVERLAPPED]
+
+
+def map_speakers_to_words(segments, diarization_results, overlap_threshold):
+    """
+    Word-level map_speakers_to_transcription: start/end/speaker/text records with one speaker each: segments with word timestamps are cut
+    wherever the word speaker changes, segments without words keep a segment-level speaker.
+    """
+    if not segments:
+        return []
+    start_key, end_key = _interval_keys(segments[0])
+    word_lists = [segment.get("words") or [] for segment in segments]
+    counts = np.fromiter((len(words) for words in word_lists), dtype=np.intp, count=len(segments))
+    words = [word for words in word_lists for word in words]
+    labels, names = label_words(words, diarization_results, overlap_threshold)
+
+    # A run of words starts at every segment start and at every speaker change inside a segment
+    owner = np.repeat(np.arange(len(segments)), counts)
+    run_starts = np.flatnonzero(np.r_[True, (owner[1:] != owner[:-1]) | (labels[1:] != labels[:-1])]) if len(words) else np.empty(0, np.intp)
+    run_ends = np.r_[run_starts[1:], len(words)].astype(np.intp)
+    run_owner = owner[run_starts]
+
+    wordless = [segments[i] for i in np.flatnonzero(counts == 0)]
+    wordless_speakers = iter(assign_speakers(wordless, diarization_results, overlap_threshold))
+
+    results = []
+    run = 0
+    for i, segment in enumerate(segments):
+        if counts[i] == 0:
+            results.append({"start": segment[start_key], "end": segment[end_key],
+                            "speaker": next(wordless_speakers), "text": segment["text"]})
+            continue
+        while run < len(run_starts) and run_owner[run] == i:
+            a, b = run_starts[run], run_ends[run]
+            if b - a == counts[i]:
+                # One speaker for the whole segment: keep it as it is
+                results.append({"start": segment[start_key], "end": segment[end_key],
+                                "speaker": names[labels[a]], "text": segment["text"]})
+                run += 1
+                continue
+            results.append({
+                "start": words[a]["start"],
+                "end": words[b - 1]["end"],
+                "speaker": names[labels[a]],
+                "text": "".join(word["word"] for word in words[a:b]),
+            })
+            run += 1
+    return results
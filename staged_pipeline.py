@@ -0,0 +1,163 @@
+"""
+Bounded producer/consumer pipeline for processing a directory of files.
+
+    decode pool  --(queue, PrefetchDepth)-->  model stage  --(queue, PrefetchDepth)-->  writer pool
+
+The decode/preprocess pool stays up to PrefetchDepth files ahead of the model stage, which runs
+on the calling thread (models are not shared across threads), and finished results are handed
+to a writer pool so JSON/SRT/MP4 output never blocks the next transcription. Per-stage busy and
+idle time is logged at the end of the run.
+"""
+import configparser
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, failed=False):
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += seconds
+            self.failures += int(failed)
+
+    def idle_seconds(self, wall_seconds):
+        # Worker-seconds available to the stage that were not spent doing work
+        return max(0.0, wall_seconds * self.workers - self.busy_seconds)
+
+    def log(self, wall_seconds):
+        logging.info(
+            f"Pipeline stage {self.name}: {self.items} files ({self.failures} failed), "
+            f"busy {self.busy_seconds:.1f}s, idle {self.idle_seconds(wall_seconds):.1f}s "
+            f"across {self.workers} worker(s)"
+        )
+
+
+def pipeline_settings():
+    """Queue depth and worker counts from the [Pipeline] config section."""
+    return {
+        "queue_depth": config.getint('Pipeline', 'PrefetchDepth', fallback=2),
+        "decode_workers": config.getint('Pipeline', 'DecodeWorkers', fallback=2),
+        "writer_workers": config.getint('Pipeline', 'WriterWorkers', fallback=1),
+    }
+
+
+def _timed(stats, func, *args, none_is_failure=True):
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    except Exception:
+        stats.record(time.perf_counter() - start, failed=True)
+        raise
+    stats.record(time.perf_counter() - start, failed=none_is_failure and result is None)
+    return result
+
+
+def run_pipeline(items, preprocess, process, write, queue_depth=None, decode_workers=None, writer_workers=None):
+    """
+    Run preprocess(item) -> process(item, prepared) -> write(item, result) over `items`.
+
+    A stage returning None (or raising) drops that item from the later stages; failures are logged
+    and never stop the rest of the batch. Items enter the model stage in input order.
+    Returns a dict of StageStats keyed by stage name.
+    """
+    settings = pipeline_settings()
+    queue_depth = max(1, queue_depth or settings["queue_depth"])
+    decode_workers = max(1, decode_workers or settings["decode_workers"])
+    writer_workers = max(1, writer_workers or settings["writer_workers"])
+
+    stats = {
+        "decode": StageStats("decode", decode_workers),
+        "model": StageStats("model"),
+        "write": StageStats("write", writer_workers),
+    }
+    model_wait = 0.0
+    prefetched = queue.Queue(maxsize=queue_depth)
+    write_slots = threading.Semaphore(queue_depth)
+    stop = threading.Event()
+    wall_start = time.perf_counter()
+
+    with ThreadPoolExecutor(decode_workers, thread_name_prefix="decode") as decode_pool, \
+            ThreadPoolExecutor(writer_workers, thread_name_prefix="write") as write_pool:
+
+        def produce():
+            # Submitting blocks once queue_depth decodes are pending, which bounds memory
+            try:
+                for item in items:
+                    if stop.is_set():
+                        break
+                    prefetched.put((item, decode_pool.submit(_timed, stats["decode"], preprocess, item)))
+            finally:
+                prefetched.put(_DONE)
+
+        producer = threading.Thread(target=produce, name="prefetch", daemon=True)
+        producer.start()
+
+        def write_and_release(item, result):
+            try:
+                _timed(stats["write"], write, item, result, none_is_failure=False)
+            except Exception as e:
+                logging.error(f"Pipeline: error writing results for {item}: {e}")
+            finally:
+                write_slots.release()
+
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                entry = prefetched.get()
+                if entry is _DONE:
+                    break
+                item, future = entry
+                try:
+                    prepared = future.result()
+                except Exception as e:
+                    logging.error(f"Pipeline: error preprocessing {item}: {e}")
+                    prepared = None
+                model_wait += time.perf_counter() - wait_start
+                if prepared is None:
+                    continue
+
+                try:
+                    result = _timed(stats["model"], process, item, prepared)
+                except Exception as e:
+                    logging.error(f"Pipeline: error processing {item}: {e}")
+                    continue
+                del prepared
+                if result is None:
+                    continue
+
+                wait_start = time.perf_counter()
+                write_slots.acquire()
+                model_wait += time.perf_counter() - wait_start
+                write_pool.submit(write_and_release, item, result)
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting on a full queue
+            while producer.is_alive():
+                try:
+                    prefetched.get_nowait()
+                except queue.Empty:
+                    producer.join(0.05)
+
+    wall_seconds = time.perf_counter() - wall_start
+    for stage in stats.values():
+        stage.log(wall_seconds)
+    logging.info(f"Pipeline: model stage waited {model_wait:.1f}s for decoded input or writer slots "
+                 f"over {wall_seconds:.1f}s wall time")
+    return stats
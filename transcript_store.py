@@ -0,0 +1,344 @@
+"""
+Columnar binary store for word-level transcripts (.npz).
+
+A raw Whisper result saved with json.dump(indent=4) is mostly whitespace, repeated keys and
+token lists, and reading it back builds a Python dict per word. Here the same result is kept as
+NumPy arrays in one .npz:
+
+    segments   structured array: start, end, avg_logprob, no_speech_prob, compression_ratio,
+               temperature, seek, id, text, speaker, extra, word_start, word_count, token_start, token_count
+    words      structured array: start, end, probability, word, speaker, extra
+    tokens     int32, all segments' tokens back to back
+    strings    utf-8 blob + offsets: every text, word and speaker label, stored once (interned)
+    meta       JSON of the top-level fields (language, vad, ...)
+
+text/word/speaker/extra columns are indices into the string table (-1 = missing). Fields the
+columns don't cover (e.g. extra stable-ts keys) are kept as a JSON string in `extra`, so
+to_dict(from_dict(result)) == result.
+
+load() is lazy: np.load only reads a member of the archive when that column is first used, so
+asking for word probabilities does not decode the text table. Convert with
+
+    python transcript_store.py import file_transcription_raw.json   # -> .npz next to it
+    python transcript_store.py export file_transcription_raw.npz    # -> .json next to it
+"""
+import argparse
+import configparser
+import functools
+import json
+import os
+
+import numpy as np
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+SEGMENT_DTYPE = np.dtype([
+    ('start', 'f8'), ('end', 'f8'), ('avg_logprob', 'f8'), ('no_speech_prob', 'f8'),
+    ('compression_ratio', 'f8'), ('temperature', 'f8'), ('seek', 'i8'), ('id', 'i8'),
+    ('text', 'i4'), ('speaker', 'i4'), ('extra', 'i4'),
+    ('word_start', 'i8'), ('word_count', 'i4'), ('token_start', 'i8'), ('token_count', 'i4'),
+])
+# Whisper word probabilities come from float32 tensors, so float32 loses nothing; results with
+# probabilities that aren't float32 values (e.g. rounded ones) are stored with float64 instead
+WORD_DTYPE = np.dtype([
+    ('start', 'f8'), ('end', 'f8'), ('probability', 'f4'), ('word', 'i4'), ('speaker', 'i4'), ('extra', 'i4'),
+])
+_WORD_DTYPE_F8 = np.dtype([(name, 'f8' if name == 'probability' else WORD_DTYPE[name]) for name in WORD_DTYPE.names])
+
+_SEGMENT_FLOATS = ('start', 'end', 'avg_logprob', 'no_speech_prob', 'compression_ratio', 'temperature')
+_SEGMENT_INTS = ('seek', 'id')
+_SEGMENT_KEYS = set(_SEGMENT_FLOATS) | set(_SEGMENT_INTS) | {'text', 'speaker', 'words', 'tokens'}
+_WORD_KEYS = {'start', 'end', 'probability', 'word', 'speaker'}
+# Columns that were missing in the source are NaN / this sentinel, and are left out again on export
+_MISSING_INT = np.iinfo(np.int64).min
+
+
+class _Interner:
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def add(self, value):
+        if value is None:
+            return -1
+        position = self.index.get(value)
+        if position is None:
+            position = self.index[value] = len(self.values)
+            self.values.append(value)
+        return position
+
+    def arrays(self):
+        encoded = [value.encode('utf-8') for value in self.values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+
+def _fits(key, value, numeric):
+    if key in numeric:
+        return _is_number(value)
+    if key in ('words', 'tokens'):
+        return isinstance(value, list)
+    return isinstance(value, str)
+
+
+def _extra(item, known, strings, numeric=()):
+    """Fields without a column, plus column fields whose value doesn't fit it (e.g. None), as interned JSON."""
+    extra = {key: value for key, value in item.items() if key not in known or not _fits(key, value, numeric)}
+    return strings.add(json.dumps(extra, separators=(',', ':'), ensure_ascii=False)) if extra else -1
+
+
+def _string(item, key):
+    value = item.get(key)
+    return value if isinstance(value, str) else None
+
+
+def _number(item, key, missing):
+    value = item.get(key)
+    return value if _is_number(value) else missing
+
+
+def from_dict(result):
+    """Column arrays (a dict of name -> ndarray) for a Whisper-style result dict."""
+    segments_in = result.get("segments", [])
+    strings = _Interner()
+    segments = np.zeros(len(segments_in), dtype=SEGMENT_DTYPE)
+    n_words = sum(len(segment.get("words") or []) for segment in segments_in)
+    n_tokens = sum(len(segment.get("tokens") or []) for segment in segments_in)
+    words = np.zeros(n_words, dtype=_WORD_DTYPE_F8)
+    tokens = np.zeros(n_tokens, dtype=np.int32)
+
+    w = t = 0
+    for i, segment in enumerate(segments_in):
+        row = segments[i]
+        for key in _SEGMENT_FLOATS:
+            row[key] = _number(segment, key, np.nan)
+        for key in _SEGMENT_INTS:
+            row[key] = _number(segment, key, _MISSING_INT)
+        row['text'] = strings.add(_string(segment, "text"))
+        row['speaker'] = strings.add(_string(segment, "speaker"))
+        row['extra'] = _extra(segment, _SEGMENT_KEYS, strings, _SEGMENT_FLOATS + _SEGMENT_INTS)
+
+        segment_words = segment.get("words")
+        row['word_start'] = w if segment_words is not None else -1
+        row['word_count'] = len(segment_words or [])
+        for word in segment_words or []:
+            words[w] = (_number(word, "start", np.nan), _number(word, "end", np.nan), _number(word, "probability", np.nan),
+                        strings.add(_string(word, "word")), strings.add(_string(word, "speaker")),
+                        _extra(word, _WORD_KEYS, strings, ("start", "end", "probability")))
+            w += 1
+
+        segment_tokens = segment.get("tokens")
+        row['token_start'] = t if segment_tokens is not None else -1
+        row['token_count'] = len(segment_tokens or [])
+        if segment_tokens:
+            tokens[t:t + len(segment_tokens)] = segment_tokens
+            t += len(segment_tokens)
+
+    probability = words['probability']
+    if np.array_equal(probability.astype(np.float32).astype(np.float64), probability, equal_nan=True):
+        words = words.astype(WORD_DTYPE)
+
+    blob, offsets = strings.arrays()
+    meta = {key: value for key, value in result.items() if key not in ("segments", "text")}
+    meta["has_text"] = "text" in result
+    if "text" in result and result["text"] != "".join(segment.get("text") or "" for segment in segments_in):
+        # Usually the joined segment texts; only stored when it isn't
+        meta["text"] = result["text"]
+    return {
+        "segments": segments, "words": words, "tokens": tokens,
+        "strings": blob, "string_offsets": offsets,
+        "meta": np.frombuffer(json.dumps(meta, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+    }
+
+
+def save(result, path, compress=False):
+    """Write a Whisper-style result dict to `path` (.npz). Uncompressed by default: loading is then just reads."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    (np.savez_compressed if compress else np.savez)(tmp_path, **from_dict(result))
+    os.replace(tmp_path, path)
+
+
+class Transcript:
+    """Lazily loaded columnar transcript; each column is read from the archive on first access."""
+
+    def __init__(self, path):
+        self.path = path
+        self._archive = np.load(path, allow_pickle=False)
+
+    def close(self):
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @functools.cached_property
+    def segments(self):
+        return self._archive["segments"]
+
+    @functools.cached_property
+    def words(self):
+        return self._archive["words"]
+
+    @functools.cached_property
+    def tokens(self):
+        return self._archive["tokens"]
+
+    @functools.cached_property
+    def meta(self):
+        return json.loads(self._archive["meta"].tobytes().decode('utf-8'))
+
+    @functools.cached_property
+    def _string_table(self):
+        return self._archive["strings"].tobytes(), self._archive["string_offsets"]
+
+    @functools.cached_property
+    def strings(self):
+        """The interned string table as a list (decoded on first use)."""
+        blob, offsets = self._string_table
+        return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+    def string(self, index):
+        if index < 0:
+            return None
+        blob, offsets = self._string_table
+        return blob[offsets[index]:offsets[index + 1]].decode('utf-8')
+
+    def column(self, table, name):
+        """One column, e.g. column('words', 'probability'); string columns are returned as indices."""
+        return getattr(self, table)[name]
+
+    def texts(self, table='segments', name='text'):
+        """A string column resolved to Python strings (None where missing)."""
+        strings = self.strings
+        return [strings[i] if i >= 0 else None for i in self.column(table, name).tolist()]
+
+    def segment_words(self, i):
+        """Slice of the words table belonging to segment i."""
+        row = self.segments[i]
+        if row['word_start'] < 0:
+            return self.words[:0]
+        return self.words[row['word_start']:row['word_start'] + row['word_count']]
+
+    def to_dict(self):
+        """The original Whisper-style result dict."""
+        strings = self.strings
+        lookup = lambda i: strings[i] if i >= 0 else None
+        words = self.words.tolist()
+        tokens = self.tokens.tolist()
+        names = SEGMENT_DTYPE.names
+
+        segments = []
+        for values in self.segments.tolist():
+            row = dict(zip(names, values))
+            segment = {}
+            for key in ('id', 'seek'):
+                if row[key] != _MISSING_INT:
+                    segment[key] = row[key]
+            for key in ('start', 'end'):
+                if row[key] == row[key]:  # not NaN
+                    segment[key] = row[key]
+            if row['text'] >= 0:
+                segment['text'] = strings[row['text']]
+            if row['token_start'] >= 0:
+                segment['tokens'] = tokens[row['token_start']:row['token_start'] + row['token_count']]
+            for key in ('temperature', 'avg_logprob', 'compression_ratio', 'no_speech_prob'):
+                if row[key] == row[key]:
+                    segment[key] = row[key]
+            if row['word_start'] >= 0:
+                segment['words'] = []
+                for start, end, probability, word, speaker, extra in words[row['word_start']:row['word_start'] + row['word_count']]:
+                    entry = {}
+                    if word >= 0:
+                        entry['word'] = strings[word]
+                    if start == start:
+                        entry['start'] = start
+                    if end == end:
+                        entry['end'] = end
+                    if probability == probability:
+                        entry['probability'] = probability
+                    if speaker >= 0:
+                        entry['speaker'] = strings[speaker]
+                    if extra >= 0:
+                        entry.update(json.loads(strings[extra]))
+                    segment['words'].append(entry)
+            if row['speaker'] >= 0:
+                segment['speaker'] = lookup(row['speaker'])
+            if row['extra'] >= 0:
+                segment.update(json.loads(strings[row['extra']]))
+            segments.append(segment)
+
+        meta = dict(self.meta)
+        result = {}
+        text = meta.pop("text", None)
+        if meta.pop("has_text", True):
+            result["text"] = text if text is not None else "".join(segment.get("text", "") for segment in segments)
+        result["segments"] = segments
+        result.update(meta)
+        return result
+
+
+def load(path):
+    return Transcript(path)
+
+
+def enabled():
+    """[Results] ColumnarTranscripts: also write raw transcripts as .npz next to the JSON."""
+    return config.getboolean('Results', 'ColumnarTranscripts', fallback=True)
+
+
+def npz_path_for(json_path):
+    return os.path.splitext(json_path)[0] + '.npz'
+
+
+def load_result(path):
+    """
+    Result dict from a .npz or JSON file. For a JSON path, the .npz next to it is used instead when it
+    is at least as new (it is written together with the JSON), which is much faster to read.
+    """
+    npz_path = path if path.endswith('.npz') else npz_path_for(path)
+    if os.path.exists(npz_path) and (npz_path == path or not os.path.exists(path)
+                                     or os.path.getmtime(npz_path) >= os.path.getmtime(path)):
+        with Transcript(npz_path) as transcript:
+            return transcript.to_dict()
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def json_to_npz(json_path, npz_path=None, compress=False):
+    npz_path = npz_path or os.path.splitext(json_path)[0] + '.npz'
+    with open(json_path, 'r') as f:
+        save(json.load(f), npz_path, compress)
+    return npz_path
+
+
+def npz_to_json(npz_path, json_path=None, indent=4):
+    json_path = json_path or os.path.splitext(npz_path)[0] + '.json'
+    with Transcript(npz_path) as transcript:
+        result = transcript.to_dict()
+    with open(json_path, 'w') as f:
+        json.dump(result, f, indent=indent)
+    return json_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert transcripts between JSON and the columnar .npz format")
+    parser.add_argument('direction', choices=['import', 'export'], help="import: JSON -> .npz, export: .npz -> JSON")
+    parser.add_argument('input')
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--compress', action='store_true', help="zip-compress the .npz (smaller, slower to load)")
+    args = parser.parse_args()
+    if args.direction == 'import':
+        print(json_to_npz(args.input, args.output, args.compress))
+    else:
+        print(npz_to_json(args.input, args.output))
@@ -1,14 +1,20 @@
-import whisper
 import logging
 import configparser
+import model_registry
+import audio_artifact
+import vad
 
 # Load configurations
 config = configparser.ConfigParser()
 config.read('config.ini')
 
-# Load the Whisper model based on configuration
-modelId = config.get('Whisper', 'ModelID')
-model = whisper.load_model(modelId)
+
+def get_model():
+    """Load the Whisper model based on configuration, on first use (whisper/torch are imported lazily)."""
+    import whisper
+    modelId = config.get('Whisper', 'ModelID')
+    device = model_registry.default_device()
+    return model_registry.get_model(modelId, lambda: whisper.load_model(modelId, device=device), device=device)
 
 """
 Will be converting to stable-whisper library for simplicity and consolidation of features.
@@ -77,8 +83,8 @@ Will be converting to stable-whisper library for simplicity and consolidation of
         A dictionary containing the resulting text ("text") and segment-level details ("segments"), and
     the spoken language ("language"), which is detected when `decode_options["language"]` is None.
     '''
-def transcribe_audio(input_audio_file):
-
+def transcription_options():
+    """The decoding options passed to model.transcribe (also part of the result cache key)."""
     options = {
     "verbose": True,
     
@@ -184,11 +190,38 @@ def transcribe_audio(input_audio_file):
     # Default: None
     #"hallucination_silence_threshold": 1
 }
+    return options
 
 
+def transcribe_audio(input_audio_file, options=None):
+    if options is None:
+        options = transcription_options()
+
     try:
+        vad_report = None
+        if vad.enabled() and isinstance(input_audio_file, audio_artifact.AudioArtifact):
+            # Only decode the speech regions; timestamps in the result stay relative to the whole file
+            intervals = vad.detect(input_audio_file)
+            speech_seconds = sum(end - start for start, end in intervals)
+            vad_report = {
+                "speech_seconds": round(speech_seconds, 3),
+                "skipped_seconds": round(max(0.0, input_audio_file.duration - speech_seconds), 3),
+                "skip_ratio": round(vad.skip_ratio(intervals, input_audio_file.duration), 4),
+                "regions": len(intervals),
+            }
+            logging.info(f"VAD: {input_audio_file.source}: {vad_report['regions']} speech regions, "
+                         f"{vad_report['speech_seconds']:.1f}s of {input_audio_file.duration:.1f}s, "
+                         f"skipping {vad_report['skip_ratio']:.0%}")
+            if not intervals:
+                return {"text": "", "segments": [], "language": options.get("language"), "vad": vad_report}
+            options = dict(options, clip_timestamps=vad.clip_timestamps(intervals))
+
         # Transcribe the audio
-        result = model.transcribe(input_audio_file, **options)
+        model = get_model()
+        # An AudioArtifact is passed as a zero-copy tensor, a path is decoded by whisper itself
+        result = model.transcribe(audio_artifact.as_model_input(input_audio_file), **options)
+        if vad_report is not None:
+            result["vad"] = vad_report
         return result
     except Exception as e:
         logging.error(f"Error in transcription: {e}")
@@ -204,11 +237,12 @@ def transcribe_audio_v2_basic(input_audio_file):
     decode_options = dict(language="Swedish", verbose=True, best_of=best_of, beam_size=beam_size, temperature=temperature)
     transcribe_options = dict(task="transcribe", **decode_options)
 
-    result = model.transcribe(input_audio_file, **transcribe_options)
+    result = get_model().transcribe(input_audio_file, **transcribe_options)
     return result
 def decode_audio(input_audio_file):
     try:
-        model = whisper.load_model(model_size)
+        import whisper
+        model = get_model()
 
         # load audio and pad/trim it to fit 30 seconds
         audio = whisper.load_audio("input_audio_file")
@@ -1,6 +1,7 @@
 import logging
 import configparser
-import stable_whisper
+import model_registry
+import audio_artifact
 
 #https://github.com/jianfch/stable-ts?tab=readme-ov-file#transcribe
 
@@ -8,14 +9,27 @@ import stable_whisper
 config = configparser.ConfigParser()
 config.read('config.ini')
 
-# Load the Whisper model based on configuration
-modelId = config.get('Whisper', 'ModelID')
-model =  stable_whisper.load_model(modelId)
 
+def get_model():
+    """Load the stable-ts Whisper model based on configuration, on first use."""
+    import stable_whisper
+    modelId = config.get('Whisper', 'ModelID')
+    device = model_registry.default_device()
+    # Keyed separately from the plain whisper model: stable-ts patches the model's transcribe methods
+    return model_registry.get_model(f"stable-ts:{modelId}", lambda: stable_whisper.load_model(modelId, device=device), device=device)
 
-def transcribe_audio(input_audio):
+
+def transcription_options():
+    """The options passed to model.transcribe (also part of the result cache key)."""
+    return {"verbose": True, "word_timestamps": True, "vad": True}
+
+
+def transcribe_audio(input_audio, options=None):
+    if options is None:
+        options = transcription_options()
     try:
-        result = model.transcribe(input_audio, verbose=True, word_timestamps=True, vad=True)
+        model = get_model()
+        result = model.transcribe(audio_artifact.as_model_input(input_audio), **options)
     except Exception as e:
         logging.error(f"StableTS Error in transcribing audio: {e}")
         return None
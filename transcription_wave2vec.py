@@ -1,28 +1,42 @@
 # path/filename: transcribe_swedish.py
 import sys
-import torch
-import torchaudio
-from datasets import load_dataset
-from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
+import model_registry
+import audio_artifact
+
+MODEL_ID = "KBLab/wav2vec2-large-voxrex-swedish"
+
+
+def load_model():
+    """Load the wav2vec2 processor and model once per process via the shared model registry."""
+    from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
+    return model_registry.get_model(
+        MODEL_ID,
+        lambda: (Wav2Vec2Processor.from_pretrained(MODEL_ID), Wav2Vec2ForCTC.from_pretrained(MODEL_ID))
+    )
 
 def transcribe_swedish(audio_file_path):
     """
     Transcribe Swedish audio file to text using Wav2Vec 2.0 model.
     
     Args:
-        audio_file_path (str): Path to the audio file to transcribe.
+        audio_file_path (str or AudioArtifact): Path to the audio file to transcribe, or already decoded 16 kHz audio.
         
     Returns:
         str: The transcription of the audio file.
     """
+    import torch
+    import torchaudio
+
     # Initialize processor and model
-    processor = Wav2Vec2Processor.from_pretrained("KBLab/wav2vec2-large-voxrex-swedish")
-    model = Wav2Vec2ForCTC.from_pretrained("KBLab/wav2vec2-large-voxrex-swedish")
-    resampler = torchaudio.transforms.Resample(orig_freq=48_000, new_freq=16_000)
-    
-    # Load and preprocess the audio file
-    speech_array, sampling_rate = torchaudio.load(audio_file_path)
-    speech_array = resampler(speech_array).squeeze().numpy()
+    processor, model = load_model()
+    if isinstance(audio_file_path, audio_artifact.AudioArtifact):
+        speech_array = audio_file_path.samples
+    else:
+        resampler = torchaudio.transforms.Resample(orig_freq=48_000, new_freq=16_000)
+
+        # Load and preprocess the audio file
+        speech_array, sampling_rate = torchaudio.load(audio_file_path)
+        speech_array = resampler(speech_array).squeeze().numpy()
     
     # Prepare the audio file for the model
     inputs = processor(speech_array, sampling_rate=16_000, return_tensors="pt", padding=True)
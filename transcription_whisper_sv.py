@@ -1,44 +1,73 @@
 # path/filename: modified_code_with_config_parser.py
 import configparser
-import torch
-from transformers import pipeline, WhisperProcessor
 import pprint
-import soundfile as sf
+import model_registry
+import audio_artifact
 
 # Load configurations
 config = configparser.ConfigParser()
 config.read('config.ini')
 
-def transcribe_audio(input_audio_file):
-    # Load device and model configurations
-    try:
-        hardware_config = config.get('CPU_GPU', 'Hardware', fallback='CPU').upper()
-        device = "cuda" if hardware_config == 'GPU' and torch.cuda.is_available() else "cpu"
-        model_id = config.get('Whisper', 'ModelID', fallback='openai/whisper-large-v3')
-    except Exception as e:
-        print(f"Error in loading device and model configurations: {e}")
-        return None
+def inference_settings():
+    """Chunked batched long-form inference: 30 s windows decoded [WhisperHF] BatchSize at a time."""
+    return {
+        "chunk_length_s": config.getfloat('WhisperHF', 'ChunkLengthSeconds', fallback=30.0),
+        "batch_size": config.getint('WhisperHF', 'BatchSize', fallback=8),
+    }
 
-    # Initialize the Whisper model and processor
-    try:
+def get_pipeline(model_id, device):
+    # Chunking and batch size are call-time arguments, so one pipeline per (model, device) serves every setting
+    def load_pipeline():
+        from transformers import pipeline, WhisperProcessor
         processor = WhisperProcessor.from_pretrained(model_id)
-    except Exception as e:
-        print(f"Error in initializing the Whisper Processor: {e}")
-        return None
-
-    print("setting pipe")
-    try:
-        pipe = pipeline(
+        print("setting pipe")
+        return pipeline(
             "automatic-speech-recognition",
             model=model_id,
             tokenizer=processor.tokenizer,
             feature_extractor=processor.feature_extractor,
             max_new_tokens=128,
-            #chunk_length_s=30,
-            #batch_size=16,
-            return_timestamps=True, #
             device=device,
         )
+
+    # Namespaced: transcription.get_model registers the openai-whisper model under the same ModelID
+    return model_registry.get_model(f"hf-pipeline:{model_id}", load_pipeline, device=device)
+
+def chunks_to_segments(chunks, duration=None):
+    """
+    Convert the pipeline's timestamped chunks to the {"start", "end", "text"} segments that
+    main.map_speakers_to_transcription consumes. The final chunk can come back without an end time;
+    it is closed at the end of the audio.
+    """
+    segments = []
+    for chunk in chunks:
+        start, end = chunk["timestamp"]
+        if start is None:
+            start = segments[-1]["end"] if segments else 0.0
+        if end is None:
+            end = duration if duration is not None else start
+        segments.append({"start": float(start), "end": float(max(end, start)), "text": chunk["text"]})
+    return segments
+
+def transcribe_audio(input_audio_file, batch_size=None):
+    """
+    Transcribe with the Hugging Face pipeline. Returns {"text", "segments"} in the same shape as the
+    openai-whisper backend (segments are start/end/text dicts), or None on failure.
+    """
+    # Load device and model configurations
+    try:
+        device = model_registry.default_device(fallback='CPU')
+        model_id = config.get('Whisper', 'ModelID', fallback='openai/whisper-large-v3')
+        settings = inference_settings()
+        if batch_size is not None:
+            settings["batch_size"] = batch_size
+    except Exception as e:
+        print(f"Error in loading device and model configurations: {e}")
+        return None
+
+    # The Whisper processor and pipeline are built once per (model, device) and reused across calls
+    try:
+        pipe = get_pipeline(model_id, device)
     except Exception as e:
         print(f"Error in initializing the Whisper Pipeline: {e}")
         return None
@@ -46,13 +75,20 @@ def transcribe_audio(input_audio_file):
     # Load the input audio file and transcribe
     try:    
         print("loading audio")
-        audio_array, sampling_rate = sf.read(input_audio_file)
+        if isinstance(input_audio_file, audio_artifact.AudioArtifact):
+            audio_input = input_audio_file.as_hf_input()
+        else:
+            import soundfile as sf
+            audio_array, sampling_rate = sf.read(input_audio_file, dtype='float32')
+            audio_input = {"raw": audio_array, "sampling_rate": sampling_rate}
+        duration = len(audio_input["raw"]) / audio_input["sampling_rate"]
     except Exception as e:
         print(f"Error in loading audio: {e}")
         return None
     try:
         print("transcribing")
-        result = pipe(audio_array)
+        # The pipeline may modify the input dict, pass a copy
+        result = pipe(dict(audio_input), return_timestamps=True, **settings)
     except Exception as e:
         print(f"Error in transcribing: {e}")
         return None
@@ -63,5 +99,4 @@ def transcribe_audio(input_audio_file):
         print(f"Error in printing: {e}")
         return None
 
-    return result["text"]
-    
+    return {"text": result["text"], "segments": chunks_to_segments(result.get("chunks", []), duration)}
@@ -26,4 +26,56 @@ def format_time(seconds):
 
 def format_time_simple(seconds):
     """Convert seconds to a simpler HH:MM:SS time format."""
-    return f"{int(seconds // 3600):02}:{int(seconds % 3600 // 60):02}:{int(seconds % 60):02}"
\ No newline at end of file
+    return f"{int(seconds // 3600):02}:{int(seconds % 3600 // 60):02}:{int(seconds % 60):02}"
+
+def file_fingerprint(file_path, sample_size=1024 * 1024, samples=8):
+    """
+    Fast content hash of a (possibly multi-GB) file: BLAKE2b over the file size and `samples`
+    evenly spaced blocks of `sample_size` bytes. Small files are hashed in full.
+    Identical files get the same fingerprint regardless of name or location.
+    """
+    import hashlib
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=20)
+    with open(file_path, 'rb') as f:
+        if size <= sample_size * samples:
+            for block in iter(lambda: f.read(sample_size), b''):
+                digest.update(block)
+        else:
+            step = (size - sample_size) // (samples - 1)
+            for i in range(samples):
+                f.seek(i * step)
+                digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def evict_least_recently_used(directory, max_bytes, suffix='', keep=None):
+    """
+    Delete the least recently used files (oldest mtime first) under `directory` until their total size
+    is at most `max_bytes`. Only files ending in `suffix` are considered; `keep` is never deleted.
+    Returns the remaining total size in bytes.
+    """
+    entries = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(suffix):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            logging.info(f"Evicted {path}")
+        except OSError:
+            pass
+    return total
@@ -0,0 +1,116 @@
+"""
+Fast energy-based voice activity detection, used to skip silence before Whisper decodes.
+
+Frame energies are computed block by block (so a memory-mapped artifact is only streamed through
+once) in 30 ms frames. A frame counts as speech when it is louder than the recording's noise floor
+(a low percentile of the frame levels) plus [VAD] MarginDB, capped a fixed distance below the loud
+frames so a recording that is speech throughout is not cut up. The speech frames are padded by
+[VAD] PadSeconds, gaps shorter than [VAD] MinGapSeconds are merged and blips shorter than
+[VAD] MinSpeechSeconds are dropped.
+
+The resulting intervals are passed to Whisper as clip_timestamps, so decoding work follows the
+amount of speech rather than the length of the file, and Whisper never sees the long pauses it
+likes to hallucinate into.
+"""
+import configparser
+
+import numpy as np
+
+# Load configurations
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+
+def enabled():
+    return config.getboolean('VAD', 'Enabled', fallback=True)
+
+
+def settings():
+    """VAD parameters, or None when VAD is off (part of the transcription cache key)."""
+    if not enabled():
+        return None
+    return {
+        "frame_ms": config.getfloat('VAD', 'FrameMs', fallback=30.0),
+        "margin_db": config.getfloat('VAD', 'MarginDB', fallback=12.0),
+        "pad_seconds": config.getfloat('VAD', 'PadSeconds', fallback=0.3),
+        "min_gap_seconds": config.getfloat('VAD', 'MinGapSeconds', fallback=1.0),
+        "min_speech_seconds": config.getfloat('VAD', 'MinSpeechSeconds', fallback=0.25),
+    }
+
+
+def frame_levels(samples, sample_rate, frame_ms=30.0, block_seconds=60):
+    """RMS level in dBFS of consecutive non-overlapping frames (the last partial frame is dropped)."""
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    block_len = max(1, int(block_seconds * sample_rate) // frame_len) * frame_len
+    levels = []
+    for start in range(0, len(samples) - frame_len + 1, block_len):
+        block = np.asarray(samples[start:start + block_len], dtype=np.float32)
+        n_frames = len(block) // frame_len
+        frames = block[:n_frames * frame_len].reshape(n_frames, frame_len)
+        power = np.einsum('ij,ij->i', frames, frames) / frame_len
+        levels.append(10 * np.log10(power + 1e-12))
+    return np.concatenate(levels) if levels else np.empty(0)
+
+
+def speech_intervals(samples, sample_rate, frame_ms=30.0, margin_db=12.0, pad_seconds=0.3,
+                     min_gap_seconds=1.0, min_speech_seconds=0.25):
+    """Sorted, non-overlapping (start, end) speech intervals in seconds."""
+    levels = frame_levels(samples, sample_rate, frame_ms)
+    if len(levels) == 0:
+        return []
+    noise_floor = max(np.percentile(levels, 10), -70.0)
+    loud = np.percentile(levels, 95)
+    threshold = min(noise_floor + margin_db, loud - 25.0)
+    speech = levels > threshold
+
+    # Runs of speech frames: rising and falling edges of the boolean mask
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    frame_seconds = frame_ms / 1000
+    starts = np.flatnonzero(edges == 1) * frame_seconds - pad_seconds
+    ends = np.flatnonzero(edges == -1) * frame_seconds + pad_seconds
+    duration = len(samples) / sample_rate
+
+    intervals = []
+    for start, end in zip(np.maximum(starts, 0.0), np.minimum(ends, duration)):
+        if intervals and start - intervals[-1][1] < min_gap_seconds:
+            intervals[-1][1] = max(intervals[-1][1], end)
+        else:
+            intervals.append([start, end])
+    return [(round(float(start), 3), round(float(end), 3)) for start, end in intervals
+            if end - start >= min_speech_seconds]
+
+
+def clip_timestamps(intervals):
+    """Whisper's clip_timestamps format: a flat [start, end, start, end, ...] list in seconds."""
+    return [t for interval in intervals for t in interval]
+
+
+def skip_ratio(intervals, duration):
+    """Fraction of the audio that is not decoded."""
+    if duration <= 0:
+        return 0.0
+    speech = sum(end - start for start, end in intervals)
+    return max(0.0, 1.0 - speech / duration)
+
+
+def merge_reports(reports):
+    """
+    One "vad" report from the reports of the parts a file was decoded in (shards, checkpoint windows):
+    speech, skipped seconds and regions summed. None if no part had a report.
+    """
+    reports = [report for report in reports if report]
+    if not reports:
+        return None
+    speech = sum(report["speech_seconds"] for report in reports)
+    skipped = sum(report.get("skipped_seconds", 0.0) for report in reports)
+    return {
+        "speech_seconds": round(speech, 3),
+        "skipped_seconds": round(skipped, 3),
+        "skip_ratio": round(skipped / (speech + skipped), 4) if speech + skipped > 0 else 0.0,
+        "regions": sum(report["regions"] for report in reports),
+    }
+
+
+def detect(audio):
+    """Speech intervals of an AudioArtifact with the [VAD] settings."""
+    return speech_intervals(audio.samples, audio.sample_rate, **settings())